@@ -0,0 +1,55 @@
+import json
+import os
+
+# Map prediction categories to the index's affordance tags (plural form)
+CATEGORY_TO_INDEX_TAG = {
+    "Character": "Characters",
+    "Characters": "Characters",
+    "Interactive Object": "Interactive Object",
+    "Item / Collectible": "Items and Collectibles",
+    "Items and Collectibles": "Items and Collectibles",
+    "Environmental Object": "Environmental Object",
+    "Terrain": "Terrain",
+    "Effect / Ambient / Unknown": "Effect / Ambient / Unknown",
+}
+
+
+def _norm(s: str) -> str:
+    return (s or "").strip()
+
+
+def is_probable_character(name):
+    """Capitalized one- or two-word node names are searched among "Characters" tiles only."""
+    return name and name[0].isupper() and "_" not in name and len(name.split()) <= 2
+
+
+def load_expected_affordances(pred_file, use_per_scene=True, min_conf=0.0):
+    """object name -> sorted index affordance tags, from _object_affordance_langchain.json.
+
+    Used by both the v3 matcher and Generation_3_weight_sweep.py.
+    """
+    if not pred_file or not os.path.exists(pred_file):
+        return {}
+    with open(pred_file, "r", encoding="utf-8") as f:
+        pred = json.load(f)
+
+    expected = {}
+
+    def _add(obj_name, category, conf):
+        if obj_name is None or category is None:
+            return
+        if conf is not None and conf < min_conf:
+            return
+        key = _norm(obj_name)
+        tag = CATEGORY_TO_INDEX_TAG.get(_norm(category), _norm(category))
+        if key and tag:
+            expected.setdefault(key, set()).add(tag)
+
+    if use_per_scene:
+        for scene in pred.get("per_scene_affordances", []):
+            for obj in scene.get("objects", []):
+                _add(obj.get("object"), obj.get("category"), obj.get("confidence", 1.0))
+    else:
+        for obj_name, rec in (pred.get("global_object_affordances", {}) or {}).items():
+            _add(rec.get("object") or obj_name, rec.get("category"), rec.get("confidence", 1.0))
+    return {k: sorted(v) for k, v in expected.items()}
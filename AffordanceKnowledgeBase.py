@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from SceneAffordanceClassifier import normalize_object as canonical_name
+
+# Cross-story store of LLM affordance classifications, keyed by canonical
+# object name (whitespace-collapsed, case-folded). Story_2 looks objects up
+# here before building its prompts and only sends unknown or low-confidence
+# objects to the model; new answers are written back with their provenance.
+#
+#   python AffordanceKnowledgeBase.py                 # summary of the store
+#   python AffordanceKnowledgeBase.py "treasure chest"
+
+# === CONFIGURABLE ===
+KB_PATH = "Data/affordance_kb.sqlite"
+MIN_CONFIDENCE = 0.7       # entries below this are re-asked (and replaced if the new answer is better)
+
+RECORD_FIELDS = ("affordance_level", "category", "suggested_terrain", "confidence")
+
+
+def _confidence(value):
+    """Model-reported confidence as a float; anything non-numeric ("high", NaN) counts as 0.0 and is re-asked."""
+    try:
+        conf = float(value or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+    return conf if conf == conf and abs(conf) != float("inf") else 0.0
+
+
+def _affordance_level(value):
+    """Integer level, or None when the answer has none ("2" and 2.0 are accepted)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value.strip())
+    return None
+
+
+class AffordanceKnowledgeBase:
+    def __init__(self, path=KB_PATH, min_confidence=MIN_CONFIDENCE):
+        self.path = path
+        self.min_confidence = min_confidence
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS affordances ("
+                " canonical TEXT PRIMARY KEY, object TEXT, affordance_level INTEGER, category TEXT,"
+                " suggested_terrain TEXT, confidence REAL, provenance TEXT, updated REAL, uses INTEGER DEFAULT 0)"
+            )
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "low_confidence": 0, "written": 0, "skipped": 0}
+
+    def _row(self, canonical):
+        row = self._conn.execute(
+            "SELECT object, affordance_level, category, suggested_terrain, confidence, provenance"
+            " FROM affordances WHERE canonical = ?", (canonical,)).fetchone()
+        if row is None:
+            return None
+        obj, level, category, terrain, conf, prov = row
+        return {"object": obj, "affordance_level": level, "category": category, "suggested_terrain": terrain,
+                "confidence": conf, "provenance": json.loads(prov) if prov else None}
+
+    def get(self, name):
+        with self._lock:
+            return self._row(canonical_name(name))
+
+    def lookup(self, names):
+        """Split names into ({name: record} usable from the store, [names to classify])."""
+        known, unknown = {}, []
+        with self._lock, self._conn:
+            for name in names:
+                self.stats["lookups"] += 1
+                canonical = canonical_name(name)
+                rec = self._row(canonical)
+                if rec is None:
+                    self.stats["misses"] += 1
+                    unknown.append(name)
+                elif (rec["confidence"] or 0.0) < self.min_confidence:
+                    self.stats["low_confidence"] += 1
+                    unknown.append(name)
+                else:
+                    self.stats["hits"] += 1
+                    self._conn.execute("UPDATE affordances SET uses = uses + 1 WHERE canonical = ?", (canonical,))
+                    known[name] = {"object": name, **{k: rec[k] for k in RECORD_FIELDS}}
+        return known, unknown
+
+    def add(self, records, provenance):
+        """Store LLM answers; an existing entry is only replaced by one at least as confident."""
+        with self._lock, self._conn:
+            for rec in records:
+                if not isinstance(rec, dict) or not rec.get("object") or not rec.get("category"):
+                    continue
+                level = _affordance_level(rec.get("affordance_level"))
+                if level is None:
+                    self.stats["skipped"] += 1
+                    continue
+                canonical = canonical_name(rec["object"])
+                conf = _confidence(rec.get("confidence"))
+                old = self._row(canonical)
+                if old is not None and (old["confidence"] or 0.0) > conf:
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO affordances (canonical, object, affordance_level, category,"
+                    " suggested_terrain, confidence, provenance, updated, uses)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT uses FROM affordances WHERE canonical = ?), 0))",
+                    (canonical, rec["object"], level, rec.get("category"),
+                     rec.get("suggested_terrain"), conf, json.dumps(provenance), time.time(), canonical),
+                )
+                self.stats["written"] += 1
+
+    def summary(self):
+        lookups = self.stats["lookups"]
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM affordances").fetchone()[0]
+        return {**self.stats, "hit_rate": (self.stats["hits"] / lookups) if lookups else None,
+                "entries": entries, "min_confidence": self.min_confidence, "path": self.path}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the cross-story affordance knowledge base.")
+    parser.add_argument("objects", nargs="*")
+    parser.add_argument("--kb", default=KB_PATH)
+    args = parser.parse_args()
+
+    kb = AffordanceKnowledgeBase(args.kb)
+    for name in args.objects:
+        print(f"{name}: {kb.get(name)}")
+    if not args.objects:
+        rows = kb._conn.execute("SELECT category, COUNT(*) FROM affordances GROUP BY category").fetchall()
+        print(f"[info] {kb.summary()['entries']} objects in {args.kb}")
+        for category, count in rows:
+            print(f"  {category}: {count}")
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from ObjectEmbeddingIndex import load_index, QUANT_MODES
+from QueryEmbeddingCache import QueryEmbeddingCache, get_sentence_model
+from Generation_3_run_all_stories import discover_stories
+from AffordanceExpectations import is_probable_character
+
+# Compares the quantized ranking modes (int8 / float16) of the object
+# embedding index with the float32 path on the story KG nodes: memory of the
+# scanned matrix, load and query time, and top-1 / top-3 agreement of the
+# final (exactly re-scored) candidates.
+#
+#   python Benchmark_quantized_index.py                 # every story
+#   python Benchmark_quantized_index.py --stories 3 10
+
+# === CONFIGURABLE ===
+EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_CACHE_DIR = "Data/embedding_cache"
+WEIGHTS = {"name": 0.5, "group": 0.3, "super": 0.1, "afford": 0.1}
+TOP_K = 3
+OUTPUT_FILE = "StoryFiles/quantized_index_report.json"
+
+
+def story_nodes(story_id):
+    with open(f"StoryFiles/output_KG_story_{story_id}/{story_id}_kg_data.json", "r", encoding="utf-8") as f:
+        story = json.load(f)
+    return list(dict.fromkeys(n for data in story["scene_kgs"].values() for n in data["nodes"]))
+
+
+def timed_query(index, vecs, restrict):
+    t0 = time.perf_counter()
+    results = index.query_batch(vecs, TOP_K, WEIGHTS, restrict_to_character=restrict)
+    return results, time.perf_counter() - t0
+
+
+def agreement(reference, results):
+    top1 = top3_exact = 0
+    overlap = []
+    for ref, res in zip(reference, results):
+        ref_paths = [c["image_path"] for c in ref]
+        res_paths = [c["image_path"] for c in res]
+        top1 += bool(ref_paths) and res_paths[:1] == ref_paths[:1]
+        top3_exact += res_paths == ref_paths
+        if ref_paths:
+            overlap.append(len(set(ref_paths) & set(res_paths)) / len(ref_paths))
+    n = max(1, len(reference))
+    return {
+        "top1_agreement": top1 / n,
+        f"top{TOP_K}_exact_agreement": top3_exact / n,
+        f"top{TOP_K}_overlap": float(np.mean(overlap)) if overlap else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantized vs float32 index: memory and agreement report.")
+    parser.add_argument("--stories", nargs="*", help="story ids (default: every *_kg_data.json found)")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    stories = args.stories or discover_stories()
+    names_by_story = {sid: story_nodes(sid) for sid in stories}
+    all_names = list(dict.fromkeys(n for names in names_by_story.values() for n in names))
+    cache = QueryEmbeddingCache(MODEL_NAME, cache_dir=EMBED_CACHE_DIR) if EMBED_CACHE_DIR else None
+    if cache is not None:
+        all_vecs = cache.encode(lambda: get_sentence_model(MODEL_NAME), all_names)
+        cache.save()
+    else:
+        all_vecs = get_sentence_model(MODEL_NAME).encode(all_names, show_progress_bar=False)
+    vec_by_name = dict(zip(all_names, all_vecs))
+
+    report = {"weights": WEIGHTS, "top_k": TOP_K, "modes": {}, "stories": {}}
+    indexes = {}
+    for mode in (None,) + QUANT_MODES:
+        t0 = time.perf_counter()
+        indexes[mode] = load_index(EMBED_INDEX, EMBED_INDEX_NPY, quantize=mode)
+        report["modes"][mode or "float32"] = {
+            "load_s": time.perf_counter() - t0,
+            "ranking_matrix_bytes": int(indexes[mode].stacked.nbytes),
+        }
+    base_bytes = report["modes"]["float32"]["ranking_matrix_bytes"]
+    for stats in report["modes"].values():
+        stats["memory_saved_pct"] = 100.0 * (1 - stats["ranking_matrix_bytes"] / base_bytes) if base_bytes else 0.0
+
+    totals = {mode or "float32": {"seconds": 0.0, "nodes": 0, "top1": 0.0, "topk": 0.0} for mode in indexes}
+    for sid, names in names_by_story.items():
+        if not names:
+            continue
+        vecs = np.asarray([vec_by_name[n] for n in names])
+        restrict = [bool(is_probable_character(n)) for n in names]
+        reference, ref_s = timed_query(indexes[None], vecs, restrict)
+        row = {"num_nodes": len(names), "float32": {"query_s": ref_s}}
+        totals["float32"]["seconds"] += ref_s
+        totals["float32"]["nodes"] += len(names)
+        for mode in QUANT_MODES:
+            results, secs = timed_query(indexes[mode], vecs, restrict)
+            row[mode] = {"query_s": secs, **agreement(reference, results)}
+            totals[mode]["seconds"] += secs
+            totals[mode]["nodes"] += len(names)
+            totals[mode]["top1"] += row[mode]["top1_agreement"] * len(names)
+            totals[mode]["topk"] += row[mode][f"top{TOP_K}_exact_agreement"] * len(names)
+        report["stories"][sid] = row
+
+    print(f"{'mode':>8} | {'MiB':>8} | {'saved':>6} | {'ms/node':>8} | {'top-1':>6} | {f'top-{TOP_K}':>6}")
+    for mode, stats in report["modes"].items():
+        t = totals[mode]
+        stats["ms_per_node"] = 1000.0 * t["seconds"] / t["nodes"] if t["nodes"] else None
+        if mode != "float32":
+            stats["top1_agreement"] = t["top1"] / t["nodes"] if t["nodes"] else None
+            stats[f"top{TOP_K}_exact_agreement"] = t["topk"] / t["nodes"] if t["nodes"] else None
+        print(f"{mode:>8} | {stats['ranking_matrix_bytes'] / 2**20:8.1f} | {stats['memory_saved_pct']:5.1f}% | "
+              f"{(stats['ms_per_node'] or 0):8.3f} | {stats.get('top1_agreement', 1.0) or 0:6.3f} | "
+              f"{stats.get(f'top{TOP_K}_exact_agreement', 1.0) or 0:6.3f}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[✓] Saved quantization report to {args.output}")
@@ -0,0 +1,145 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Measures interpreter start-up and import cost of the pipeline scripts,
+# using CPython's `-X importtime` trace (self / cumulative microseconds per module).
+#
+#   python Benchmark_startup_importtime.py                 # top-level imports of each target script
+#   python Benchmark_startup_importtime.py --run Scene_1_CA_Terrian_Visualizer_WEnv.py --no-plot
+#                                                          # full run of one script, wall time + import breakdown
+
+# === CONFIGURABLE ===
+TARGET_SCRIPTS = [
+    "Generation_3_parse_story_mapping_with_eval_v3.py",
+    "Scene_1_CA_Terrian_Visualizer_WEnv.py",
+    "Story_11_ConstructSceneKG_combined_timeline_patch.py",
+    "Story_2_TerrianAnalysis.py",
+]
+OUTPUT_FILE = "StoryFiles/startup_importtime_report.json"
+TOP_N = 12
+
+
+def top_level_imports(script_path):
+    """Modules imported by the script's module body (not inside functions)."""
+    with open(script_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script_path)
+
+    modules = []
+
+    def visit(stmts):
+        for node in stmts:
+            if isinstance(node, ast.Import):
+                modules.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                modules.append(node.module)
+            elif isinstance(node, ast.Try):
+                visit(node.body)
+            elif isinstance(node, ast.If):
+                visit(node.body)
+                visit(node.orelse)
+
+    visit(tree.body)
+    return list(dict.fromkeys(modules))
+
+
+def parse_importtime(stderr_text):
+    """-X importtime lines -> list of {module, depth, self_ms, cumulative_ms}."""
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        padded = parts[2][1:]
+        name = padded.lstrip()
+        rows.append({
+            "module": name,
+            "depth": (len(padded) - len(name)) // 2,
+            "self_ms": int(parts[0]) / 1000.0,
+            "cumulative_ms": int(parts[1]) / 1000.0,
+        })
+    return rows
+
+
+def summarize(rows, wall_ms, failed=None):
+    top = [r for r in rows if r["depth"] == 0]
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": sum(r["cumulative_ms"] for r in top),
+        "num_modules": len(rows),
+        "top_cumulative": sorted(top, key=lambda r: -r["cumulative_ms"])[:TOP_N],
+        "top_self": sorted(rows, key=lambda r: -r["self_ms"])[:TOP_N],
+        "failed_imports": failed or [],
+    }
+
+
+def bench_imports(script_path):
+    modules = top_level_imports(script_path)
+    code = (
+        "import sys\n"
+        f"for m in {modules!r}:\n"
+        "    try:\n"
+        "        __import__(m)\n"
+        "    except Exception as e:\n"
+        "        print('FAILED', m, type(e).__name__, file=sys.stderr)\n"
+    )
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(script_path)))
+    wall_ms = 1000.0 * (time.perf_counter() - t0)
+    failed = [line.split()[1] for line in proc.stderr.splitlines() if line.startswith("FAILED ")]
+    report = summarize(parse_importtime(proc.stderr), wall_ms, failed)
+    report["script"] = script_path
+    report["modules"] = modules
+    return report
+
+
+def bench_run(script_path, script_args):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", script_path] + script_args,
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(script_path)))
+    wall_ms = 1000.0 * (time.perf_counter() - t0)
+    report = summarize(parse_importtime(proc.stderr), wall_ms)
+    report["script"] = script_path
+    report["args"] = script_args
+    report["returncode"] = proc.returncode
+    return report
+
+
+def print_report(report):
+    print(f"\n=== {report['script']} ===")
+    print(f"wall {report['wall_ms']:.0f} ms | imports {report['import_ms']:.0f} ms "
+          f"| {report['num_modules']} modules")
+    if report.get("returncode"):
+        print(f"[warn] script exited with code {report['returncode']}")
+    if report["failed_imports"]:
+        print(f"[warn] not importable here: {', '.join(report['failed_imports'])}")
+    print(" cumulative ms | module")
+    for r in report["top_cumulative"]:
+        print(f" {r['cumulative_ms']:13.1f} | {r['module']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time / start-up benchmark for the pipeline scripts.")
+    parser.add_argument("--run", metavar="SCRIPT", help="run SCRIPT end to end instead of only its imports")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args, script_args = parser.parse_known_args()
+
+    if args.run:
+        reports = [bench_run(args.run, script_args)]
+    else:
+        reports = [bench_imports(path) for path in TARGET_SCRIPTS if os.path.exists(path)]
+
+    for report in reports:
+        print_report(report)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(reports, f, indent=2)
+    print(f"\n[✓] Saved import-time report to {args.output}")
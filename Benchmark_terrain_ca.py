@@ -0,0 +1,88 @@
+import argparse
+import json
+import time
+import numpy as np
+import TerrainCA
+
+# Per-cell Python smooth_map loop (the original Scene_1 implementation) vs the
+# vectorized TerrainCA engine: time per map and a bit-exact check of the
+# results. The loop is only run in full where it finishes in reasonable time;
+# for larger maps its time is extrapolated from one iteration on a crop.
+#
+#   python Benchmark_terrain_ca.py
+#   python Benchmark_terrain_ca.py --sizes 30x20 512x512 4096x4096 --iterations 4
+
+# === CONFIGURABLE ===
+SIZES = ["30x20", "512x512", "4096x4096"]
+ITERATIONS = 4
+FILL_PROB = 0.65
+SEED = 42
+LOOP_MAX_CELLS = 512 * 512     # larger maps: extrapolate the loop from a crop of this many cells
+OUTPUT_FILE = "StoryFiles/terrain_ca_benchmark.json"
+
+
+def smooth_map_loop(grid, tile_val, iterations, empty=0):
+    """The original per-cell implementation, kept as the reference."""
+    height, width = grid.shape
+    for _ in range(iterations):
+        new = grid.copy()
+        for y in range(height):
+            for x in range(width):
+                neighbors = grid[max(0, y - 1):min(height, y + 2), max(0, x - 1):min(width, x + 2)]
+                count = np.count_nonzero(neighbors == tile_val)
+                new[y, x] = tile_val if count >= 5 else empty
+        grid = new
+    return grid
+
+
+def best_of(fn, repeats):
+    best, result = None, None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        secs = time.perf_counter() - t0
+        best = secs if best is None else min(best, secs)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized CA smoothing against the per-cell loop.")
+    parser.add_argument("--sizes", nargs="*", default=SIZES, help="WIDTHxHEIGHT")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        width, height = map(int, size.lower().split("x"))
+        grid = np.where(np.random.default_rng(SEED).random((height, width)) < FILL_PROB, 1, 0)
+        repeats = 5 if width * height <= 512 * 512 else 1
+        engine_s, engine_out = best_of(lambda: TerrainCA.smooth_map(grid, 1, args.iterations), repeats)
+
+        if width * height <= LOOP_MAX_CELLS:
+            loop_s, loop_out = best_of(lambda: smooth_map_loop(grid, 1, args.iterations), 1 if repeats == 1 else 3)
+            exact, loop_note = bool(np.array_equal(loop_out, engine_out)), "measured"
+        else:
+            # one loop iteration on a crop, scaled by cell count and iterations
+            crop_h = max(1, LOOP_MAX_CELLS // width)
+            crop = grid[:crop_h]
+            crop_s, crop_out = best_of(lambda: smooth_map_loop(crop, 1, 1), 1)
+            loop_s = crop_s * (height / crop_h) * args.iterations
+            # exactness on the crop (away from the cut edge, where the full map has extra neighbors)
+            engine_crop = TerrainCA.smooth_map(grid, 1, 1)[:crop_h - 1]
+            exact, loop_note = bool(np.array_equal(crop_out[:crop_h - 1], engine_crop)), "extrapolated"
+
+        rows.append({"size": f"{width}x{height}", "cells": width * height, "iterations": args.iterations,
+                     "loop_s": loop_s, "loop_timing": loop_note, "engine_s": engine_s,
+                     "speedup": loop_s / engine_s if engine_s else None, "bit_exact": exact})
+
+    print(f"{'size':>10} | {'loop s':>10} | {'engine s':>9} | {'speedup':>9} | exact")
+    for r in rows:
+        loop = f"{r['loop_s']:.3f}" + ("*" if r["loop_timing"] == "extrapolated" else "")
+        print(f"{r['size']:>10} | {loop:>10} | {r['engine_s']:9.4f} | {r['speedup']:8.0f}x | {r['bit_exact']}")
+    if any(r["loop_timing"] == "extrapolated" for r in rows):
+        print("* extrapolated from one loop iteration on a crop")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"iterations": args.iterations, "fill_prob": FILL_PROB, "results": rows}, f, indent=2)
+    print(f"[✓] Saved CA benchmark to {args.output}")
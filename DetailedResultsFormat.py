@@ -0,0 +1,190 @@
+import gzip
+import json
+import os
+
+# Compact, versioned encoding of <story>_matched_objects_detailed.json.
+#
+# The legacy file is a dict object -> {flags..., "candidates": [rows]} where
+# every candidate row repeats the weights dict, its image_path and its
+# affordance list. The compact layout stores:
+#
+#   header      format / version / run config
+#   paths       tile table; candidates refer to it by integer id
+#   weights     distinct weights dicts; candidates refer by id
+#   affordances distinct affordance lists; candidates refer by id
+#   objects     one column per per-object field, in object order
+#   candidates  columnar arrays, object i owns rows offsets[i]:offsets[i+1]
+#
+# The file extension picks the encoding: .json, .json.gz, .msgpack or
+# .msgpack.gz (msgpack is optional). load_detailed() reads either layout and
+# returns the legacy dict shape.
+#
+#   python DetailedResultsFormat.py StoryFiles/10_matched_objects_detailed.json out.msgpack.gz
+
+FORMAT_NAME = "matched_objects_detailed/compact"
+FORMAT_VERSION = 1
+
+# candidate keys stored as table references instead of columns
+_REF_KEYS = {"image_path": "paths", "weights": "weights", "candidate_affordances": "affordances"}
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError("msgpack is not installed; use a .json / .json.gz output or `pip install msgpack`")
+    return msgpack
+
+
+class _Table:
+    """Value -> id interning for list/dict values (compared via their JSON form)."""
+
+    def __init__(self):
+        self.values = []
+        self._ids = {}
+
+    def id(self, value):
+        key = json.dumps(value, sort_keys=True)
+        if key not in self._ids:
+            self._ids[key] = len(self.values)
+            self.values.append(value)
+        return self._ids[key]
+
+
+def pack_detailed(matched_detailed, config=None):
+    """Legacy object -> record dict to the compact layout."""
+    tables = {name: _Table() for name in _REF_KEYS.values()}
+    names = list(matched_detailed.keys())
+
+    record_keys = list(dict.fromkeys(k for rec in matched_detailed.values() for k in rec))
+    obj_fields = [k for k in record_keys if k != "candidates"]
+    objects = {"name": names}
+    absent = {}
+    for field in obj_fields:
+        objects[field] = [rec.get(field) for rec in matched_detailed.values()]
+        missing = [i for i, rec in enumerate(matched_detailed.values()) if field not in rec]
+        if missing:
+            absent[field] = missing
+
+    cand_fields = list(dict.fromkeys(
+        k for rec in matched_detailed.values() for c in rec.get("candidates", []) for k in c
+    ))
+    candidates = {"offsets": [0]}
+    for field in cand_fields:
+        candidates[field] = []
+    for rec in matched_detailed.values():
+        for c in rec.get("candidates", []):
+            for field in cand_fields:
+                value = c.get(field)
+                if field in _REF_KEYS:
+                    value = tables[_REF_KEYS[field]].id(value)
+                candidates[field].append(value)
+        candidates["offsets"].append(len(candidates[cand_fields[0]]) if cand_fields else 0)
+
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "config": config or {},
+        "record_keys": record_keys,
+        "paths": tables["paths"].values,
+        "weights": tables["weights"].values,
+        "affordances": tables["affordances"].values,
+        "objects": objects,
+        "absent": absent,
+        "candidates": candidates,
+    }
+
+
+def unpack_detailed(data):
+    """Compact layout back to the legacy object -> record dict."""
+    if data.get("format") != FORMAT_NAME:
+        raise ValueError(f"Not a compact detailed-results file (format={data.get('format')!r})")
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported detailed-results version {data.get('version')}")
+
+    objects = data["objects"]
+    cands = data["candidates"]
+    offsets = cands["offsets"]
+    cand_fields = [k for k in cands if k != "offsets"]
+    obj_fields = [k for k in objects if k != "name"]
+    record_keys = data.get("record_keys") or obj_fields + ["candidates"]
+    absent = {field: set(rows) for field, rows in data.get("absent", {}).items()}
+
+    out = {}
+    for i, name in enumerate(objects["name"]):
+        rows = []
+        for r in range(offsets[i], offsets[i + 1]):
+            row = {}
+            for field in cand_fields:
+                value = cands[field][r]
+                if field in _REF_KEYS:
+                    value = data[_REF_KEYS[field]][value]
+                row[field] = value
+            rows.append(row)
+        # rebuild the record in the legacy key order
+        rec = {}
+        for field in record_keys:
+            if field == "candidates":
+                rec[field] = rows
+            elif i not in absent.get(field, ()):
+                rec[field] = objects[field][i]
+        out[name] = rec
+    return out
+
+
+# === File I/O ===
+def _encoding(path):
+    base = path[:-3] if path.endswith(".gz") else path
+    return ("msgpack" if base.endswith(".msgpack") else "json"), path.endswith(".gz")
+
+
+def write_detailed(path, matched_detailed, config=None):
+    """Write the compact layout, encoded according to the file extension."""
+    data = pack_detailed(matched_detailed, config)
+    kind, compressed = _encoding(path)
+    if kind == "msgpack":
+        payload = _msgpack().packb(data, use_bin_type=True)
+    else:
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if compressed:
+        payload = gzip.compress(payload, compresslevel=6, mtime=0)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+    return len(payload)
+
+
+def load_detailed(path):
+    """Read a legacy or compact detailed-results file as the legacy dict."""
+    with open(path, "rb") as f:
+        payload = f.read()
+    if payload[:2] == b"\x1f\x8b":
+        payload = gzip.decompress(payload)
+    if payload.lstrip()[:1] == b"{":
+        data = json.loads(payload.decode("utf-8"))
+    else:
+        data = _msgpack().unpackb(payload, raw=False)
+    if data.get("format") == FORMAT_NAME:
+        return unpack_detailed(data)
+    return data
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert matched_objects_detailed files between layouts.")
+    parser.add_argument("src", help="legacy or compact detailed-results file")
+    parser.add_argument("dst", help="output; .json/.json.gz/.msgpack/.msgpack.gz = compact, --legacy for the old layout")
+    parser.add_argument("--legacy", action="store_true", help="write the legacy indented JSON dict")
+    args = parser.parse_args()
+
+    detailed = load_detailed(args.src)
+    if args.legacy:
+        with open(args.dst, "w", encoding="utf-8") as fout:
+            json.dump(detailed, fout, indent=2)
+        size = os.path.getsize(args.dst)
+    else:
+        size = write_detailed(args.dst, detailed)
+    print(f"[✓] {len(detailed)} objects: {os.path.getsize(args.src)} -> {size} bytes ({args.dst})")
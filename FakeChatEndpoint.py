@@ -0,0 +1,343 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat-completions API, for testing and
+# load-benchmarking the LLM stages without network access. It answers the
+# Story_2 affordance prompt with a JSON array built from the "Objects:" list,
+# the Story_1 prompt with a random three-frame story (sometimes leaving a
+# relation unmapped) and the follow-up "Relations:" prompt with a mapping,
+# after a configurable latency, and can inject 429 responses to exercise
+# retries.
+#
+#   python FakeChatEndpoint.py                      # serve on http://127.0.0.1:8799/v1
+#   LLM_BASE_URL=http://127.0.0.1:8799/v1 python Story_2_TerrianAnalysis.py
+#   python FakeChatEndpoint.py --bench --scenes 30  # sequential vs concurrent classification
+#   python Story_1_generate_batch.py 100 119 --stub  # batch story generation against it
+
+# === CONFIGURABLE ===
+HOST = "127.0.0.1"
+PORT = 8799
+LATENCY_S = 0.5          # mean response time per request
+LATENCY_JITTER_S = 0.2
+FAILURE_RATE = 0.0       # fraction of requests answered with HTTP 429
+STREAM_FIRST_TOKEN_FRACTION = 0.1  # "stream": true -> first token after this share of the latency
+
+_CHARACTER_HINTS = ("knight", "wizard", "dragon", "guard", "villager", "king", "queen", "hero", "merchant")
+_ITEM_HINTS = ("key", "map", "coin", "sword", "potion", "scroll", "gem", "book", "amulet", "crystal")
+_TERRAIN_HINTS = ("grass", "sand", "water", "river", "ground", "floor", "path", "road", "lake", "snow")
+_ENV_HINTS = ("tree", "rock", "wall", "oak", "bush", "mountain", "cliff", "pillar", "statue", "canopy")
+
+_HEROES = ("Elara", "Kenji", "Iris", "Captain Jack", "Mira", "Tomas")
+_STORY_OBJECTS = ("ancient map", "hollow oak", "crystal cavern", "rickety bridge", "treasure chest", "dragon",
+                  "forest canopy", "glowing rune", "stone altar", "river", "old lantern", "iron gate")
+_STORY_RELATIONS = {"contains": "on top of", "stands near": "at the left of", "hovers above": "above",
+                    "hides beneath": "below", "rests on": "on top of", "faces": "at the right of",
+                    "guards": "on top of", "kneels beside": "at the right of", "leans against": "at the left of",
+                    "drifts over": "above", "sleeps under": "below", "climbs": "on top of"}
+
+
+def classify_object(name):
+    """Deterministic rule-of-thumb label, shaped like the Story_2 LLM output."""
+    low = name.lower()
+    if name[:1].isupper() and len(name.split()) <= 2 or any(h in low for h in _CHARACTER_HINTS):
+        level, category = 4, "Character"
+    elif any(h in low for h in _ITEM_HINTS):
+        level, category = 3, "Item / Collectible"
+    elif any(h in low for h in _TERRAIN_HINTS):
+        level, category = 0, "Terrain"
+    elif any(h in low for h in _ENV_HINTS):
+        level, category = 1, "Environmental Object"
+    else:
+        level, category = 2, "Interactive Object"
+    return {"object": name, "affordance_level": level, "category": category,
+            "suggested_terrain": "grass", "confidence": 0.8}
+
+
+def map_relation(relation):
+    low = relation.lower()
+    for word, category in (("above", "above"), ("over", "above"), ("under", "below"), ("beneath", "below"),
+                           ("on", "on top of")):
+        if word in low.split():
+            return category
+    return _STORY_RELATIONS.get(low, "at the right of")
+
+
+def fake_story(rng):
+    """Story_1-shaped response: <STORY>, three time frames, a relation mapping missing ~1 in 6 entries."""
+    hero = rng.choice(_HEROES)
+    lines = [f"<STORY>\n{hero} set out at dawn, found {rng.choice(_STORY_OBJECTS)} and faced the "
+             f"{rng.choice(_STORY_OBJECTS)} before returning home.\n</STORY>", ""]
+    used = []
+    for i in range(3):
+        lines.append(f"Time Frame: {hero} reaches the {rng.choice(_STORY_OBJECTS)} ({i + 1})")
+        for _ in range(3):
+            rel = rng.choice(list(_STORY_RELATIONS))
+            used.append(rel)
+            subject = hero if rng.random() < 0.4 else rng.choice(_STORY_OBJECTS).capitalize()
+            lines.append(f"{subject} [{rel}] {rng.choice(_STORY_OBJECTS)}")
+        lines.append("")
+    lines.append("Relation Mapping:")
+    lines += [f"{rel} - {_STORY_RELATIONS[rel]}" for rel in dict.fromkeys(used) if rng.random() > 1 / 6]
+    return "\n".join(lines)
+
+
+def fake_reply(prompt_text, rng=random):
+    if "<STORY>" in prompt_text:
+        return fake_story(rng)
+    match = re.search(r"Relations:\s*\n(.*)\Z", prompt_text, re.DOTALL)
+    if match:
+        relations = [line.strip() for line in match.group(1).splitlines() if line.strip()]
+        return "\n".join(f"{rel} - {map_relation(rel)}" for rel in relations)
+    match = re.search(r"Objects:\s*\n(.*)\Z", prompt_text, re.DOTALL)
+    if not match:
+        return "OK"
+    objects = [line.strip() for line in match.group(1).splitlines() if line.strip()]
+    return json.dumps([classify_object(o) for o in objects])
+
+
+class FakeChatServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_s=LATENCY_S, jitter_s=LATENCY_JITTER_S, failure_rate=FAILURE_RATE):
+        super().__init__(address, _Handler)
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_tokens = 0
+        self.first_request = None
+        self.last_response = None
+
+    def stats(self):
+        with self.lock:
+            span = (self.last_response - self.first_request) if self.last_response else 0.0
+            return {"requests": self.requests, "failures": self.failures, "max_in_flight": self.max_in_flight,
+                    "total_tokens": self.total_tokens, "span_s": span,
+                    "requests_per_min": 60.0 * self.requests / span if span else None,
+                    "tokens_per_min": 60.0 * self.total_tokens / span if span else None}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, req, reply):
+        """Server-sent events, one chat.completion.chunk per word, spread over the generation time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [p for p in re.findall(r"\S*\s*", reply) if p]
+        delay = self.generation_s / max(1, len(pieces))
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(delay)
+            chunk = {"id": f"chatcmpl-fake-{self.server.requests}", "object": "chat.completion.chunk",
+                     "model": req.get("model", "gpt-4"),
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send(200, self.server.stats())
+        else:
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        srv = self.server
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with srv.lock:
+            srv.requests += 1
+            srv.first_request = srv.first_request or time.monotonic()
+            srv.in_flight += 1
+            srv.max_in_flight = max(srv.max_in_flight, srv.in_flight)
+        try:
+            latency = max(0.0, srv.latency_s + random.uniform(-srv.jitter_s, srv.jitter_s))
+            # a streamed reply spends most of the latency generating tokens, after the first one
+            time.sleep(latency * STREAM_FIRST_TOKEN_FRACTION if req.get("stream") else latency)
+            self.generation_s = latency * (1.0 - STREAM_FIRST_TOKEN_FRACTION)
+            if random.random() < srv.failure_rate:
+                with srv.lock:
+                    srv.failures += 1
+                self._send(429, {"error": {"message": "Rate limit reached (fake endpoint)", "type": "rate_limit"}})
+                return
+            messages = req.get("messages", [])
+            prompt_text = messages[-1].get("content", "") if messages else ""
+            reply = fake_reply(prompt_text)
+            if req.get("stream"):
+                self._stream(req, reply)
+            with srv.lock:
+                srv.total_tokens += len(prompt_text.split()) + len(reply.split())
+                srv.last_response = time.monotonic()
+            if req.get("stream"):
+                return
+            self._send(200, {
+                "id": f"chatcmpl-fake-{srv.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "gpt-4"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt_text.split()), "completion_tokens": len(reply.split()),
+                          "total_tokens": len(prompt_text.split()) + len(reply.split())},
+            })
+        finally:
+            with srv.lock:
+                srv.in_flight -= 1
+
+
+def start_server(host=HOST, port=PORT, **kwargs):
+    """Serve in a daemon thread; returns the server (port=0 picks a free port)."""
+    server = FakeChatServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# === Minimal chain for benchmarks (no LangChain needed) ===
+class _Prompt:
+    def __init__(self, template):
+        self.template = template
+
+    def format(self, **kwargs):
+        return self.template.format(**kwargs)
+
+
+class _LLM:
+    def __init__(self, model_name, temperature):
+        self.model_name = model_name
+        self.temperature = temperature
+
+
+class EndpointChain:
+    """LLMChain look-alike (.run / .arun / .astream_text / .llm / .prompt) that posts to a chat endpoint."""
+
+    def __init__(self, base_url, template, model_name="gpt-4", temperature=0.2, timeout=60.0):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.prompt = _Prompt(template)
+        self.llm = _LLM(model_name, temperature)
+        self.timeout = timeout
+
+    def run(self, variables):
+        payload = {"model": self.llm.model_name, "temperature": self.llm.temperature,
+                   "messages": [{"role": "user", "content": self.prompt.format(**variables)}]}
+        req = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read())["choices"][0]["message"]["content"]
+
+    async def arun(self, variables):
+        return await asyncio.to_thread(self.run, variables)
+
+    def _stream(self, variables):
+        payload = {"model": self.llm.model_name, "temperature": self.llm.temperature, "stream": True,
+                   "messages": [{"role": "user", "content": self.prompt.format(**variables)}]}
+        req = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            for raw in resp:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+
+    async def astream_text(self, variables):
+        """Async generator of the streamed reply's text chunks (the HTTP read runs in a thread)."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def pump():
+            try:
+                for delta in self._stream(variables):
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        reader = loop.run_in_executor(None, pump)
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        await reader
+
+    astream = astream_text  # same interface as CachedChain.astream
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat endpoint for offline tests and load benchmarks.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=LATENCY_S)
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE)
+    parser.add_argument("--bench", action="store_true", help="benchmark Story_2 scene classification against it")
+    parser.add_argument("--scenes", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=600)
+    args = parser.parse_args()
+
+    if not args.bench:
+        server = FakeChatServer((args.host, args.port), latency_s=args.latency, failure_rate=args.failure_rate)
+        print(f"[info] Fake chat endpoint on http://{args.host}:{args.port}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        from SceneAffordanceClassifier import classify_scenes
+
+        server = start_server(args.host, 0, latency_s=args.latency, failure_rate=args.failure_rate)
+        base_url = f"http://{args.host}:{server.server_address[1]}/v1"
+        chain = EndpointChain(base_url, "Scene: {scene_title}\nObjects:\n{object_list}")
+        frames = [{"title": f"Scene {i}",
+                   "scene_relations": [f"Knight [stands near] oak tree {i}", f"chest [on top of] rock {i}"]}
+                  for i in range(args.scenes)]
+
+        rows = []
+        for label, concurrency, rpm in (("sequential", 1, None), ("concurrent", args.concurrency, args.rpm)):
+            stats = {}
+            results = classify_scenes(chain, frames, max_concurrent=concurrency, requests_per_minute=rpm,
+                                      base_delay=0.05, stats=stats)
+            assert [t for t, _ in results] == [tf["title"] for tf in frames]
+            rows.append((label, concurrency, stats))
+        print(f"\n{'mode':>11} | {'workers':>7} | {'seconds':>8} | {'retries':>7} | {'rate wait s':>11}")
+        for label, concurrency, stats in rows:
+            print(f"{label:>11} | {concurrency:>7} | {stats['seconds']:8.2f} | {stats.get('retries', 0):>7} | "
+                  f"{stats['rate_limit_wait_s']:11.2f}")
+        print(f"[info] endpoint: {server.stats()}")
+        server.shutdown()
@@ -0,0 +1,176 @@
+from collections import Counter, defaultdict
+from fractions import Fraction
+
+# Blocked replacement for the all-pairs fuzzy key alignment in the Generation_3
+# intersection metrics. Only pairs that can still reach the threshold are scored:
+#
+#  * identical canonical keys score 100 without calling the scorer;
+#  * with token_set_ratio, any pair sharing a token is a candidate (it can be 100);
+#  * otherwise a pair is kept only if its space-padded character bigrams overlap
+#    enough. If ratio = 2*LCS/S >= r (S = total length), at least
+#    S*(1.5*r - 1) + 1 bigram occurrences are shared, so for r > 2/3 this
+#    filter never drops a pair the scorer would accept. The bound is checked
+#    in exact rationals (200*shared >= S*(3*T - 200) + 200 for threshold T),
+#    since in floats a pair scoring exactly T can fall just below it.
+#
+#   python FuzzyKeyAligner.py          # regression pairs + random check against the all-pairs loop
+#
+# Candidates are then scored and assigned greedily in the same order as the
+# original loop, so the resulting one-to-one map is identical.
+
+MIN_BLOCKING_THRESH = 200.0 / 3.0  # below this the bigram bound is vacuous -> score all pairs
+# slack on the threshold for the bound, so a float score rounding up onto T is never pruned
+BOUND_SLACK = Fraction(1, 10 ** 9)
+
+
+def _compared_tokens(canon_key, token_set):
+    # token_set_ratio compares sorted, de-duplicated token strings; a plain ratio
+    # sees the canonical key as is (same bigrams as its tokens when single-spaced)
+    return sorted(set(canon_key.split())) if token_set else [canon_key]
+
+
+def _padded_bigrams(tokens):
+    grams = Counter()
+    for tok in tokens:
+        padded = f" {tok} "
+        grams.update(padded[i:i + 2] for i in range(len(padded) - 1))
+    return grams
+
+
+def fuzzy_align(src_keys, tgt_keys, canon, score_fn, threshold, token_set=True, stats=None):
+    """Greedy one-to-one src_key -> tgt_key map over pairs scoring >= threshold.
+
+    canon normalizes a key, score_fn(canon_a, canon_b) returns 0..100, and
+    token_set says whether score_fn is token_set_ratio (True) or a plain
+    character ratio on the canonical strings (False).
+    """
+    src_keys = list(src_keys)
+    tgt_keys = list(tgt_keys)
+    src_canon = [canon(k) for k in src_keys]
+    tgt_canon = [canon(k) for k in tgt_keys]
+
+    # inverted indexes over target keys
+    by_canon = defaultdict(list)
+    by_token = defaultdict(list)
+    by_gram = defaultdict(list)
+    tgt_len = []
+    for j, ct in enumerate(tgt_canon):
+        if not ct:
+            tgt_len.append(0)
+            continue
+        by_canon[ct].append(j)
+        toks = _compared_tokens(ct, token_set)
+        tgt_len.append(len(" ".join(toks)))
+        if token_set:
+            for tok in toks:
+                by_token[tok].append(j)
+        for gram, cnt in _padded_bigrams(toks).items():
+            by_gram[gram].append((j, cnt))
+
+    blocking = threshold >= MIN_BLOCKING_THRESH
+    slope = 3 * (Fraction(threshold) - BOUND_SLACK) - 200
+    pairs = []
+    n_scored = 0
+    n_exact = 0
+    for i, cs in enumerate(src_canon):
+        if not cs:
+            continue
+        exact = set(by_canon.get(cs, ()))
+        if blocking:
+            toks = _compared_tokens(cs, token_set)
+            src_len = len(" ".join(toks))
+            candidates = set()
+            if token_set:
+                for tok in toks:
+                    candidates.update(by_token.get(tok, ()))
+            shared = defaultdict(int)
+            for gram, cnt in _padded_bigrams(toks).items():
+                for j, tcnt in by_gram.get(gram, ()):
+                    shared[j] += min(cnt, tcnt)
+            for j, n_shared in shared.items():
+                if 200 * n_shared >= (src_len + tgt_len[j]) * slope + 200:
+                    candidates.add(j)
+        else:
+            candidates = {j for j, ct in enumerate(tgt_canon) if ct}
+
+        for j in sorted(candidates | exact):
+            if j in exact:
+                score = 100.0
+                n_exact += 1
+            else:
+                score = score_fn(cs, tgt_canon[j])
+                n_scored += 1
+            if score >= threshold:
+                pairs.append((score, i, j))
+
+    # same ordering as sorting the full (src x tgt) pair list by score, stably
+    pairs.sort(key=lambda p: (-p[0], p[1], p[2]))
+    used_src, used_tgt = set(), set()
+    fuzzy_map = {}
+    for score, i, j in pairs:
+        s, t = src_keys[i], tgt_keys[j]
+        if s in used_src or t in used_tgt:
+            continue
+        fuzzy_map[s] = t
+        used_src.add(s)
+        used_tgt.add(t)
+
+    if stats is not None:
+        stats.update({
+            "pairs_total": sum(1 for c in src_canon if c) * sum(1 for c in tgt_canon if c),
+            "pairs_scored": n_scored,
+            "pairs_exact": n_exact,
+            "pairs_above_thresh": len(pairs),
+        })
+    return fuzzy_map
+
+
+def all_pairs_align(src_keys, tgt_keys, canon, score_fn, threshold):
+    """The original all-pairs loop; reference for fuzzy_align."""
+    pairs = []
+    for s in src_keys:
+        for t in tgt_keys:
+            cs, ct = canon(s), canon(t)
+            if not cs or not ct:
+                continue
+            score = 100.0 if cs == ct else score_fn(cs, ct)
+            if score >= threshold:
+                pairs.append((score, s, t))
+    pairs.sort(key=lambda p: -p[0])
+    used_src, used_tgt = set(), set()
+    fuzzy_map = {}
+    for score, s, t in pairs:
+        if s in used_src or t in used_tgt:
+            continue
+        fuzzy_map[s] = t
+        used_src.add(s)
+        used_tgt.add(t)
+    return fuzzy_map
+
+
+if __name__ == "__main__":
+    import random
+    from difflib import SequenceMatcher
+
+    def difflib_score(a, b):
+        return 100.0 * SequenceMatcher(None, a, b).ratio()
+
+    # pairs whose score sits exactly on the threshold
+    regression = [(["geeeaeejha"], ["gjeeeeejha"], 90)]
+    for src, tgt, thresh in regression:
+        got = fuzzy_align(src, tgt, str, difflib_score, thresh, token_set=False)
+        want = all_pairs_align(src, tgt, str, difflib_score, thresh)
+        print(f"[{'✓' if got == want else '⚠️'}] {src} ~ {tgt} @ {thresh}: {got}")
+
+    rng = random.Random(0)
+    mismatches = 0
+    for trial in range(300):
+        alphabet = "aeghj " if trial % 2 else "aeghj"
+        src = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12))) for _ in range(20)]
+        tgt = [s if rng.random() < 0.2 else "".join(c if rng.random() < 0.8 else rng.choice(alphabet) for c in s)
+               for s in src]
+        for thresh in (85, 90, 95):
+            if (fuzzy_align(src, tgt, str, difflib_score, thresh, token_set=False)
+                    != all_pairs_align(src, tgt, str, difflib_score, thresh)):
+                mismatches += 1
+    print(f"[info] random check: {mismatches} mismatching alignments in 900")
@@ -1,6 +1,6 @@
 import json
 import os
-from sentence_transformers import SentenceTransformer
+from QueryEmbeddingCache import get_sentence_model
 from scipy.spatial.distance import cosine
 
 # === CONFIGURABLE ===
@@ -10,11 +10,13 @@ EMBED_INDEX = "Data/GameTile/object_embedding_index.jsonl"
 OUTPUT_FILE = f"StoryFiles/{STORY_ID}_matched_objects.json"
 
 # === Load model and index ===
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# the SentenceTransformer (and torch) is only loaded by the first query
+def get_model():
+    return get_sentence_model('all-MiniLM-L6-v2')
 with open(EMBED_INDEX, "r", encoding="utf-8") as f:
     index = [json.loads(line) for line in f]
 
-def get_embedding(text): return model.encode(text, show_progress_bar=False)
+def get_embedding(text): return get_model().encode(text, show_progress_bar=False)
 def cosine_sim(a, b): return 1 - cosine(a, b)
 
 # === Character Heuristic ===
@@ -1,14 +1,15 @@
 import warnings
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from scipy.spatial.distance import cosine
+from QueryEmbeddingCache import get_sentence_model
+from ObjectEmbeddingIndex import load_index
 from statistics import mean
 
 # === CONFIGURABLE ===
 STORY_ID = "3"
 STORY_FILE = f"StoryFiles/output_KG_story_{STORY_ID}/{STORY_ID}_kg_data.json"
 EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"  # memory-mapped binary copy (built on first run); None = parse JSONL
 
 # Optional expected affordance file. Leave as None if you don’t have it yet.
 # Format: {"Hero": ["Characters"], "chest": ["Interactive Object","Items and Collectibles"], ...}
@@ -47,18 +48,17 @@ WEIGHTS = {"name": 0.5, "group": 0.3, "super": 0.1, "afford": 0.1}  # suggested
 
 
 # === Load model and index ===
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# the SentenceTransformer (and torch) is only loaded by the first query
+def get_model():
+    return get_sentence_model('all-MiniLM-L6-v2')
 
 
 def _norm(s: str) -> str:
     return (s or "").strip()
 
-def cosine_sim(a, b):
-    return 1 - cosine(a, b)
-
 # Load prebuilt embedding index
-with open(EMBED_INDEX, "r", encoding="utf-8") as f:
-    index = [json.loads(line) for line in f]
+# (opened with np.load(mmap_mode="r") from EMBED_INDEX_NPY; see ObjectEmbeddingIndex.py)
+index = load_index(EMBED_INDEX, EMBED_INDEX_NPY)
 
 
 # --- Load expected affordances from LLM prediction file ---
@@ -145,49 +145,14 @@ else:
 
 
 def get_embedding(text):
-    return model.encode(text, show_progress_bar=False)
+    return get_model().encode(text, show_progress_bar=False)
 
 def is_probable_character(name):
     return name and name[0].isupper() and "_" not in name and len(name.split()) <= 2
 
 def query_object(text, top_k=TOP_K, restrict_to_character=False):
     query_vec = get_embedding(text)
-    rows = []
-    for obj in index:
-        if restrict_to_character and "Characters" not in obj.get("affordance", []):
-            continue
-
-        emb = obj.get("embedding", {})
-        name_vec = emb.get("detailed_name")
-        group_vec = emb.get("group")
-        super_vec = emb.get("supercategory")
-        afford_vec = emb.get("affordance")
-
-        sim_name = cosine_sim(query_vec, name_vec) if name_vec is not None else 0.0
-        sim_group = cosine_sim(query_vec, group_vec) if group_vec is not None else 0.0
-        sim_super = cosine_sim(query_vec, super_vec) if super_vec is not None else 0.0
-        sim_afford = cosine_sim(query_vec, afford_vec) if afford_vec is not None else 0.0
-
-        total = (
-            WEIGHTS["name"] * sim_name +
-            WEIGHTS["group"] * sim_group +
-            WEIGHTS["super"] * sim_super +
-            WEIGHTS["afford"] * sim_afford
-        )
-
-        rows.append({
-            "image_path": obj["image_path"],
-            "total_score": float(total),
-            "sim_name": float(sim_name),
-            "sim_group": float(sim_group),
-            "sim_super": float(sim_super),
-            "sim_afford": float(sim_afford),
-            "weights": WEIGHTS,
-            "candidate_affordances": obj.get("affordance", []),
-        })
-
-    rows.sort(key=lambda r: r["total_score"], reverse=True)
-    return rows[:top_k]
+    return index.query(query_vec, top_k, WEIGHTS, restrict_to_character=restrict_to_character)
 
 # === Main Processing ===
 with open(STORY_FILE, "r", encoding="utf-8") as f:
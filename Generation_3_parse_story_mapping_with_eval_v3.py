@@ -1,15 +1,22 @@
 import warnings
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from scipy.spatial.distance import cosine
+from ObjectEmbeddingIndex import load_index
+from QueryEmbeddingCache import QueryEmbeddingCache, get_sentence_model
+from AffordanceExpectations import load_expected_affordances, is_probable_character
+from ObjectEmbeddingANN import IVFTileIndex, ann_recall_report
+from MatchingService import MatchingClient
+from FuzzyKeyAligner import fuzzy_align
+from MatchManifest import MatchManifest
+from DetailedResultsFormat import write_detailed
 from statistics import mean
 import re
 
 # === CONFIGURABLE ===
-STORY_ID = "10"
+STORY_ID = os.environ.get("STORY_ID", "10")  # set by Generation_3_run_all_stories.py
 STORY_FILE = f"StoryFiles/output_KG_story_{STORY_ID}/{STORY_ID}_kg_data.json"
 EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"  # memory-mapped binary copy (built on first run); None = parse JSONL
 
 # Optional expected affordance file. Leave as None if you don’t have it yet.
 # Format: {"Hero": ["Characters"], "chest": ["Interactive Object","Items and Collectibles"], ...}
@@ -18,6 +25,8 @@ EXPECTED_AFFORD_FILE = f"StoryFiles/{STORY_ID}_expected_affordances.json"  # or
 # outputs
 OUTPUT_TOP1 = f"StoryFiles/{STORY_ID}_matched_objects.json"                 # backward-compatible (object -> [top1_path])
 OUTPUT_DETAILED = f"StoryFiles/{STORY_ID}_matched_objects_detailed.json"    # full scores, flags, margins, affordance checks
+DETAILED_FORMAT = "legacy"     # "legacy" = indented dict in OUTPUT_DETAILED; "compact" = DetailedResultsFormat.py layout (read with load_detailed)
+OUTPUT_DETAILED_COMPACT = f"StoryFiles/{STORY_ID}_matched_objects_detailed.json.gz"  # .json / .json.gz / .msgpack(.gz)
 OUTPUT_METRICS = f"StoryFiles/{STORY_ID}_matching_metrics.json"             # summary metrics
 OUTPUT_METRICS_INTERSECT = f"StoryFiles/{STORY_ID}_matching_metrics_intersection.json"
 
@@ -27,18 +36,6 @@ USE_PER_SCENE_AFFORD = True      # True = prefer per_scene_affordances; False =
 MIN_PRED_CONF = 0.0              # keep all predictions; raise to e.g. 0.5 if you want to filter low confidence
 
 
-# Map prediction categories to the index's affordance tags (plural form)
-CATEGORY_TO_INDEX_TAG = {
-    "Character": "Characters",
-    "Characters": "Characters",
-    "Interactive Object": "Interactive Object",
-    "Item / Collectible": "Items and Collectibles",
-    "Items and Collectibles": "Items and Collectibles",
-    "Environmental Object": "Environmental Object",
-    "Terrain": "Terrain",
-    "Effect / Ambient / Unknown": "Effect / Ambient / Unknown",
-}
-
 
 # matching config
 TOP_K = 3
@@ -46,6 +43,30 @@ HIGH_CONF_THRESH = 0.70   # “high-confidence@1” reporting threshold (not use
 CONF_THRESH_FOR_REVIEW = 0.50  # if top1_total < this, flag as low-confidence for review
 REVIEW_MARGIN_THRESH = 0.05    # if (top1 - top2) < this, flag as ambiguous
 WEIGHTS = {"name": 0.5, "group": 0.3, "super": 0.1, "afford": 0.1}  # suggested rebalance
+ENCODE_BATCH_SIZE = 64         # node names per SentenceTransformer.encode batch
+RESTRICT_TO_EXPECTED_AFFORD = False  # True = search only the index partitions of the predicted affordance tags
+QUANTIZE_INDEX = None          # None = float32 ranking; "float16" / "int8" = quantized first pass, exact re-score
+
+# query-text embedding cache (shared across stories and runs)
+MODEL_NAME = "all-MiniLM-L6-v2"
+USE_EMBED_CACHE = True
+EMBED_CACHE_DIR = "Data/embedding_cache"
+EMBED_CACHE_MAX_ENTRIES = 200000
+
+# approximate nearest-neighbor shortlist (IVF over name embeddings), re-ranked exactly
+USE_ANN = False
+ANN_NLISTS = None              # None = ~sqrt(num tiles)
+ANN_NPROBE = 8                 # clusters scanned per query; raise for recall, lower for speed
+ANN_REPORT = True              # write recall@k vs the exact scan into the metrics
+ANN_CENTROIDS = "Data/object_embedding_index_ivf.npz"
+
+# resident matching service (MatchingService.py); used when reachable and USE_ANN is off
+USE_MATCH_SERVER = True
+MATCH_SERVER = None            # None = $MATCH_SERVER or http://127.0.0.1:8765; "unix:/path.sock" also works
+
+# incremental re-matching: reuse last run's candidates for nodes whose inputs did not change
+USE_MATCH_MANIFEST = True
+MATCH_MANIFEST = f"StoryFiles/{STORY_ID}_match_manifest.json"
 
 
 
@@ -74,147 +95,94 @@ def _fuzzy_score(a: str, b: str) -> float:
     return 100.0 * SequenceMatcher(None, a, b).ratio()
 
 # === Load model and index ===
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# The SentenceTransformer (and torch behind it) is only imported when a query
+# misses the embedding cache, so fully cached re-matches never load it.
+def get_model():
+    return get_sentence_model(MODEL_NAME)
+
+embed_cache = (
+    QueryEmbeddingCache(MODEL_NAME, cache_dir=EMBED_CACHE_DIR, max_entries=EMBED_CACHE_MAX_ENTRIES)
+    if USE_EMBED_CACHE else None
+)
 
 
 def _norm(s: str) -> str:
     return (s or "").strip()
 
-def cosine_sim(a, b):
-    return 1 - cosine(a, b)
-
 # Load prebuilt embedding index
-with open(EMBED_INDEX, "r", encoding="utf-8") as f:
-    index = [json.loads(line) for line in f]
-
-
-# --- Load expected affordances from LLM prediction file ---
-expected_afford = {}  # object_name -> list of expected tags (aligned to index)
-if os.path.exists(AFFORD_PRED_FILE):
-    with open(AFFORD_PRED_FILE, "r", encoding="utf-8") as f:
-        pred = json.load(f)
-
-    # Helper: add a single object prediction into expected_afford
-    def _add_expected(obj_name: str, category: str, conf: float):
-        if obj_name is None or category is None:
-            return
-        if conf is not None and conf < MIN_PRED_CONF:
-            return
-        key = _norm(obj_name)
-        tag = CATEGORY_TO_INDEX_TAG.get(_norm(category), _norm(category))
-        if not key or not tag:
-            return
-        expected_afford.setdefault(key, set()).add(tag)
-
-    if USE_PER_SCENE_AFFORD:
-        for scene in pred.get("per_scene_affordances", []):
-            for obj in scene.get("objects", []):
-                _add_expected(obj.get("object"), obj.get("category"), obj.get("confidence", 1.0))
+# (opened with np.load(mmap_mode="r") from EMBED_INDEX_NPY; see ObjectEmbeddingIndex.py)
+index = load_index(EMBED_INDEX, EMBED_INDEX_NPY, quantize=QUANTIZE_INDEX)
+ann_index = IVFTileIndex.load_or_build(index, ANN_CENTROIDS, n_lists=ANN_NLISTS) if USE_ANN else None
+
+match_client = None
+if USE_MATCH_SERVER and ann_index is None:
+    match_client = MatchingClient(MATCH_SERVER)
+    # only a server that loaded this index, model and quantization gives the same matches
+    if match_client.available(expect={"index_fingerprint": index.fingerprint(), "model": MODEL_NAME,
+                                      "quantize": index.quantized}):
+        print(f"[info] Using matching service at {match_client.address}")
     else:
-        for obj_name, rec in pred.get("global_object_affordances", {}).items():
-            _add_expected(rec.get("object") or obj_name, rec.get("category"), rec.get("confidence", 1.0))
+        match_client = None
 
-    # convert sets to lists
-    expected_afford = {k: sorted(list(v)) for k, v in expected_afford.items()}
-else:
-    expected_afford = {}
-
-
-# Optional: expected affordance mapping
-# --- Load expected affordances from prediction file ---
-# expected_afford = {}  # object_name -> list of expected tags (aligned to index)
-
-# Optional mapper from predicted category -> your index’s affordance tag form
-CATEGORY_TO_INDEX_TAG = {
-    "Character": "Characters",
-    "Characters": "Characters",
-    "Interactive Object": "Interactive Object",
-    "Item / Collectible": "Items and Collectibles",
-    "Items and Collectibles": "Items and Collectibles",
-    "Environmental Object": "Environmental Object",
-    "Terrain": "Terrain",
-    "Effect / Ambient / Unknown": "Effect / Ambient / Unknown",
-}
 
+# --- Load expected affordances from LLM prediction file ---
+# object_name -> list of expected tags (aligned to index); same loader as Generation_3_weight_sweep.py
+expected_afford = load_expected_affordances(AFFORD_PRED_FILE, USE_PER_SCENE_AFFORD, MIN_PRED_CONF)
 if os.path.exists(AFFORD_PRED_FILE):
-    with open(AFFORD_PRED_FILE, "r", encoding="utf-8") as f:
-        pred = json.load(f)
-    print(f"[info] Loaded affordance predictions from {AFFORD_PRED_FILE}")
-
-    def _add_expected(obj_name: str, category: str, conf: float):
-        if obj_name is None or category is None:
-            return
-        if conf is not None and conf < MIN_PRED_CONF:
-            return
-        key = _norm(obj_name)
-        tag = CATEGORY_TO_INDEX_TAG.get(_norm(category), _norm(category))
-        if not key or not tag:
-            return
-        # expected_afford.setdefault(key, set()).add(tag)
-
-    if USE_PER_SCENE_AFFORD:
-        for scene in pred.get("per_scene_affordances", []):
-            for obj in scene.get("objects", []):
-                _add_expected(obj.get("object"), obj.get("category"), obj.get("confidence", 1.0))
-    else:
-        for obj_name, rec in (pred.get("global_object_affordances", {}) or {}).items():
-            _add_expected(rec.get("object") or obj_name, rec.get("category"), rec.get("confidence", 1.0))
-
-    # sets -> lists
-    expected_afford = {k: sorted(list(v)) for k, v in expected_afford.items()}
-    print(f"[info] Built expected affordances for {len(expected_afford)} objects")
+    print(f"[info] Built expected affordances for {len(expected_afford)} objects from {AFFORD_PRED_FILE}")
 else:
     print(f"[warn] No affordance prediction file found at {AFFORD_PRED_FILE}")
-    expected_afford = {}
 
 
 
 
 
 def get_embedding(text):
-    return model.encode(text, show_progress_bar=False)
+    if embed_cache is not None:
+        return embed_cache.encode(get_model, [text])[0]
+    return get_model().encode(text, show_progress_bar=False)
 
-def is_probable_character(name):
-    return name and name[0].isupper() and "_" not in name and len(name.split()) <= 2
+def get_embeddings(texts, batch_size=ENCODE_BATCH_SIZE):
+    if embed_cache is not None:
+        return embed_cache.encode(get_model, texts, batch_size=batch_size)
+    return get_model().encode(list(texts), batch_size=batch_size, show_progress_bar=False)
 
 def query_object(text, top_k=TOP_K, restrict_to_character=False):
     query_vec = get_embedding(text)
-    rows = []
-    for obj in index:
-        if restrict_to_character and "Characters" not in obj.get("affordance", []):
-            continue
-
-        emb = obj.get("embedding", {})
-        name_vec = emb.get("detailed_name")
-        group_vec = emb.get("group")
-        super_vec = emb.get("supercategory")
-        afford_vec = emb.get("affordance")
-
-        sim_name = cosine_sim(query_vec, name_vec) if name_vec is not None else 0.0
-        sim_group = cosine_sim(query_vec, group_vec) if group_vec is not None else 0.0
-        sim_super = cosine_sim(query_vec, super_vec) if super_vec is not None else 0.0
-        sim_afford = cosine_sim(query_vec, afford_vec) if afford_vec is not None else 0.0
-
-        total = (
-            WEIGHTS["name"] * sim_name +
-            WEIGHTS["group"] * sim_group +
-            WEIGHTS["super"] * sim_super +
-            WEIGHTS["afford"] * sim_afford
-        )
-
-        rows.append({
-            "image_path": obj["image_path"],
-            "total_score": float(total),
-            "sim_name": float(sim_name),
-            "sim_group": float(sim_group),
-            "sim_super": float(sim_super),
-            "sim_afford": float(sim_afford),
-            "weights": WEIGHTS,
-            "candidate_affordances": obj.get("affordance", []),
-        })
-
-    rows.sort(key=lambda r: r["total_score"], reverse=True)
-    return rows[:top_k]
+    return index.query(query_vec, top_k, WEIGHTS, restrict_to_character=restrict_to_character)
+
+def expected_restrict_tags(name):
+    """Predicted affordance tags to restrict the search to (None = no restriction).
+
+    Only tags that exist as index partitions are kept, so a prediction like
+    "Terrain" never empties the candidate set.
+    """
+    if not RESTRICT_TO_EXPECTED_AFFORD or is_probable_character(name):
+        return None
+    tags = [t for t in expected_afford.get(_norm(name), []) if t in index.partitions]
+    return tags or None
+
+def match_objects(names, top_k=TOP_K, vecs=None):
+    """Encode all names in one batched call and score them as one block."""
+    names = list(names)
+    if not names:
+        return {}
+    restrict = [bool(is_probable_character(n)) for n in names]
+    restrict_tags = [expected_restrict_tags(n) for n in names]
+    if match_client is not None:
+        # the service encodes and scores; send tags, True (characters) or None per name
+        restrict_arg = [t if t else (True if r else None) for r, t in zip(restrict, restrict_tags)]
+        results = match_client.match(names, top_k, restrict_arg, WEIGHTS)
+        return dict(zip(names, results))
+    if vecs is None:
+        vecs = get_embeddings(names)
+    if ann_index is not None:
+        results = ann_index.query_batch(vecs, top_k, WEIGHTS, restrict_to_character=restrict, n_probe=ANN_NPROBE,
+                                        restrict_tags=restrict_tags)
+    else:
+        results = index.query_batch(vecs, top_k, WEIGHTS, restrict_to_character=restrict,
+                                    restrict_tags=restrict_tags)
+    return dict(zip(names, results))
 
 # === Main Processing ===
 with open(STORY_FILE, "r", encoding="utf-8") as f:
@@ -223,98 +191,143 @@ with open(STORY_FILE, "r", encoding="utf-8") as f:
 scene_kgs = story["scene_kgs"]
 matched_top1 = {}
 matched_detailed = {}
-objects_seen = set()
-
-for scene, data in scene_kgs.items():
-    for obj_name in data["nodes"]:
-        if obj_name in objects_seen:
-            continue
-        objects_seen.add(obj_name)
-
-        restrict = is_probable_character(obj_name)
-        candidates = query_object(obj_name, top_k=TOP_K, restrict_to_character=restrict)
-
-        # Derive margins and flags
-        top1 = candidates[0] if candidates else None
-        top2 = candidates[1] if len(candidates) > 1 else None
-        top3 = candidates[2] if len(candidates) > 2 else None
-
-        margin_12 = float(top1["total_score"] - top2["total_score"]) if (top1 and top2) else None
-        margin_13 = float(top1["total_score"] - top3["total_score"]) if (top1 and top3) else None
-
-        low_conf_flag = (top1 is not None and top1["total_score"] < CONF_THRESH_FOR_REVIEW)
-        ambiguous_flag = (margin_12 is not None and margin_12 < REVIEW_MARGIN_THRESH)
-
-        # Expected affordance check
-        # expected = expected_afford.get(obj_name, [])
-        # afford_match_flag = None  # None = no expectation; True/False when expectation exists
-        # if expected:
-        #     top1_affs = set(top1.get("candidate_affordances", [])) if top1 else set()
-        #     afford_match_flag = bool(top1_affs.intersection(set(expected)))
-
-        # Expected affordance check (uses predictions loaded above)
-        expected = expected_afford.get(_norm(obj_name), [])
-        afford_match_flag = None  # None = no expectation present; True/False when expectation exists
-        if expected:
-            top1_affs = set(top1.get("candidate_affordances", [])) if top1 else set()
-            afford_match_flag = bool(top1_affs.intersection(set(expected)))
-
-
-
-        # needs_review if any of the conditions is concerning:
-        needs_review = False
-        if low_conf_flag or ambiguous_flag:
-            needs_review = True
-        # If you want affordance mismatch to trigger review only when expectations exist:
-        if afford_match_flag is False:
-            needs_review = True
-
-        # needs_review = False
-        # if low_conf_flag or ambiguous_flag:
-        #     needs_review = True
-        # if afford_match_flag is False:  # only triggers when we had an expectation
-        #     needs_review = True
-
-
-        matched_top1[obj_name] = [top1["image_path"]] if top1 else []
-        # matched_detailed[obj_name] = {
-        #     "restricted_to_characters": bool(restrict),
-        #     "query_text": obj_name,
-        #     "expected_affordances": expected,           # new
-        #     "affordance_match_top1": afford_match_flag, # new: None/True/False
-        #     "needs_review": bool(needs_review),         # new
-        #     "review_reasons": {
-        #         "low_confidence": bool(low_conf_flag),
-        #         "ambiguous_margin": bool(ambiguous_flag),
-        #         "affordance_mismatch": (afford_match_flag is False),
-        #     },                                          # new
-        #     "margins": {
-        #         "top1_minus_top2": margin_12,
-        #         "top1_minus_top3": margin_13
-        #     },                                          # new
-        #     "candidates": candidates
-        # }
-        matched_detailed[obj_name] = {
-            "restricted_to_characters": bool(restrict),
-            "query_text": obj_name,
-
-            # NEW: affordance expectations and match info
-            "expected_affordances": expected,
-            "candidate_affordances_top1": top1.get("candidate_affordances", []) if top1 else [],
-            "affordance_match_top1": afford_match_flag,
-
-            "needs_review": bool(needs_review),
-            "review_reasons": {
-                "low_confidence": bool(low_conf_flag),
-                "ambiguous_margin": bool(ambiguous_flag),
-                "affordance_mismatch": (afford_match_flag is False),
-            },
-            "margins": {
-                "top1_minus_top2": margin_12,
-                "top1_minus_top3": margin_13
-            },
-            "candidates": candidates
-        }
+
+# unique nodes across all scenes, in first-seen order
+unique_nodes = list(dict.fromkeys(
+    obj_name for data in scene_kgs.values() for obj_name in data["nodes"]
+))
+
+# Carry forward candidates of nodes whose (text, restriction, settings, index) are unchanged
+manifest = None
+manifest_keys = {}
+batch_candidates = {}
+pending_nodes = unique_nodes
+if USE_MATCH_MANIFEST:
+    # record what actually produced the candidates: the service's index/model/quantization when it is used
+    source = match_client.identity if match_client is not None else {
+        "model": MODEL_NAME, "quantize": index.quantized, "index_fingerprint": index.fingerprint()}
+    manifest = MatchManifest(MATCH_MANIFEST, {
+        "weights": WEIGHTS,
+        "top_k": TOP_K,
+        "model": source.get("model"),
+        "mode": f"ann:{len(ann_index.centroids)}:{ANN_NPROBE}" if ann_index is not None else "exact",
+        "quantize": source.get("quantize"),
+        "index_fingerprint": source.get("index_fingerprint"),
+    })
+    manifest_keys = {n: manifest.key(n, is_probable_character(n), expected_restrict_tags(n)) for n in unique_nodes}
+    for n in unique_nodes:
+        cached = manifest.get(manifest_keys[n])
+        if cached is not None:
+            batch_candidates[n] = cached
+    pending_nodes = [n for n in unique_nodes if n not in batch_candidates]
+
+node_vecs = get_embeddings(pending_nodes) if (pending_nodes and match_client is None) else None
+batch_candidates.update(match_objects(pending_nodes, top_k=TOP_K, vecs=node_vecs))
+print(f"[info] Matched {len(pending_nodes)} of {len(unique_nodes)} unique nodes "
+      f"in batches of {ENCODE_BATCH_SIZE} ({len(unique_nodes) - len(pending_nodes)} unchanged)")
+
+if manifest is not None:
+    for n in pending_nodes:
+        manifest.put(manifest_keys[n], n, batch_candidates[n])
+    manifest.save(keep_keys=manifest_keys.values())
+
+ann_report = None
+if ann_index is not None and ANN_REPORT and pending_nodes:
+    probes = sorted({1, 2, 4, ANN_NPROBE, 2 * ANN_NPROBE})
+    ann_report = ann_recall_report(ann_index, node_vecs, TOP_K, WEIGHTS,
+                                   [bool(is_probable_character(n)) for n in pending_nodes], n_probes=probes,
+                                   restrict_tags=[expected_restrict_tags(n) for n in pending_nodes])
+    for row in ann_report["by_n_probe"]:
+        print(f"[info] ANN n_probe={row['n_probe']}: recall@{TOP_K}={row[f'recall_at_{TOP_K}']:.3f}, "
+              f"{row['ann_ms_per_query']:.2f} ms/query (exact {ann_report['exact_ms_per_query']:.2f} ms)")
+
+for obj_name in unique_nodes:
+    restrict = is_probable_character(obj_name)
+    candidates = batch_candidates[obj_name]
+
+    # Derive margins and flags
+    top1 = candidates[0] if candidates else None
+    top2 = candidates[1] if len(candidates) > 1 else None
+    top3 = candidates[2] if len(candidates) > 2 else None
+
+    margin_12 = float(top1["total_score"] - top2["total_score"]) if (top1 and top2) else None
+    margin_13 = float(top1["total_score"] - top3["total_score"]) if (top1 and top3) else None
+
+    low_conf_flag = (top1 is not None and top1["total_score"] < CONF_THRESH_FOR_REVIEW)
+    ambiguous_flag = (margin_12 is not None and margin_12 < REVIEW_MARGIN_THRESH)
+
+    # Expected affordance check
+    # expected = expected_afford.get(obj_name, [])
+    # afford_match_flag = None  # None = no expectation; True/False when expectation exists
+    # if expected:
+    #     top1_affs = set(top1.get("candidate_affordances", [])) if top1 else set()
+    #     afford_match_flag = bool(top1_affs.intersection(set(expected)))
+
+    # Expected affordance check (uses predictions loaded above)
+    expected = expected_afford.get(_norm(obj_name), [])
+    afford_match_flag = None  # None = no expectation present; True/False when expectation exists
+    if expected:
+        top1_affs = set(top1.get("candidate_affordances", [])) if top1 else set()
+        afford_match_flag = bool(top1_affs.intersection(set(expected)))
+
+
+
+    # needs_review if any of the conditions is concerning:
+    needs_review = False
+    if low_conf_flag or ambiguous_flag:
+        needs_review = True
+    # If you want affordance mismatch to trigger review only when expectations exist:
+    if afford_match_flag is False:
+        needs_review = True
+
+    # needs_review = False
+    # if low_conf_flag or ambiguous_flag:
+    #     needs_review = True
+    # if afford_match_flag is False:  # only triggers when we had an expectation
+    #     needs_review = True
+
+
+    matched_top1[obj_name] = [top1["image_path"]] if top1 else []
+    # matched_detailed[obj_name] = {
+    #     "restricted_to_characters": bool(restrict),
+    #     "query_text": obj_name,
+    #     "expected_affordances": expected,           # new
+    #     "affordance_match_top1": afford_match_flag, # new: None/True/False
+    #     "needs_review": bool(needs_review),         # new
+    #     "review_reasons": {
+    #         "low_confidence": bool(low_conf_flag),
+    #         "ambiguous_margin": bool(ambiguous_flag),
+    #         "affordance_mismatch": (afford_match_flag is False),
+    #     },                                          # new
+    #     "margins": {
+    #         "top1_minus_top2": margin_12,
+    #         "top1_minus_top3": margin_13
+    #     },                                          # new
+    #     "candidates": candidates
+    # }
+    matched_detailed[obj_name] = {
+        "restricted_to_characters": bool(restrict),
+        "query_text": obj_name,
+
+        # NEW: affordance expectations and match info
+        "expected_affordances": expected,
+        "candidate_affordances_top1": top1.get("candidate_affordances", []) if top1 else [],
+        "affordance_match_top1": afford_match_flag,
+
+        "needs_review": bool(needs_review),
+        "review_reasons": {
+            "low_confidence": bool(low_conf_flag),
+            "ambiguous_margin": bool(ambiguous_flag),
+            "affordance_mismatch": (afford_match_flag is False),
+        },
+        "margins": {
+            "top1_minus_top2": margin_12,
+            "top1_minus_top3": margin_13
+        },
+        "candidates": candidates
+    }
+    if RESTRICT_TO_EXPECTED_AFFORD:
+        matched_detailed[obj_name]["restricted_to_affordances"] = expected_restrict_tags(obj_name)
 
 
 
@@ -325,9 +338,27 @@ with open(OUTPUT_TOP1, "w", encoding="utf-8") as fout:
     json.dump(matched_top1, fout, indent=2)
 print(f"[✓] Saved object->top1 image mapping to {OUTPUT_TOP1}")
 
-with open(OUTPUT_DETAILED, "w", encoding="utf-8") as fout:
-    json.dump(matched_detailed, fout, indent=2)
-print(f"[✓] Saved detailed matching (flags, margins, top-{TOP_K}) to {OUTPUT_DETAILED}")
+if DETAILED_FORMAT == "compact":
+    detailed_bytes = write_detailed(OUTPUT_DETAILED_COMPACT, matched_detailed, config={
+        "story_id": STORY_ID,
+        "top_k": TOP_K,
+        "high_conf_threshold": HIGH_CONF_THRESH,
+        "conf_thresh_for_review": CONF_THRESH_FOR_REVIEW,
+        "review_margin_thresh": REVIEW_MARGIN_THRESH,
+        "index_fingerprint": index.fingerprint(),
+    })
+    print(f"[✓] Saved detailed matching (flags, margins, top-{TOP_K}) to {OUTPUT_DETAILED_COMPACT} "
+          f"({detailed_bytes / 1024:.1f} KiB)")
+    written_detailed, stale_detailed = OUTPUT_DETAILED_COMPACT, OUTPUT_DETAILED
+else:
+    with open(OUTPUT_DETAILED, "w", encoding="utf-8") as fout:
+        json.dump(matched_detailed, fout, indent=2)
+    print(f"[✓] Saved detailed matching (flags, margins, top-{TOP_K}) to {OUTPUT_DETAILED}")
+    written_detailed, stale_detailed = OUTPUT_DETAILED, OUTPUT_DETAILED_COMPACT
+# only one layout per story, so nothing reads a detailed file left over from the other format
+if stale_detailed != written_detailed and os.path.exists(stale_detailed):
+    os.remove(stale_detailed)
+    print(f"[info] Removed stale {stale_detailed} ({DETAILED_FORMAT} format in use)")
 
 # === Evaluation metrics ===
 def safe_mean(values):
@@ -402,9 +433,19 @@ metrics = {
 
     "afford_expect_known": afford_known,
     "afford_expect_match": afford_match,
-    "afford_expect_match_rate": (afford_match / afford_known) if afford_known else None
+    "afford_expect_match_rate": (afford_match / afford_known) if afford_known else None,
+
+    "embedding_cache": embed_cache.stats() if embed_cache is not None else None,
+    "ann": ann_report,
+    "match_manifest": manifest.stats() if manifest is not None else None
 }
 
+if embed_cache is not None:
+    embed_cache.save()
+    cs = metrics["embedding_cache"]
+    print(f"[info] Embedding cache: {cs['hits']} hits / {cs['misses']} misses "
+          f"({cs['entries']} entries, {cs['evictions']} evicted)")
+
 # --- Intersection-only affordance metrics ---
 def _norm(s: str) -> str:
     return (s or "").strip()
@@ -418,35 +459,14 @@ FUZZY_THRESH = 90.0  # tighten/loosen as needed; 85–92 works well in practice
 src_keys = list(matched_detailed.keys())
 tgt_keys = list(expected_afford.keys())
 
-# canonical forms for matching
-src_canon = {k: _canon(k) for k in src_keys}
-tgt_canon = {k: _canon(k) for k in tgt_keys}
-
-# Build all candidate pairs with scores (skip exact canonical mismatch below threshold)
-pairs = []
-for s in src_keys:
-    cs = src_canon[s]
-    if not cs:
-        continue
-    for t in tgt_keys:
-        ct = tgt_canon[t]
-        if not ct:
-            continue
-        score = _fuzzy_score(cs, ct)
-        if score >= FUZZY_THRESH:
-            pairs.append((score, s, t))
-
-# Greedy assignment: sort by score desc and keep one-to-one matches
-pairs.sort(reverse=True, key=lambda r: r[0])
-used_src = set()
-used_tgt = set()
-fuzzy_map = {}  # src_key -> tgt_key
-for score, s, t in pairs:
-    if s in used_src or t in used_tgt:
-        continue
-    fuzzy_map[s] = t
-    used_src.add(s)
-    used_tgt.add(t)
+# Greedy one-to-one assignment over pairs scoring >= FUZZY_THRESH (best score first).
+# Exact canonical hits skip the scorer; other pairs are only scored if they share
+# a token or enough character bigrams to reach the threshold (see FuzzyKeyAligner.py).
+fuzzy_stats = {}
+fuzzy_map = fuzzy_align(src_keys, tgt_keys, _canon, _fuzzy_score, FUZZY_THRESH,
+                        token_set=_USE_RAPIDFUZZ, stats=fuzzy_stats)  # src_key -> tgt_key
+print(f"[info] Fuzzy key alignment scored {fuzzy_stats['pairs_scored']} of "
+      f"{fuzzy_stats['pairs_total']} pairs ({fuzzy_stats['pairs_exact']} exact hits)")
 
 # Diagnostic sets
 fuzzy_aligned_src = set(fuzzy_map.keys())
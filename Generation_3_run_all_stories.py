@@ -0,0 +1,99 @@
+import argparse
+import ast
+import glob
+import os
+import re
+import runpy
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Runs the Generation_3 matcher for every story under StoryFiles/output_KG_story_*
+# in a process pool, then the Generation_4 cross-story aggregation.
+# Each worker opens the same memory-mapped index (EMBED_INDEX_NPY), so the OS
+# shares its pages; the model is only loaded by workers that miss the cache.
+
+# === CONFIGURABLE ===
+MATCH_SCRIPT = "Generation_3_parse_story_mapping_with_eval_v3.py"
+EVAL_SCRIPT = "Generation_4_story_eval_metrics.py"
+KG_GLOB = "StoryFiles/output_KG_story_*/*_kg_data.json"
+EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"
+NUM_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+
+def script_setting(path, name, default=None):
+    """Literal value of a top-level `NAME = ...` setting in a script, without running it."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError):
+        return default
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name) and node.targets[0].id == name):
+            try:
+                return ast.literal_eval(node.value)
+            except ValueError:
+                return default
+    return default
+
+
+def discover_stories(pattern=KG_GLOB):
+    """Story ids that have a <id>_kg_data.json, in numeric order where possible."""
+    ids = set()
+    for path in glob.glob(pattern):
+        m = re.match(r"(.+)_kg_data\.json$", os.path.basename(path))
+        if m:
+            ids.add(m.group(1))
+    return sorted(ids, key=lambda s: (0, int(s)) if s.isdigit() else (1, s))
+
+
+def run_story(story_id):
+    """Run MATCH_SCRIPT for one story inside this worker process."""
+    os.environ["STORY_ID"] = str(story_id)
+    t0 = time.perf_counter()
+    try:
+        runpy.run_path(MATCH_SCRIPT, run_name="__main__")
+        return story_id, time.perf_counter() - t0, None
+    except BaseException:
+        return story_id, time.perf_counter() - t0, traceback.format_exc()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match tiles for all stories in parallel.")
+    parser.add_argument("--stories", nargs="*", help="story ids (default: every *_kg_data.json found)")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--no-eval", action="store_true", help=f"skip {EVAL_SCRIPT}")
+    args = parser.parse_args()
+
+    stories = args.stories or discover_stories()
+    if not stories:
+        raise SystemExit(f"No stories found for {KG_GLOB}")
+    print(f"[info] Matching {len(stories)} stories with {args.workers} workers: {', '.join(stories)}")
+
+    # build / refresh the binary index (and the quantized copy MATCH_SCRIPT ranks
+    # with) once, before the workers open it
+    if os.path.exists(EMBED_INDEX) or os.path.exists(EMBED_INDEX_NPY):
+        from ObjectEmbeddingIndex import load_index
+        load_index(EMBED_INDEX, EMBED_INDEX_NPY, quantize=script_setting(MATCH_SCRIPT, "QUANTIZE_INDEX"))
+
+    t0 = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_story, sid) for sid in stories]
+        for fut in as_completed(futures):
+            sid, secs, err = fut.result()
+            if err:
+                failed.append(sid)
+                print(f"⚠️ Story {sid} failed after {secs:.1f}s:\n{err}")
+            else:
+                print(f"[✓] Story {sid} matched in {secs:.1f}s")
+    print(f"[info] {len(stories) - len(failed)}/{len(stories)} stories matched in {time.perf_counter() - t0:.1f}s")
+
+    if failed:
+        # Generation_4 on partial outputs would mix this run's stories with stale ones
+        print(f"⚠️ Skipping {EVAL_SCRIPT}; failed stories: {', '.join(sorted(failed))}")
+        raise SystemExit(1)
+    if not args.no_eval:
+        runpy.run_path(EVAL_SCRIPT, run_name="__main__")
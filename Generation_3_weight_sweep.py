@@ -0,0 +1,215 @@
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from ObjectEmbeddingIndex import load_index, FIELDS
+from QueryEmbeddingCache import QueryEmbeddingCache, get_sentence_model
+from AffordanceExpectations import load_expected_affordances, is_probable_character
+
+# Sweep WEIGHTS and the review / confidence thresholds of the Generation_3
+# matcher without re-running the encode-and-scan for every setting: the four
+# (objects x tiles) similarity matrices are computed once per story, cached as
+# .npy, and every configuration is a NumPy re-weight + top-k.
+#
+# Scores come from the float32 ranking matrix, so values can differ from the
+# exact float64 re-score in the detailed matching output in the last digits
+# (and tiles with identical embeddings may swap places within the top-k).
+
+# === CONFIGURABLE ===
+STORY_ID = os.environ.get("STORY_ID", "10")
+STORY_FILE = f"StoryFiles/output_KG_story_{STORY_ID}/{STORY_ID}_kg_data.json"
+EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"
+AFFORD_PRED_FILE = f"StoryFiles/{STORY_ID}_object_affordance_langchain.json"
+USE_PER_SCENE_AFFORD = True
+MIN_PRED_CONF = 0.0
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_CACHE_DIR = "Data/embedding_cache"
+
+SIM_CACHE_DIR = f"StoryFiles/{STORY_ID}_sweep_cache"     # per-field similarity matrices
+OUTPUT_SWEEP = f"StoryFiles/{STORY_ID}_matching_sweep.json"
+
+TOP_K = 3
+WEIGHT_STEP = 0.1                       # weights on the simplex name+group+super+afford = 1
+CONF_THRESH_GRID = [0.40, 0.50, 0.60]
+REVIEW_MARGIN_GRID = [0.03, 0.05, 0.10]
+HIGH_CONF_GRID = [0.60, 0.70, 0.80]
+
+
+def weight_grid(step=WEIGHT_STEP):
+    n = int(round(1.0 / step))
+    for a, b, c in itertools.product(range(n + 1), repeat=3):
+        d = n - a - b - c
+        if d >= 0:
+            yield {"name": round(a * step, 6), "group": round(b * step, 6),
+                   "super": round(c * step, 6), "afford": round(d * step, 6)}
+
+
+def safe_mean(values):
+    return float(np.mean(values)) if len(values) else 0.0
+
+
+# === Similarity tensors (cached per story) ===
+def load_or_compute_sims(index, names):
+    meta_path = os.path.join(SIM_CACHE_DIR, "meta.json")
+    meta = {"model": MODEL_NAME, "index_fingerprint": index.fingerprint(), "names": names}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            cached = json.load(f) == meta
+        if cached:
+            sims = {key: np.load(os.path.join(SIM_CACHE_DIR, f"sim_{key}.npy")) for key, _ in FIELDS}
+            if all(mat.shape == (len(names), len(index)) for mat in sims.values()):
+                print(f"[info] Loaded cached similarity matrices from {SIM_CACHE_DIR}")
+                return sims
+    except (FileNotFoundError, ValueError):
+        pass  # no cache yet, or another run is swapping one in
+
+    cache = QueryEmbeddingCache(MODEL_NAME, cache_dir=EMBED_CACHE_DIR) if EMBED_CACHE_DIR else None
+    if cache is not None:
+        vecs = cache.encode(lambda: get_sentence_model(MODEL_NAME), names)
+        cache.save()
+    else:
+        vecs = get_sentence_model(MODEL_NAME).encode(names, show_progress_bar=False)
+    sims = index.field_similarities(vecs)
+
+    # written into a private dir and renamed in, meta removed first and replaced last
+    os.makedirs(SIM_CACHE_DIR, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=".sims-", dir=SIM_CACHE_DIR)
+    try:
+        for key, mat in sims.items():
+            np.save(os.path.join(work, f"sim_{key}.npy"), mat)
+        with open(os.path.join(work, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        try:
+            os.remove(meta_path)
+        except FileNotFoundError:
+            pass
+        for key, _ in FIELDS:
+            os.replace(os.path.join(work, f"sim_{key}.npy"), os.path.join(SIM_CACHE_DIR, f"sim_{key}.npy"))
+        os.replace(os.path.join(work, "meta.json"), meta_path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    print(f"[info] Cached {len(names)} x {len(index)} similarity matrices in {SIM_CACHE_DIR}")
+    return sims
+
+
+def rank(sims, weights, row_mask, top_k):
+    """(Q, top_k) tile ids and scores for one weight vector; -1 / -inf where fewer rows exist."""
+    total = sum(np.float32(weights[key]) * sims[key] for key, _ in FIELDS)
+    total = np.where(row_mask, total, -np.inf)
+    q = total.shape[0]
+    top = np.full((q, top_k), -1, dtype=np.int64)
+    top_scores = np.full((q, top_k), -np.inf, dtype=total.dtype)
+    k = min(top_k, total.shape[1])
+    if k == 0:
+        return top, top_scores
+    part = np.argpartition(-total, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(total, part, axis=1)
+    order = np.lexsort((part, -part_scores), axis=1)  # score desc, tile id asc
+    top[:, :k] = np.take_along_axis(part, order, axis=1)
+    top_scores[:, :k] = np.take_along_axis(part_scores, order, axis=1)
+    top[~np.isfinite(top_scores)] = -1
+    return top, top_scores
+
+
+def margin(top, top_scores, j):
+    """top1 - top(j+1) score per object, NaN where either candidate is missing."""
+    out = np.full(len(top), np.nan, dtype=top_scores.dtype)
+    if top.shape[1] > j:
+        has = (top[:, 0] >= 0) & (top[:, j] >= 0)
+        out[has] = top_scores[has, 0] - top_scores[has, j]
+    return out
+
+
+def sweep_story(index, names, sims, expected):
+    q = len(names)
+    restrict = np.array([bool(is_probable_character(n)) for n in names], dtype=bool)
+    row_mask = ~restrict[:, None] | index.is_character[None, :]
+    expected_sets = [set(expected.get(n.strip(), [])) for n in names]
+    rows_out = []
+
+    for weights in weight_grid():
+        top, top_scores = rank(sims, weights, row_mask, TOP_K)
+        has1 = top[:, 0] >= 0
+        t1 = np.where(has1, top[:, 0], 0)
+        comp = {key: sims[key][np.arange(q), t1][has1] for key, _ in FIELDS}
+        totals1 = top_scores[has1, 0]
+        m12, m13 = margin(top, top_scores, 1), margin(top, top_scores, 2)
+        has2, has3 = ~np.isnan(m12), ~np.isnan(m13)
+
+        afford_match = np.zeros(q, dtype=bool)
+        afford_known = np.zeros(q, dtype=bool)
+        for i in np.flatnonzero(has1):
+            if expected_sets[i]:
+                afford_known[i] = True
+                afford_match[i] = bool(set(index.affordances[t1[i]]) & expected_sets[i])
+        diversity = len(set(t1[has1].tolist()))
+
+        for conf_t, margin_t, high_t in itertools.product(CONF_THRESH_GRID, REVIEW_MARGIN_GRID, HIGH_CONF_GRID):
+            low = has1 & (top_scores[:, 0] < conf_t)
+            ambiguous = has2 & (m12 < margin_t)
+            needs_review = low | ambiguous | (afford_known & ~afford_match)
+            n_high = int((has1 & (top_scores[:, 0] >= high_t)).sum())
+            n_known = int(afford_known.sum())
+            n_match = int(afford_match.sum())
+            n_review = int(needs_review.sum())
+            rows_out.append({
+                "story_id": STORY_ID,
+                "weights": weights,
+                "num_objects": q,
+                "top_k": TOP_K,
+                "high_conf_threshold": high_t,
+                "conf_thresh_for_review": conf_t,
+                "review_margin_thresh": margin_t,
+
+                "mean_top1_total": safe_mean(totals1),
+                "mean_top1_sim_name": safe_mean(comp["name"]),
+                "mean_top1_sim_group": safe_mean(comp["group"]),
+                "mean_top1_sim_super": safe_mean(comp["super"]),
+                "mean_top1_sim_afford": safe_mean(comp["afford"]),
+
+                "mean_margin_top1_top2": safe_mean(m12[has2]),
+                "mean_margin_top1_top3": safe_mean(m13[has3]),
+
+                "pct_high_conf_at_1": (n_high / q) if q else 0.0,
+                "result_diversity": (diversity / q) if q else 0.0,
+
+                "needs_review_count": n_review,
+                "pct_needs_review": (n_review / q) if q else 0.0,
+
+                "afford_expect_known": n_known,
+                "afford_expect_match": n_match,
+                "afford_expect_match_rate": (n_match / n_known) if n_known else None,
+            })
+    return rows_out
+
+
+if __name__ == "__main__":
+    t0 = time.perf_counter()
+    with open(STORY_FILE, "r", encoding="utf-8") as f:
+        story = json.load(f)
+    names = list(dict.fromkeys(n for data in story["scene_kgs"].values() for n in data["nodes"]))
+
+    index = load_index(EMBED_INDEX, EMBED_INDEX_NPY)
+    sims = load_or_compute_sims(index, names)
+    expected = load_expected_affordances(AFFORD_PRED_FILE, USE_PER_SCENE_AFFORD, MIN_PRED_CONF)
+
+    t1 = time.perf_counter()
+    rows = sweep_story(index, names, sims, expected)
+    sweep_s = time.perf_counter() - t1
+
+    with open(OUTPUT_SWEEP, "w", encoding="utf-8") as fout:
+        json.dump(rows, fout, indent=2)
+    n_weights = len(list(weight_grid()))
+    print(f"[info] {n_weights} weight vectors x {len(rows) // max(1, n_weights)} threshold settings "
+          f"= {len(rows)} configs in {sweep_s:.2f}s (total {time.perf_counter() - t0:.2f}s)")
+
+    scored = [r for r in rows if r["afford_expect_match_rate"] is not None]
+    if scored:
+        best = max(scored, key=lambda r: (r["afford_expect_match_rate"], r["mean_top1_total"]))
+        print(f"[info] Best affordance match rate {best['afford_expect_match_rate']:.2f} "
+              f"with weights {best['weights']}")
+    print(f"[✓] Saved sweep metrics to {OUTPUT_SWEEP}")
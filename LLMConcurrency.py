@@ -0,0 +1,79 @@
+import asyncio
+import random
+import time
+
+# asyncio helpers for issuing many LLM requests at once: a token-bucket rate
+# limiter, retry with exponential backoff + jitter, and a bounded gather that
+# returns results in input order.
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_s = 0.0
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        return cls(requests_per_minute / 60.0, burst)
+
+    async def acquire(self, amount=1.0):
+        """Take `amount` tokens (e.g. estimated LLM tokens for a tokens-per-minute budget)."""
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+                self.waited_s += wait
+                await asyncio.sleep(wait)
+
+    def adjust(self, delta):
+        """Correct an estimate after the fact: +delta refunds tokens, -delta charges more (may go into debt)."""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+async def call_with_retry(fn, retries=4, base_delay=1.0, max_delay=30.0, no_retry=(), stats=None):
+    """Await fn() up to retries + 1 times, sleeping base_delay * 2**attempt (with jitter) between tries."""
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except no_retry:
+            raise
+        except Exception:
+            if attempt == retries:
+                raise
+            if stats is not None:
+                stats["retries"] = stats.get("retries", 0) + 1
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+
+async def gather_bounded(jobs, max_concurrent=8, limiter=None, retries=4, base_delay=1.0, no_retry=(),
+                         stats=None):
+    """Run zero-argument coroutine functions concurrently; results (or exceptions) in input order.
+
+    At most max_concurrent jobs are in flight, each attempt first takes a
+    token from limiter, and failed attempts are retried with backoff.
+    """
+    sem = asyncio.Semaphore(max_concurrent)
+
+    async def attempt(job):
+        if limiter is not None:
+            await limiter.acquire()
+        return await job()
+
+    async def one(job):
+        async with sem:
+            return await call_with_retry(lambda: attempt(job), retries, base_delay, no_retry=no_retry, stats=stats)
+
+    return await asyncio.gather(*(one(job) for job in jobs), return_exceptions=True)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Content-addressed cache for the LangChain LLM calls of the Story_* stages.
+# A response is keyed by (model, temperature, prompt template, variables) and
+# stored in a local SQLite file, so re-running a story to test a downstream
+# change replays the same text without touching the network.
+#
+#   chain = CachedChain(LLMChain(llm=llm, prompt=prompt))
+#   response = chain.run({...})          # same call as before
+#   async for text in chain.astream({...}): ...   # token streaming, stored when complete
+#
+# LLM_CACHE_MODE (environment):
+#   auto    read-through: use the cached response, call the LLM on a miss (default)
+#   replay  offline: never call the LLM; a miss raises LLMCacheMiss immediately
+#   record  always call the LLM and overwrite the cached response (e.g. a fresh story)
+#   off     bypass the cache
+
+# === CONFIGURABLE ===
+LLM_CACHE_DB = os.environ.get("LLM_CACHE_DB", "Data/llm_cache.sqlite")
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "auto")
+CACHE_MODES = ("auto", "replay", "record", "off")
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+class LLMResponseCache:
+    """SQLite table key -> response; one connection shared under a lock."""
+
+    def __init__(self, db_path=LLM_CACHE_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, temperature REAL, prompt TEXT,"
+                " response TEXT NOT NULL, created REAL, hits INTEGER DEFAULT 0)"
+            )
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls = 0
+
+    @staticmethod
+    def key(model, temperature, template, variables):
+        raw = json.dumps([model, temperature, template, variables], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE responses SET hits = hits + 1 WHERE key = ?", (key,))
+            return row[0]
+
+    def put(self, key, model, temperature, prompt_text, response):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, temperature, prompt, response, created, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model, temperature, prompt_text, response, time.time()),
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"db": self.db_path, "entries": entries, "hits": self.hits, "misses": self.misses,
+                "llm_calls": self.llm_calls}
+
+
+_caches = {}
+
+
+def get_cache(db_path=LLM_CACHE_DB):
+    """One LLMResponseCache per database file and process."""
+    if db_path not in _caches:
+        _caches[db_path] = LLMResponseCache(db_path)
+    return _caches[db_path]
+
+
+def llm_identity(llm):
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    return model, getattr(llm, "temperature", None)
+
+
+class CachedChain:
+    """Drop-in wrapper around an LLMChain whose .run() goes through the cache."""
+
+    def __init__(self, chain, mode=None, cache=None):
+        self.chain = chain
+        self.mode = mode or LLM_CACHE_MODE
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM_CACHE_MODE {self.mode!r}; expected one of {CACHE_MODES}")
+        self.cache = None if self.mode == "off" else (cache or get_cache())
+        self.model, self.temperature = llm_identity(chain.llm)
+        self.template = getattr(chain.prompt, "template", None) or repr(chain.prompt)
+
+    def _lookup(self, variables):
+        """(key, cached response or None); raises LLMCacheMiss in replay mode."""
+        key = self.cache.key(self.model, self.temperature, self.template, variables)
+        if self.mode == "record":
+            return key, None
+        cached = self.cache.get(key)
+        if cached is None and self.mode == "replay":
+            raise LLMCacheMiss(f"No cached {self.model} response for prompt {key[:12]} "
+                               f"(LLM_CACHE_MODE=replay, cache {self.cache.db_path})")
+        return key, cached
+
+    def _prompt_text(self, variables):
+        # extra variables (e.g. story_id, used only to key the cache) are not passed to the template
+        names = getattr(self.chain.prompt, "input_variables", None)
+        return self.chain.prompt.format(**({k: variables[k] for k in names} if names is not None else variables))
+
+    def _store(self, key, variables, response):
+        self.cache.llm_calls += 1
+        self.cache.put(key, self.model, self.temperature, self._prompt_text(variables), response)
+
+    def run(self, variables=None):
+        variables = dict(variables or {})
+        if self.cache is None:
+            return self.chain.run(variables)
+        key, cached = self._lookup(variables)
+        if cached is not None:
+            return cached
+        response = self.chain.run(variables)
+        self._store(key, variables, response)
+        return response
+
+    async def arun(self, variables=None):
+        """Async .run() for concurrent callers (LLMChain.arun underneath)."""
+        variables = dict(variables or {})
+        if self.cache is None:
+            return await self.chain.arun(variables)
+        key, cached = self._lookup(variables)
+        if cached is not None:
+            return cached
+        response = await self.chain.arun(variables)
+        self._store(key, variables, response)
+        return response
+
+    async def astream(self, variables=None):
+        """Async generator of response text chunks as the LLM produces them.
+
+        A cached response is yielded as one chunk; a streamed one is stored
+        once complete. The wrapped chain streams through .astream_text() if it
+        has one (FakeChatEndpoint.EndpointChain), else through its LLM's .astream().
+        """
+        variables = dict(variables or {})
+        key = None
+        if self.cache is not None:
+            key, cached = self._lookup(variables)
+            if cached is not None:
+                yield cached
+                return
+        if hasattr(self.chain, "astream_text"):
+            stream = self.chain.astream_text(variables)
+        else:
+            # LangChain chat models yield message chunks; take their text
+            stream = (getattr(chunk, "content", chunk)
+                      async for chunk in self.chain.llm.astream(self._prompt_text(variables)))
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if self.cache is not None:
+            self._store(key, variables, "".join(chunks))
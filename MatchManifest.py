@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+
+# Per-story record of the previous Generation_3 run: for every KG node, the
+# inputs that determine its candidates and the candidates themselves. A node is
+# re-queried only when its text, restriction, the matching settings (weights,
+# top_k, search mode) or the tile index contents change.
+
+MANIFEST_VERSION = 1
+
+
+class MatchManifest:
+    """node inputs -> top-k candidates, persisted as one JSON file."""
+
+    def __init__(self, path, settings):
+        # settings: everything shared by all nodes (weights, top_k, mode, index fingerprint)
+        self.path = path
+        self.settings = settings
+        self._settings_json = json.dumps(settings, sort_keys=True)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+
+    def key(self, text, restrict_to_character, restrict_tags=None):
+        raw = json.dumps([text, bool(restrict_to_character), sorted(restrict_tags) if restrict_tags else None,
+                          self._settings_json])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["candidates"]
+
+    def put(self, key, text, candidates):
+        self.entries[key] = {"text": text, "candidates": candidates}
+
+    def save(self, keep_keys=None):
+        """Write atomically; keep_keys drops entries for nodes no longer in the story."""
+        if keep_keys is not None:
+            keep = set(keep_keys)
+            self.entries = {k: v for k, v in self.entries.items() if k in keep}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+
+    def stats(self):
+        return {"reused": self.hits, "rematched": self.misses, "entries": len(self.entries)}
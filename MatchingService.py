@@ -0,0 +1,366 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Resident tile-matching server: keeps the SentenceTransformer and the
+# ObjectEmbeddingIndex in memory and answers match requests over localhost
+# HTTP or a Unix socket. Requests arriving within BATCH_WINDOW_MS of each
+# other are encoded and scored together.
+#
+#   python MatchingService.py                                # http://127.0.0.1:8765
+#   python MatchingService.py --unix-socket /tmp/match.sock
+#
+# POST /match  {"names": [...], "top_k": 3, "restrict": [null | true | ["Characters", ...], ...],
+#               "weights": {...}}  ->  {"results": [[candidate, ...], ...]}
+# GET  /stats  throughput, p50/p99 latency, batch sizes
+# GET  /health {"ok": true, "index_fingerprint": ..., "model": ..., "quantize": ...}
+#
+# Clients pass the identity of their local index and model to
+# MatchingClient.available(expect=...), so a server that loaded another
+# index, model or quantization is not used.
+
+# === CONFIGURABLE ===
+HOST = "127.0.0.1"
+PORT = 8765
+EMBED_INDEX = "Data/object_embedding_index.jsonl"
+EMBED_INDEX_NPY = "Data/object_embedding_index_npy"
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_CACHE_DIR = "Data/embedding_cache"   # None = always encode
+QUANTIZE_INDEX = None      # None / "float16" / "int8" ranking matrix (exact re-score either way)
+DEFAULT_WEIGHTS = {"name": 0.5, "group": 0.3, "super": 0.1, "afford": 0.1}
+DEFAULT_TOP_K = 3
+ENCODE_BATCH_SIZE = 64
+BATCH_WINDOW_MS = 5        # how long the batcher waits for more requests
+MAX_BATCH_NAMES = 512      # names per combined encode/score pass
+LATENCY_WINDOW = 10000     # requests kept for p50/p99
+
+# client side: set MATCH_SERVER to "http://host:port" or "unix:/path/to.sock"
+MATCH_SERVER_ENV = "MATCH_SERVER"
+DEFAULT_SERVER = f"http://{HOST}:{PORT}"
+
+
+def _validate_request(names, top_k, restrict, weights):
+    """(names, top_k, restrict, weights) checked and normalized; raises ValueError/TypeError."""
+    if isinstance(names, str) or not isinstance(names, (list, tuple)):
+        raise TypeError("names must be a list of strings")
+    names = list(names)
+    if not all(isinstance(n, str) for n in names):
+        raise TypeError("names must be a list of strings")
+    if isinstance(top_k, bool) or not isinstance(top_k, (int, float)) or int(top_k) != top_k or top_k < 0:
+        raise ValueError(f"top_k must be a non-negative integer, got {top_k!r}")
+    restrict = restrict or [None] * len(names)
+    if not isinstance(restrict, (list, tuple)) or len(restrict) != len(names):
+        raise ValueError("restrict must have one entry per name")
+    restrict = list(restrict)
+    for r in restrict:
+        if not (r is None or isinstance(r, bool)
+                or (isinstance(r, list) and all(isinstance(tag, str) for tag in r))):
+            raise ValueError(f"restrict entries must be null, true/false or a list of tags, got {r!r}")
+    weights = weights or DEFAULT_WEIGHTS
+    if not isinstance(weights, dict) or not set(DEFAULT_WEIGHTS) <= set(weights):
+        raise ValueError(f"weights must give all of {sorted(DEFAULT_WEIGHTS)}")
+    if not all(isinstance(weights[k], (int, float)) and not isinstance(weights[k], bool) and np.isfinite(weights[k])
+               for k in DEFAULT_WEIGHTS):
+        raise ValueError("weights must be finite numbers")
+    return names, int(top_k), restrict, weights
+
+
+class _Job:
+    def __init__(self, names, top_k, restrict, weights):
+        self.names = names
+        self.top_k = top_k
+        self.restrict = restrict
+        self.weights = weights
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MatchEngine:
+    """Model + index + a batcher thread that merges concurrent requests."""
+
+    def __init__(self, index, model, embed_cache=None, model_name=MODEL_NAME):
+        self.index = index
+        self.model = model
+        self.model_name = model_name
+        self.embed_cache = embed_cache
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self.finished_at = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.names = 0
+        self.batches = 0
+        self.errors = 0
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+
+    def identity(self):
+        """What the results depend on besides the request: index contents, model, quantization."""
+        return {"index_fingerprint": self.index.fingerprint(), "model": self.model_name,
+                "quantize": self.index.quantized}
+
+    def encode(self, names):
+        if self.embed_cache is not None:
+            return self.embed_cache.encode(self.model, names, batch_size=ENCODE_BATCH_SIZE)
+        return self.model.encode(names, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
+
+    def match(self, names, top_k=DEFAULT_TOP_K, restrict=None, weights=None):
+        """Blocking call used by the HTTP handler threads."""
+        t0 = time.perf_counter()
+        # validated here, so one bad request cannot fail the jobs batched with it
+        job = _Job(*_validate_request(names, top_k, restrict, weights))
+        self.jobs.put(job)
+        job.done.wait()
+        latency = 1000.0 * (time.perf_counter() - t0)
+        with self.lock:
+            self.requests += 1
+            self.names += len(job.names)
+            self.latencies_ms.append(latency)
+            self.finished_at.append(time.time())
+            if job.error is not None:
+                self.errors += 1
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _batch_loop(self):
+        while True:
+            jobs = [self.jobs.get()]
+            n_names = len(jobs[0].names)
+            deadline = time.perf_counter() + BATCH_WINDOW_MS / 1000.0
+            while n_names < MAX_BATCH_NAMES:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                n_names += len(job.names)
+            self._run_batch(jobs)
+
+    def _run_batch(self, jobs):
+        try:
+            unique = list(dict.fromkeys(n for job in jobs for n in job.names))
+            vecs = dict(zip(unique, self.encode(unique))) if unique else {}
+        except Exception as e:
+            for job in jobs:
+                job.error = e
+                job.done.set()
+            return
+        # jobs with the same top_k/weights share one query_batch call; a failing
+        # group only fails its own jobs
+        groups = {}
+        for job in jobs:
+            key = (job.top_k, json.dumps(job.weights, sort_keys=True))
+            groups.setdefault(key, []).append(job)
+        for (top_k, _), members in groups.items():
+            try:
+                names = [n for job in members for n in job.names]
+                flags = [r is True for job in members for r in job.restrict]
+                tags = [r if isinstance(r, list) else None for job in members for r in job.restrict]
+                qv = np.asarray([vecs[n] for n in names]) if names else np.zeros((0, self.index.dim))
+                results = self.index.query_batch(qv, top_k, members[0].weights,
+                                                 restrict_to_character=flags, restrict_tags=tags)
+                pos = 0
+                for job in members:
+                    job.result = results[pos:pos + len(job.names)]
+                    pos += len(job.names)
+            except Exception as e:
+                for job in members:
+                    job.error = e
+            finally:
+                for job in members:
+                    job.done.set()
+        with self.lock:
+            self.batches += 1
+
+    def stats(self):
+        with self.lock:
+            lat = np.asarray(self.latencies_ms, dtype=np.float64)
+            now = time.time()
+            recent = sum(1 for t in self.finished_at if now - t <= 60.0)
+            uptime = now - self.started
+            return {
+                "uptime_s": uptime,
+                "requests": self.requests,
+                "names": self.names,
+                "batches": self.batches,
+                "errors": self.errors,
+                "mean_requests_per_batch": (self.requests / self.batches) if self.batches else None,
+                "throughput_rps": (self.requests / uptime) if uptime else 0.0,
+                "throughput_names_per_s": (self.names / uptime) if uptime else 0.0,
+                "throughput_rps_last_60s": recent / min(60.0, uptime) if uptime else 0.0,
+                "latency_ms_p50": float(np.percentile(lat, 50)) if len(lat) else None,
+                "latency_ms_p99": float(np.percentile(lat, 99)) if len(lat) else None,
+                "num_tiles": len(self.index),
+                **self.identity(),
+                "embedding_cache": self.embed_cache.stats() if self.embed_cache is not None else None,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    engine = None
+
+    def address_string(self):
+        # Unix-socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.engine.stats())
+        elif self.path == "/health":
+            self._send(200, {"ok": True, **self.engine.identity()})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/match":
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            results = self.engine.match(req.get("names", []), req.get("top_k", DEFAULT_TOP_K),
+                                        req.get("restrict"), req.get("weights"))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"results": results})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(engine, host=HOST, port=PORT, unix_socket=None):
+    handler = type("MatchHandler", (_Handler,), {"engine": engine})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, handler)
+        print(f"[info] Matching service listening on unix:{unix_socket}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"[info] Matching service listening on http://{host}:{port}")
+    return server
+
+
+# === Client ===
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class MatchingClient:
+    """Thin client; address is "http://host:port" or "unix:/path/to.sock"."""
+
+    def __init__(self, address=None, timeout=60.0):
+        self.address = address or os.environ.get(MATCH_SERVER_ENV, DEFAULT_SERVER)
+        self.timeout = timeout
+        self.identity = None       # what /health reported on the last available() call
+
+    def _conn(self, timeout):
+        if self.address.startswith("unix:"):
+            return _UnixHTTPConnection(self.address[len("unix:"):], timeout)
+        hostport = self.address.split("://", 1)[-1].rstrip("/")
+        return http.client.HTTPConnection(hostport, timeout=timeout)
+
+    def _request(self, method, path, payload=None, timeout=None):
+        conn = self._conn(timeout or self.timeout)
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body else {}
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = json.loads(resp.read() or b"{}")
+            if resp.status != 200:
+                raise RuntimeError(f"matching service error {resp.status}: {data.get('error')}")
+            return data
+        finally:
+            conn.close()
+
+    def available(self, timeout=0.5, expect=None):
+        """True when the server answers and, for every key in expect (e.g.
+        index_fingerprint, model, quantize), reports the same value."""
+        try:
+            health = self._request("GET", "/health", timeout=timeout)
+        except (OSError, RuntimeError, ValueError):
+            return False
+        if not health.get("ok"):
+            return False
+        self.identity = {k: v for k, v in health.items() if k != "ok"}
+        mismatched = [k for k in (expect or {}) if health.get(k) != expect[k]]
+        if mismatched:
+            print(f"⚠️ Matching service at {self.address} differs from the local setup in "
+                  f"{', '.join(mismatched)}; matching locally")
+            return False
+        return True
+
+    def match(self, names, top_k=DEFAULT_TOP_K, restrict=None, weights=None):
+        payload = {"names": list(names), "top_k": top_k, "restrict": restrict, "weights": weights}
+        return self._request("POST", "/match", payload)["results"]
+
+    def stats(self):
+        return self._request("GET", "/stats")
+
+
+if __name__ == "__main__":
+    import argparse
+    from ObjectEmbeddingIndex import load_index
+    from QueryEmbeddingCache import QueryEmbeddingCache
+
+    parser = argparse.ArgumentParser(description="Resident tile-matching service.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--index", default=EMBED_INDEX)
+    parser.add_argument("--index-npy", default=EMBED_INDEX_NPY)
+    parser.add_argument("--quantize", choices=["int8", "float16"], default=QUANTIZE_INDEX)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(MODEL_NAME)
+    index = load_index(args.index, args.index_npy, quantize=args.quantize)
+    cache = QueryEmbeddingCache(MODEL_NAME, cache_dir=EMBED_CACHE_DIR) if EMBED_CACHE_DIR else None
+    print(f"[info] Loaded {MODEL_NAME} and {len(index)} tiles (index {index.fingerprint()[:12]})")
+
+    server = serve(MatchEngine(index, model, cache, MODEL_NAME), args.host, args.port, args.unix_socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.save()
+        server.server_close()
@@ -0,0 +1,179 @@
+import os
+import tempfile
+import time
+import numpy as np
+
+# IVF defaults: ~sqrt(N) lists, probe a handful of them per query
+DEFAULT_NPROBE = 8
+KMEANS_ITER = 10
+KMEANS_SAMPLE = 100000   # rows used to fit centroids on very large indexes
+ASSIGN_BLOCK = 8192      # rows per block when assigning to centroids
+
+
+def _normalize_rows(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return np.divide(mat, norms, out=np.zeros_like(mat), where=norms > 0)
+
+
+def _assign(vecs, centroids):
+    out = np.empty(len(vecs), dtype=np.int32)
+    for start in range(0, len(vecs), ASSIGN_BLOCK):
+        block = np.asarray(vecs[start:start + ASSIGN_BLOCK], dtype=np.float32)
+        out[start:start + ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def spherical_kmeans(vecs, n_lists, n_iter=KMEANS_ITER, seed=0):
+    """k-means on unit vectors with cosine assignment (pure NumPy)."""
+    rng = np.random.default_rng(seed)
+    if len(vecs) > KMEANS_SAMPLE:
+        vecs = vecs[np.sort(rng.choice(len(vecs), KMEANS_SAMPLE, replace=False))]
+    vecs = np.asarray(vecs, dtype=np.float32)
+    centroids = vecs[rng.choice(len(vecs), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(vecs, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vecs)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vecs[rng.choice(len(vecs), int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class IVFTileIndex:
+    """Inverted-file shortlist over the detailed_name embeddings.
+
+    Tiles are clustered by their name vector; a query probes the n_probe
+    closest clusters and only those rows are scored with the full WEIGHTS
+    formula (float32 pass + exact re-rank in ObjectEmbeddingIndex). Rows
+    without a name vector are kept in a residual list that is always scanned.
+    """
+
+    def __init__(self, index, centroids):
+        self.index = index
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        names = index.field_vectors(0)
+        has_name = index.present["name"]
+
+        # no centroids (index without name vectors): every row is residual
+        assign = _assign(names, self.centroids) if len(self.centroids) else np.full(len(index), -1, dtype=np.int32)
+        assign[~has_name] = -1
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign[assign >= 0], minlength=len(self.centroids))
+        n_residual = int((assign < 0).sum())
+        self.residual = np.sort(order[:n_residual])
+        self.lists_flat = order[n_residual:]
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @classmethod
+    def build(cls, index, n_lists=None, n_iter=KMEANS_ITER, seed=0):
+        n = int(index.present["name"].sum())
+        if n == 0:
+            # nothing to cluster; queries scan the residual list, i.e. every row
+            return cls(index, np.zeros((0, index.dim), dtype=np.float32))
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        names = np.asarray(index.field_vectors(0))[index.present["name"]]
+        return cls(index, spherical_kmeans(names, min(n_lists, n), n_iter=n_iter, seed=seed))
+
+    @classmethod
+    def load_or_build(cls, index, path, n_lists=None, seed=0):
+        """Reuse centroids saved at path (e.g. next to the .npy index) when they were fit on the same index.
+
+        The saved index fingerprint must match, so a rebuilt index with the same
+        tile count but new embeddings (another model, edited tiles) refits them.
+        """
+        fingerprint = index.fingerprint()
+        if path and os.path.exists(path):
+            with np.load(path) as saved:
+                if ("fingerprint" in saved.files and str(saved["fingerprint"]) == fingerprint
+                        and (n_lists is None or saved["centroids"].shape[0] == n_lists)):
+                    return cls(index, saved["centroids"])
+        ivf = cls.build(index, n_lists=n_lists, seed=seed)
+        if path:
+            # per-process temp name: parallel run_all workers may all build at once
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                       dir=os.path.dirname(path) or ".")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, centroids=ivf.centroids, num_tiles=len(index), fingerprint=fingerprint)
+                os.replace(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        return ivf
+
+    def candidate_rows(self, query_vec, n_probe=DEFAULT_NPROBE, restrict_to_character=False, restrict_tags=None):
+        q = _normalize_rows(np.asarray(query_vec)[None, :])[0]
+        n_probe = min(n_probe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ q), n_probe - 1)[:n_probe] if n_probe > 0 else []
+        rows = np.concatenate(
+            [self.lists_flat[self.offsets[c]:self.offsets[c + 1]] for c in probe] + [self.residual]
+        )
+        rows = np.sort(rows)
+        key = self.index.restriction_key(restrict_to_character, restrict_tags)
+        if key is not None:
+            rows = rows[self.index.partition_mask(key)[rows]]
+        return rows
+
+    def query(self, query_vec, top_k, weights, restrict_to_character=False, n_probe=DEFAULT_NPROBE,
+              restrict_tags=None):
+        rows = self.candidate_rows(query_vec, n_probe, restrict_to_character, restrict_tags)
+        if top_k <= 0 or len(rows) == 0:
+            return []
+        scores = self.index.approx_scores(query_vec, weights, rows)
+        tol = self.index.shortlist_tol(weights)
+        return self.index.rerank(query_vec, self.index.shortlist(scores, rows, top_k, tol), top_k, weights)
+
+    def query_batch(self, query_vecs, top_k, weights, restrict_to_character=None, n_probe=DEFAULT_NPROBE,
+                    restrict_tags=None):
+        if restrict_to_character is None:
+            restrict_to_character = [False] * len(query_vecs)
+        if restrict_tags is None:
+            restrict_tags = [None] * len(query_vecs)
+        return [
+            self.query(q, top_k, weights, restrict_to_character=r, n_probe=n_probe, restrict_tags=t)
+            for q, r, t in zip(query_vecs, restrict_to_character, restrict_tags)
+        ]
+
+
+def ann_recall_report(ivf, query_vecs, top_k, weights, restrict_to_character=None, n_probes=(1, 2, 4, 8, 16),
+                      restrict_tags=None):
+    """recall@k and latency of the IVF shortlist against the exact scan.
+
+    recall@k is |ANN top-k ∩ exact top-k| / |exact top-k| over image_path,
+    averaged across queries; one row per n_probe setting.
+    """
+    index = ivf.index
+    if restrict_to_character is None:
+        restrict_to_character = [False] * len(query_vecs)
+    if restrict_tags is None:
+        restrict_tags = [None] * len(query_vecs)
+
+    t0 = time.perf_counter()
+    exact = [index.query(q, top_k, weights, restrict_to_character=r, restrict_tags=t)
+             for q, r, t in zip(query_vecs, restrict_to_character, restrict_tags)]
+    exact_ms = 1000.0 * (time.perf_counter() - t0) / max(1, len(query_vecs))
+
+    report = {"top_k": top_k, "num_queries": len(query_vecs), "num_tiles": len(index),
+              "num_lists": len(ivf.centroids), "exact_ms_per_query": exact_ms, "by_n_probe": []}
+    for n_probe in n_probes:
+        t0 = time.perf_counter()
+        approx = ivf.query_batch(query_vecs, top_k, weights, restrict_to_character, n_probe=n_probe,
+                                 restrict_tags=restrict_tags)
+        ann_ms = 1000.0 * (time.perf_counter() - t0) / max(1, len(query_vecs))
+        recalls, scanned = [], []
+        for q, r, t, ex, ap in zip(query_vecs, restrict_to_character, restrict_tags, exact, approx):
+            truth = {c["image_path"] for c in ex}
+            if truth:
+                recalls.append(len(truth & {c["image_path"] for c in ap}) / len(truth))
+            scanned.append(len(ivf.candidate_rows(q, n_probe, r, t)))
+        report["by_n_probe"].append({
+            "n_probe": n_probe,
+            f"recall_at_{top_k}": float(np.mean(recalls)) if recalls else None,
+            "ann_ms_per_query": ann_ms,
+            "mean_rows_scanned": float(np.mean(scanned)) if scanned else 0.0,
+        })
+    return report
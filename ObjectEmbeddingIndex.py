@@ -0,0 +1,676 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+# (WEIGHTS key, embedding field in object_embedding_index.jsonl)
+FIELDS = (
+    ("name", "detailed_name"),
+    ("group", "group"),
+    ("super", "supercategory"),
+    ("afford", "affordance"),
+)
+
+# Slack on the float32 first pass so the exact re-score never misses a row
+# that float64 would have ranked inside the top-k.
+SCORE_TOL = 1e-4
+
+_cosine = None
+
+
+def _scipy_cosine():
+    # scipy.spatial is imported on the first exact re-score, not at import time
+    global _cosine
+    if _cosine is None:
+        from scipy.spatial.distance import cosine
+        _cosine = cosine
+    return _cosine
+
+
+# On-disk binary layout (see convert_jsonl_to_npy)
+NPY_FORMAT_VERSION = 1
+NPY_META = "meta.json"
+NPY_PRESENT = "present.npy"
+NPY_STACKED = "stacked.npy"
+NPY_OPEN_RETRIES = 20      # from_npy re-opens while a concurrent conversion swaps files in
+NPY_OPEN_RETRY_DELAY = 0.05
+
+# Queries scored per (queries x tiles) block in query_batch; bounds peak memory.
+QUERY_BLOCK = 256
+
+# Optional quantized copy of the stacked matrix ("int8" or "float16"), see QuantizedStack
+QUANT_MODES = ("int8", "float16")
+QUANT_ROW_BLOCK = 32768     # rows upcast to float32 at a time during a scan
+INT8_TOL_SIGMAS = 4.0       # int8 shortlist slack, in std-devs of the rounding error
+
+
+def build_stacked(raw, present, out=None):
+    """(N, 4*D) float32 matrix of L2-normalized field vectors; missing rows stay zero."""
+    n, dim = next(iter(raw.values())).shape
+    stacked = out if out is not None else np.zeros((n, len(FIELDS) * dim), dtype=np.float32)
+    for i, (key, _) in enumerate(FIELDS):
+        mat = np.asarray(raw[key], dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=1)
+        ok = present[key] & (norms > 0)
+        block = stacked[:, i * dim:(i + 1) * dim]
+        block[ok] = mat[ok] / norms[ok, None]
+    return stacked
+
+
+class QuantizedStack:
+    """int8 / float16 stand-in for the stacked float32 matrix.
+
+    int8 keeps one scale per (row, field) vector: codes = round(v / scale).
+    A scan multiplies the codes block-wise with the float32 query and applies
+    the scales to the per-field dot products, so no dequantized matrix is
+    built. float16 stores the normalized vectors directly (no scales).
+    Supports the matrix operations ObjectEmbeddingIndex needs: `@`, row
+    selection and per-field access.
+    """
+
+    def __init__(self, codes, scales, dim):
+        self.codes = codes          # (N, 4*D) int8 or float16
+        self.scales = scales        # (N, 4) float32 for int8, None for float16
+        self.dim = dim
+        self.shape = codes.shape
+        self.mode = "int8" if codes.dtype == np.int8 else "float16"
+
+    @classmethod
+    def quantize(cls, stacked, dim, mode, codes=None, scales=None):
+        """Quantize a stacked matrix block by block (codes/scales may be preallocated memmaps)."""
+        if mode not in QUANT_MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANT_MODES}")
+        n = stacked.shape[0]
+        n_fields = stacked.shape[1] // dim
+        if codes is None:
+            codes = np.empty(stacked.shape, dtype=np.int8 if mode == "int8" else np.float16)
+        if mode == "int8" and scales is None:
+            scales = np.empty((n, n_fields), dtype=np.float32)
+        for start in range(0, n, QUANT_ROW_BLOCK):
+            block = np.asarray(stacked[start:start + QUANT_ROW_BLOCK], dtype=np.float32)
+            if mode == "float16":
+                codes[start:start + len(block)] = block.astype(np.float16)
+                continue
+            fields = block.reshape(len(block), n_fields, dim)
+            scale = np.abs(fields).max(axis=2) / 127.0
+            q = np.divide(fields, scale[:, :, None], out=np.zeros_like(fields), where=scale[:, :, None] > 0)
+            codes[start:start + len(block)] = np.clip(np.rint(q), -127, 127).astype(np.int8).reshape(block.shape)
+            scales[start:start + len(block)] = scale
+        return cls(codes, scales if mode == "int8" else None, dim)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def field_error(self):
+        """Per-field bound on |approx - float32| of a unit-query dot product."""
+        if self.scales is None:
+            # float16 rounding is <= 2**-11 relative per element, so <= 2**-11 on a unit vector
+            return np.full(self.shape[1] // self.dim, 2.0 ** -11, dtype=np.float64)
+        if len(self) == 0:
+            return np.zeros(self.scales.shape[1])
+        # rounding errors are uniform in +-scale/2: std of the dot product = scale / sqrt(12)
+        return INT8_TOL_SIGMAS * np.asarray(self.scales).max(axis=0).astype(np.float64) / np.sqrt(12.0)
+
+    def take(self, rows, axis=0):
+        scales = np.ascontiguousarray(self.scales[rows]) if self.scales is not None else None
+        return QuantizedStack(np.ascontiguousarray(self.codes[rows]), scales, self.dim)
+
+    def __getitem__(self, rows):
+        return self.take(rows)
+
+    def field_dot(self, f, x):
+        """(N, D) field block times x (D, Q) -> (N, Q) float32."""
+        d = self.dim
+        out = np.empty((len(self), x.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), QUANT_ROW_BLOCK):
+            end = min(start + QUANT_ROW_BLOCK, len(self))
+            part = self.codes[start:end, f * d:(f + 1) * d].astype(np.float32) @ x
+            if self.scales is not None:
+                part *= self.scales[start:end, f, None]
+            out[start:end] = part
+        return out
+
+    def field_vectors(self, f):
+        """Dequantized (N, D) float32 vectors of field f."""
+        block = np.asarray(self.codes[:, f * self.dim:(f + 1) * self.dim], dtype=np.float32)
+        return block * self.scales[:, f, None] if self.scales is not None else block
+
+    def __matmul__(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        cols = x[:, None] if x.ndim == 1 else x
+        d = self.dim
+        out = np.zeros((len(self), cols.shape[1]), dtype=np.float32)
+        for f in range(self.shape[1] // d):
+            xf = cols[f * d:(f + 1) * d]
+            if np.any(xf):
+                out += self.field_dot(f, xf)
+        return out[:, 0] if x.ndim == 1 else out
+
+
+def index_fingerprint(image_paths, affordances, raw, present, block=65536):
+    h = hashlib.sha1()
+    h.update(json.dumps([list(image_paths), [list(a or []) for a in affordances]]).encode("utf-8"))
+    for key, _ in FIELDS:
+        h.update(np.ascontiguousarray(present[key]).tobytes())
+        mat = raw[key]
+        h.update(str(mat.dtype).encode("ascii"))
+        for start in range(0, len(mat), block):
+            h.update(np.ascontiguousarray(mat[start:start + block]).tobytes())
+    return h.hexdigest()
+
+
+class ObjectEmbeddingIndex:
+    """Matrix-backed version of the per-row cosine scan used by query_object.
+
+    The four embedding fields are held as one (N, 4*D) float32 matrix of
+    L2-normalized rows, so a weighted query is a single matrix-vector product.
+    The top-k shortlist is then re-scored with scipy's cosine on the raw
+    vectors, giving the same total_score / sim_* values as the old loop.
+    """
+
+    def __init__(self, image_paths, affordances, raw, present, stacked=None, fingerprint=None):
+        # stacked may also be a QuantizedStack (int8 / float16 first pass)
+        # raw[key]: (N, D) unnormalized vectors, present[key]: (N,) bool
+        self.image_paths = list(image_paths)
+        self.affordances = [list(a or []) for a in affordances]
+        self.raw = raw
+        self.present = present
+        self.dim = next(iter(raw.values())).shape[1] if raw else 0
+        self.is_character = np.array(["Characters" in a for a in self.affordances], dtype=bool)
+        self.stacked = stacked if stacked is not None else build_stacked(raw, present)
+
+        # affordance tag -> sorted row ids; a tile with several tags is in each
+        by_tag = {}
+        for row, tags in enumerate(self.affordances):
+            for tag in tags:
+                by_tag.setdefault(tag, []).append(row)
+        self.partitions = {tag: np.asarray(rows, dtype=np.int64) for tag, rows in by_tag.items()}
+        self._partition_cache = {}  # frozenset(tags) -> (rows, contiguous stacked[rows])
+        self._fingerprint = fingerprint
+        self._mask_cache = {}
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        dim = 0
+        for rec in records:
+            for _, field in FIELDS:
+                vec = (rec.get("embedding") or {}).get(field)
+                if vec is not None:
+                    dim = len(vec)
+                    break
+            if dim:
+                break
+
+        n = len(records)
+        raw64 = {key: np.zeros((n, dim), dtype=np.float64) for key, _ in FIELDS}
+        present = {key: np.zeros(n, dtype=bool) for key, _ in FIELDS}
+        for row, rec in enumerate(records):
+            emb = rec.get("embedding") or {}
+            for key, field in FIELDS:
+                vec = emb.get(field)
+                if vec is not None:
+                    raw64[key][row] = vec
+                    present[key][row] = True
+
+        # The index is written from float32 model output, so a float32 copy is
+        # usually lossless; keep float64 only if it is not, to stay exact.
+        raw = {}
+        for key, mat in raw64.items():
+            mat32 = mat.astype(np.float32)
+            raw[key] = mat32 if np.array_equal(mat32.astype(np.float64), mat) else mat
+
+        return cls(
+            [rec["image_path"] for rec in records],
+            [rec.get("affordance", []) for rec in records],
+            raw,
+            present,
+        )
+
+    @classmethod
+    def from_jsonl(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_records(json.loads(line) for line in f if line.strip())
+
+    @classmethod
+    def from_npy(cls, npy_dir, mmap_mode="r"):
+        """Open an index written by convert_jsonl_to_npy without parsing vectors.
+
+        If meta.json is replaced or missing while the arrays are opened (a
+        conversion is swapping files in), the open is retried, so meta and
+        arrays always come from the same conversion.
+        """
+        meta_path = os.path.join(npy_dir, NPY_META)
+        for attempt in range(NPY_OPEN_RETRIES):
+            try:
+                before = _file_identity(meta_path)
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("version") != NPY_FORMAT_VERSION:
+                    break
+                present_mat = np.load(os.path.join(npy_dir, NPY_PRESENT), mmap_mode=mmap_mode)
+                raw = {key: np.load(os.path.join(npy_dir, f"{field}.npy"), mmap_mode=mmap_mode)
+                       for key, field in FIELDS}
+                stacked = np.load(os.path.join(npy_dir, NPY_STACKED), mmap_mode=mmap_mode)
+                if (_file_identity(meta_path) == before
+                        and all(len(a) == meta["count"] for a in [present_mat, stacked, *raw.values()])):
+                    break
+            except (FileNotFoundError, ValueError):
+                # ValueError: np.load read the header of one file and mapped its replacement
+                if attempt == NPY_OPEN_RETRIES - 1:
+                    raise
+            time.sleep(NPY_OPEN_RETRY_DELAY)
+        else:
+            raise RuntimeError(f"{npy_dir} kept changing while it was opened")
+        if meta.get("version") != NPY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {meta.get('version')} in {npy_dir}")
+
+        present = {key: np.asarray(present_mat[:, i], dtype=bool) for i, (key, _) in enumerate(FIELDS)}
+        return cls(meta["image_paths"], meta["affordances"], raw, present, stacked=stacked,
+                   fingerprint=meta.get("fingerprint"))
+
+    def fingerprint(self):
+        """sha1 over tile paths, affordances and vectors; identifies the index contents."""
+        if self._fingerprint is None:
+            self._fingerprint = index_fingerprint(self.image_paths, self.affordances, self.raw, self.present)
+        return self._fingerprint
+
+    @property
+    def quantized(self):
+        return self.stacked.mode if isinstance(self.stacked, QuantizedStack) else None
+
+    def field_vectors(self, i):
+        """(N, D) normalized vectors of field i as used for ranking."""
+        if isinstance(self.stacked, QuantizedStack):
+            return self.stacked.field_vectors(i)
+        return self.stacked[:, i * self.dim:(i + 1) * self.dim]
+
+    def field_similarities(self, query_vecs):
+        """Per-field cosine matrices {key: (Q, N) float32}; missing fields score 0."""
+        q = self.weighted_queries(query_vecs, {key: 1.0 for key, _ in FIELDS})[:, :self.dim]
+        if isinstance(self.stacked, QuantizedStack):
+            return {key: self.stacked.field_dot(i, q.T).T for i, (key, _) in enumerate(FIELDS)}
+        return {
+            key: np.asarray(self.stacked[:, i * self.dim:(i + 1) * self.dim] @ q.T).T
+            for i, (key, _) in enumerate(FIELDS)
+        }
+
+    def shortlist_tol(self, weights):
+        """Slack below the k-th approximate score that still reaches the re-score."""
+        if not isinstance(self.stacked, QuantizedStack):
+            return SCORE_TOL
+        err = self.stacked.field_error()
+        # both the k-th row and a candidate can be off by the field error
+        return SCORE_TOL + 2.0 * sum(abs(weights[key]) * err[i] for i, (key, _) in enumerate(FIELDS))
+
+    # === Scoring ===
+    def weighted_query(self, query_vec, weights):
+        """Concatenate the normalized query once per field, scaled by WEIGHTS."""
+        return self.weighted_queries(np.asarray(query_vec)[None, :], weights)[0]
+
+    def weighted_queries(self, query_vecs, weights):
+        """(Q, D) queries -> (Q, 4*D) rows matching the layout of self.stacked."""
+        q = np.asarray(query_vecs, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = np.divide(q, norms, out=q.copy(), where=norms > 0)
+        return np.concatenate([np.float32(weights[key]) * q for key, _ in FIELDS], axis=1)
+
+    def approx_scores(self, query_vec, weights, rows=None):
+        """float32 weighted cosine for every row (or the given row ids)."""
+        wq = self.weighted_query(query_vec, weights)
+        mat = self.stacked if rows is None else self.stacked[rows]
+        return mat @ wq
+
+    def exact_row(self, query_vec, row, weights):
+        """Score one row exactly as the original query_object loop did."""
+        cosine = _scipy_cosine()
+        sims = {}
+        for key, _ in FIELDS:
+            if self.present[key][row]:
+                sims[key] = 1 - cosine(query_vec, self.raw[key][row].astype(np.float64))
+            else:
+                sims[key] = 0.0
+
+        total = (
+            weights["name"] * sims["name"] +
+            weights["group"] * sims["group"] +
+            weights["super"] * sims["super"] +
+            weights["afford"] * sims["afford"]
+        )
+        return {
+            "image_path": self.image_paths[row],
+            "total_score": float(total),
+            "sim_name": float(sims["name"]),
+            "sim_group": float(sims["group"]),
+            "sim_super": float(sims["super"]),
+            "sim_afford": float(sims["afford"]),
+            "weights": weights,
+            "candidate_affordances": self.affordances[row],
+        }
+
+    def shortlist(self, scores, rows, top_k, tol=SCORE_TOL):
+        """Row ids whose approximate score could place them in the exact top-k."""
+        if len(rows) <= top_k:
+            return rows
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        kth = scores[top].min()
+        return rows[scores >= kth - tol]
+
+    def rerank(self, query_vec, rows, top_k, weights):
+        """Exact re-score of candidate rows; ties keep index order like list.sort."""
+        exact = [(self.exact_row(query_vec, int(r), weights), int(r)) for r in rows]
+        exact.sort(key=lambda t: (-t[0]["total_score"], t[1]))
+        return [row for row, _ in exact[:top_k]]
+
+    # === Affordance partitions ===
+    @staticmethod
+    def restriction_key(restrict_to_character=False, restrict_tags=None):
+        """frozenset of affordance tags a query is limited to, or None for all rows."""
+        if restrict_tags:
+            return frozenset(restrict_tags)
+        if restrict_to_character:
+            return frozenset(["Characters"])
+        return None
+
+    def partition(self, key):
+        """(rows, matrix) for the union of the partitions in key, built once per key."""
+        if key is None:
+            return np.arange(len(self)), self.stacked
+        if key not in self._partition_cache:
+            parts = [self.partitions[t] for t in key if t in self.partitions]
+            rows = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            self._partition_cache[key] = (rows, self.stacked.take(rows, axis=0))
+        return self._partition_cache[key]
+
+    def partition_mask(self, key):
+        if key not in self._mask_cache:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[self.partition(key)[0]] = True
+            self._mask_cache[key] = mask
+        return self._mask_cache[key]
+
+    def candidate_rows(self, restrict_to_character=False, restrict_tags=None):
+        return self.partition(self.restriction_key(restrict_to_character, restrict_tags))[0]
+
+    def query(self, query_vec, top_k, weights, restrict_to_character=False, restrict_tags=None):
+        rows, mat = self.partition(self.restriction_key(restrict_to_character, restrict_tags))
+        if top_k <= 0 or len(rows) == 0:
+            return []
+        scores = mat @ self.weighted_query(query_vec, weights)
+        tol = self.shortlist_tol(weights)
+        return self.rerank(query_vec, self.shortlist(scores, rows, top_k, tol), top_k, weights)
+
+    def query_batch(self, query_vecs, top_k, weights, restrict_to_character=None, restrict_tags=None):
+        """Score many queries as (queries x tiles) matrix products.
+
+        restrict_to_character / restrict_tags are optional per-query lists.
+        Queries are grouped by restriction so each group is scored only
+        against its affordance partition. Returns one candidate list per
+        query, in the same shape as query().
+        """
+        query_vecs = np.asarray(query_vecs)
+        n_q = len(query_vecs)
+        if restrict_to_character is None:
+            restrict_to_character = [False] * n_q
+        if restrict_tags is None:
+            restrict_tags = [None] * n_q
+
+        groups = {}
+        for i in range(n_q):
+            groups.setdefault(self.restriction_key(restrict_to_character[i], restrict_tags[i]), []).append(i)
+
+        results = [[] for _ in range(n_q)]
+        tol = self.shortlist_tol(weights)
+        for key, members in groups.items():
+            rows, mat = self.partition(key)
+            if top_k <= 0 or len(rows) == 0:
+                continue
+            for start in range(0, len(members), QUERY_BLOCK):
+                block_ids = members[start:start + QUERY_BLOCK]
+                block = query_vecs[block_ids]
+                scores = mat @ self.weighted_queries(block, weights).T  # (rows, B)
+                for j, i in enumerate(block_ids):
+                    col = scores[:, j]
+                    results[i] = self.rerank(query_vecs[i], self.shortlist(col, rows, top_k, tol), top_k, weights)
+        return results
+
+
+# === Binary (.npy) index format ===
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _file_identity(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def convert_jsonl_to_npy(jsonl_path, npy_dir):
+    """Stream object_embedding_index.jsonl into per-field .npy blocks.
+
+    Writes <field>.npy (N, D) raw vectors, present.npy (N, 4) bool,
+    stacked.npy (pre-normalized matrix used for ranking) and meta.json with
+    the image_path / affordance table. Vectors are float32 unless the JSON
+    values are not float32-representable, in which case float64 keeps the
+    exact re-score identical to the JSONL path.
+
+    Files are written into a private directory and then renamed into
+    npy_dir, so readers that already mapped the old arrays keep them intact.
+    meta.json is removed before the swap and replaced last.
+    """
+    n, dim, lossless = 0, 0, True
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            emb = json.loads(line).get("embedding") or {}
+            for _, field in FIELDS:
+                vec = emb.get(field)
+                if vec is not None:
+                    dim = dim or len(vec)
+                    arr = np.asarray(vec, dtype=np.float64)
+                    lossless = lossless and np.array_equal(arr.astype(np.float32).astype(np.float64), arr)
+            n += 1
+
+    os.makedirs(npy_dir, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=".convert-", dir=npy_dir)
+    try:
+        return _convert_into(jsonl_path, npy_dir, work, n, dim, lossless)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def _convert_into(jsonl_path, npy_dir, work, n, dim, lossless):
+    dtype = np.float32 if lossless else np.float64
+    open_mm = np.lib.format.open_memmap
+    array_files = [f"{field}.npy" for _, field in FIELDS] + [NPY_PRESENT, NPY_STACKED]
+    raw = {key: open_mm(os.path.join(work, f"{field}.npy"), mode="w+", dtype=dtype, shape=(n, dim))
+           for key, field in FIELDS}
+    present_mat = open_mm(os.path.join(work, NPY_PRESENT), mode="w+", dtype=bool, shape=(n, len(FIELDS)))
+    image_paths, affordances = [], []
+
+    row = 0
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            emb = rec.get("embedding") or {}
+            for i, (key, field) in enumerate(FIELDS):
+                vec = emb.get(field)
+                if vec is not None:
+                    raw[key][row] = vec
+                    present_mat[row, i] = True
+                else:
+                    raw[key][row] = 0
+            image_paths.append(rec["image_path"])
+            affordances.append(rec.get("affordance", []))
+            row += 1
+
+    present = {key: np.asarray(present_mat[:, i]) for i, (key, _) in enumerate(FIELDS)}
+    stacked = open_mm(os.path.join(work, NPY_STACKED), mode="w+", dtype=np.float32,
+                      shape=(n, len(FIELDS) * dim))
+    stacked[:] = 0
+    build_stacked(raw, present, out=stacked)
+    for mat in list(raw.values()) + [present_mat, stacked]:
+        mat.flush()
+
+    meta = {
+        "version": NPY_FORMAT_VERSION,
+        "fingerprint": index_fingerprint(image_paths, affordances, raw, present),
+        "count": n,
+        "dim": dim,
+        "dtype": np.dtype(dtype).name,
+        "fields": [field for _, field in FIELDS],
+        "source": _source_stamp(jsonl_path),
+        "image_paths": image_paths,
+        "affordances": affordances,
+    }
+    del raw, present, present_mat, stacked
+    with open(os.path.join(work, NPY_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # no meta.json while arrays are swapped, so it never describes a mixed set;
+    # from_npy retries until the new one appears
+    meta_path = os.path.join(npy_dir, NPY_META)
+    try:
+        os.remove(meta_path)
+    except FileNotFoundError:
+        pass
+    for name in array_files:
+        os.replace(os.path.join(work, name), os.path.join(npy_dir, name))
+    os.replace(os.path.join(work, NPY_META), meta_path)
+    return meta
+
+
+def load_quantized(npy_dir, stacked, dim, fingerprint, mode):
+    """Open stacked_<mode>.npy in npy_dir, quantizing stacked.npy once if it is missing or stale.
+
+    A new copy is written into a private directory and renamed into npy_dir
+    (meta last), like convert_jsonl_to_npy, so processes that already mapped
+    the old codes keep reading them intact.
+    """
+    codes_name, scales_name, meta_name = f"stacked_{mode}.npy", f"stacked_{mode}_scales.npy", f"stacked_{mode}.json"
+    codes_path = os.path.join(npy_dir, codes_name)
+    scales_path = os.path.join(npy_dir, scales_name)
+    meta_path = os.path.join(npy_dir, meta_name)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            fresh = json.load(f).get("fingerprint") == fingerprint
+        if fresh:
+            codes = np.load(codes_path, mmap_mode="r")
+            scales = np.load(scales_path, mmap_mode="r") if mode == "int8" else None
+            if codes.shape == stacked.shape:
+                return QuantizedStack(codes, scales, dim)
+    except (FileNotFoundError, ValueError):
+        pass  # missing, or another process is swapping a copy in; write our own
+
+    print(f"[info] Writing {mode} copy of the ranking matrix to {npy_dir}")
+    work = tempfile.mkdtemp(prefix=f".quantize-{mode}-", dir=npy_dir)
+    try:
+        open_mm = np.lib.format.open_memmap
+        codes = open_mm(os.path.join(work, codes_name), mode="w+",
+                        dtype=np.int8 if mode == "int8" else np.float16, shape=stacked.shape)
+        scales = None
+        if mode == "int8":
+            scales = open_mm(os.path.join(work, scales_name), mode="w+", dtype=np.float32,
+                             shape=(stacked.shape[0], stacked.shape[1] // dim))
+        nbytes = QuantizedStack.quantize(stacked, dim, mode, codes=codes, scales=scales).nbytes
+        for mat in (codes, scales):
+            if mat is not None:
+                mat.flush()
+        del codes, scales
+        with open(os.path.join(work, meta_name), "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "mode": mode, "nbytes": nbytes}, f)
+
+        try:
+            os.remove(meta_path)
+        except FileNotFoundError:
+            pass
+        os.replace(os.path.join(work, codes_name), codes_path)
+        if mode == "int8":
+            os.replace(os.path.join(work, scales_name), scales_path)
+        os.replace(os.path.join(work, meta_name), meta_path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    codes = np.load(codes_path, mmap_mode="r")
+    scales = np.load(scales_path, mmap_mode="r") if mode == "int8" else None
+    return QuantizedStack(codes, scales, dim)
+
+
+_loaded = {}  # (jsonl_path, npy_dir, quantize) -> (meta mtime, index), reused across script runs in one process
+
+
+def load_index(jsonl_path, npy_dir=None, quantize=None):
+    """Open the .npy index when available (converting once if it is missing or
+    stale relative to the JSONL), otherwise fall back to parsing the JSONL.
+
+    quantize="int8" / "float16" ranks with a quantized copy of the stacked
+    matrix (written next to the .npy index) and re-scores exactly as before.
+    """
+    if quantize is not None and quantize not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode {quantize!r}; expected one of {QUANT_MODES}")
+    if not npy_dir:
+        index = ObjectEmbeddingIndex.from_jsonl(jsonl_path)
+        if quantize:
+            qs = QuantizedStack.quantize(index.stacked, index.dim, quantize)
+            index = ObjectEmbeddingIndex(index.image_paths, index.affordances, index.raw, index.present,
+                                         stacked=qs, fingerprint=index.fingerprint())
+        return index
+
+    meta_path = os.path.join(npy_dir, NPY_META)
+    stale = not os.path.exists(meta_path)
+    if not stale and os.path.exists(jsonl_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            recorded = json.load(f).get("source", {})
+        current = _source_stamp(jsonl_path)
+        stale = (recorded.get("size"), recorded.get("mtime_ns")) != (current["size"], current["mtime_ns"])
+    if stale:
+        if not os.path.exists(jsonl_path):
+            raise FileNotFoundError(f"No index at {npy_dir} and no source JSONL at {jsonl_path}")
+        print(f"[info] Converting {jsonl_path} -> {npy_dir} (binary index)")
+        convert_jsonl_to_npy(jsonl_path, npy_dir)
+
+    key = (os.path.abspath(jsonl_path), os.path.abspath(npy_dir), quantize)
+    try:
+        stamp = os.stat(meta_path).st_mtime_ns
+    except FileNotFoundError:
+        stamp = None               # another process is swapping a conversion in; from_npy waits for it
+    if stamp is None or key not in _loaded or _loaded[key][0] != stamp:
+        index = ObjectEmbeddingIndex.from_npy(npy_dir)
+        if quantize:
+            qs = load_quantized(npy_dir, index.stacked, index.dim, index.fingerprint(), quantize)
+            index = ObjectEmbeddingIndex(index.image_paths, index.affordances, index.raw, index.present,
+                                         stacked=qs, fingerprint=index.fingerprint())
+        _loaded[key] = (stamp, index)
+    return _loaded[key][1]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert object_embedding_index.jsonl to the .npy index format.")
+    parser.add_argument("jsonl", nargs="?", default="Data/object_embedding_index.jsonl")
+    parser.add_argument("out_dir", nargs="?", default="Data/object_embedding_index_npy")
+    parser.add_argument("--quantize", choices=QUANT_MODES, action="append", default=[],
+                        help="also write a quantized ranking matrix (repeatable)")
+    args = parser.parse_args()
+
+    meta = convert_jsonl_to_npy(args.jsonl, args.out_dir)
+    print(f"[✓] Wrote {meta['count']} tiles x {len(FIELDS)} fields ({meta['dtype']}) to {args.out_dir}")
+    for mode in args.quantize:
+        stacked = np.load(os.path.join(args.out_dir, NPY_STACKED), mmap_mode="r")
+        qs = load_quantized(args.out_dir, stacked, meta["dim"], meta["fingerprint"], mode)
+        print(f"[✓] {mode}: {qs.nbytes / 2**20:.1f} MiB vs {stacked.nbytes / 2**20:.1f} MiB float32")
@@ -0,0 +1,231 @@
+import json
+import os
+import time
+import numpy as np
+from ObjectEmbeddingIndex import FIELDS
+from QueryEmbeddingCache import QueryEmbeddingCache, get_sentence_model
+
+# Builds (or extends) Data/object_embedding_index.jsonl from GameTileNet asset
+# label records, one JSON object per line:
+#
+#   {"image_path": "...", "detailed_name": "wooden chest", "group": "container",
+#    "supercategory": "furniture", "affordance": ["Interactive Object"]}
+#
+# Records are streamed in chunks; within a chunk every distinct text is encoded
+# once, and a builder-only embedding cache (EMBED_CACHE_DIR, kept apart from the
+# story-query cache) carries repeated texts (groups, supercategories,
+# affordance lists) across chunks and runs. After each chunk the output is
+# fsync'ed and a checkpoint records the committed byte offset, so an
+# interrupted build resumes where it stopped. Tiles already in the output are
+# skipped, which also makes re-running with a larger label file an append.
+#
+#   python ObjectEmbeddingIndexBuilder.py Data/object_labels.jsonl
+
+# === CONFIGURABLE ===
+LABELS_FILE = "Data/object_labels.jsonl"
+OUTPUT_INDEX = "Data/object_embedding_index.jsonl"
+MODEL_NAME = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 256
+CHUNK_RECORDS = 2048             # records per encode + checkpoint step
+EMBED_CACHE_DIR = "Data/embedding_cache_tiles"   # separate from the story-query cache; None = only de-duplicate within a chunk
+TAIL_BLOCK = 65536               # bytes read at a time when looking for the last complete row
+
+# label-record aliases for each embedding field
+FIELD_ALIASES = {
+    "detailed_name": ("detailed_name", "name"),
+    "group": ("group",),
+    "supercategory": ("supercategory", "super"),
+    "affordance": ("affordance", "affordances"),
+}
+
+
+def iter_label_records(path):
+    """Stream label records from JSONL (or a JSON list, loaded whole)."""
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def affordance_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [a.strip() for a in value.split(",") if a.strip()]
+    return [str(a) for a in value]
+
+
+def label_texts(rec):
+    """embedding field -> text to encode (None when the label is missing)."""
+    texts = {}
+    for _, field in FIELDS:
+        value = next((rec[k] for k in FIELD_ALIASES[field] if rec.get(k)), None)
+        if field == "affordance":
+            value = ", ".join(affordance_list(value)) or None
+        texts[field] = " ".join(str(value).split()) if value else None
+    return texts
+
+
+# === Checkpointing ===
+def checkpoint_path(output_path):
+    return output_path + ".progress.json"
+
+
+def complete_rows_end(output_path, size):
+    """Byte offset just past the last complete row, read backwards from the end.
+
+    A final row without a trailing newline is kept when it parses as a full
+    index row; the newline is then added so appends start on a new line.
+    """
+    with open(output_path, "r+b") as f:
+        start, tail = size, b""
+        while start > 0 and b"\n" not in tail:
+            step = min(TAIL_BLOCK, start)
+            start -= step
+            f.seek(start)
+            tail = f.read(step) + tail
+        cut = tail.rfind(b"\n") + 1          # 0 when the whole file is one row
+        rest = tail[cut:]
+        if not rest.strip():
+            return size
+        try:
+            row = json.loads(rest)
+        except ValueError:
+            return start + cut                # partial row from an interrupted write
+        if not (isinstance(row, dict) and "image_path" in row and "embedding" in row):
+            return start + cut
+        f.seek(size)
+        f.write(b"\n")
+        return size + 1
+
+
+def read_existing(output_path):
+    """Trim the output back to its last checkpoint and return the tiles it holds."""
+    if not os.path.exists(output_path):
+        return set()
+
+    committed = None
+    ckpt = checkpoint_path(output_path)
+    if os.path.exists(ckpt):
+        with open(ckpt, "r", encoding="utf-8") as f:
+            committed = json.load(f).get("committed_bytes")
+    size = os.path.getsize(output_path)
+    if committed is None or committed > size:
+        # no usable checkpoint (e.g. first --append to a prebuilt index): keep every complete row
+        committed = complete_rows_end(output_path, size)
+        size = os.path.getsize(output_path)
+    if committed < size:
+        print(f"[info] Discarding {size - committed} bytes written after the last checkpoint")
+        with open(output_path, "r+b") as f:
+            f.truncate(committed)
+
+    done = set()
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                done.add(json.loads(line)["image_path"])
+    return done
+
+
+def write_checkpoint(output_path, committed_bytes, rows, labels_path):
+    tmp = checkpoint_path(output_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"labels": os.path.abspath(labels_path), "committed_bytes": committed_bytes,
+                   "rows": rows, "updated": time.time()}, f)
+    os.replace(tmp, checkpoint_path(output_path))
+
+
+# === Build ===
+def encode_texts(texts, cache, batch_size):
+    """Encode distinct texts once; returns text -> float32 vector."""
+    unique = list(dict.fromkeys(texts))
+    if not unique:
+        return {}
+    if cache is not None:
+        vecs = cache.encode(lambda: get_sentence_model(MODEL_NAME), unique, batch_size=batch_size)
+    else:
+        vecs = get_sentence_model(MODEL_NAME).encode(unique, batch_size=batch_size, show_progress_bar=False)
+    return dict(zip(unique, np.asarray(vecs, dtype=np.float32)))
+
+
+def build_index(labels_path=LABELS_FILE, output_path=OUTPUT_INDEX, batch_size=ENCODE_BATCH_SIZE,
+                chunk_records=CHUNK_RECORDS, cache_dir=EMBED_CACHE_DIR):
+    done = read_existing(output_path)
+    if done:
+        print(f"[info] {len(done)} tiles already in {output_path}; only new tiles are encoded")
+    cache = QueryEmbeddingCache(MODEL_NAME, cache_dir=cache_dir) if cache_dir else None
+
+    stats = {"added": 0, "skipped_existing": 0, "skipped_invalid": 0, "texts": 0, "unique_texts": 0}
+    t0 = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as fout:
+
+        def flush(chunk):
+            chunk_texts = [label_texts(rec) for rec in chunk]
+            all_texts = [t for texts in chunk_texts for t in texts.values() if t]
+            vec_by_text = encode_texts(all_texts, cache, batch_size)
+            stats["texts"] += len(all_texts)
+            stats["unique_texts"] += len(vec_by_text)
+            for rec, texts in zip(chunk, chunk_texts):
+                out = {
+                    "image_path": rec["image_path"],
+                    "detailed_name": texts["detailed_name"],
+                    "group": texts["group"],
+                    "supercategory": texts["supercategory"],
+                    "affordance": affordance_list(rec.get("affordance") or rec.get("affordances")),
+                    "embedding": {field: vec_by_text[t].tolist() if t else None for field, t in texts.items()},
+                }
+                fout.write(json.dumps(out, ensure_ascii=False) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+            stats["added"] += len(chunk)
+            write_checkpoint(output_path, fout.tell(), len(done), labels_path)
+            print(f"[info] {stats['added']} tiles encoded ({time.perf_counter() - t0:.1f}s)")
+
+        chunk = []
+        for rec in iter_label_records(labels_path):
+            path = rec.get("image_path")
+            if not path:
+                stats["skipped_invalid"] += 1
+                continue
+            if path in done:
+                stats["skipped_existing"] += 1
+                continue
+            done.add(path)
+            chunk.append(rec)
+            if len(chunk) >= chunk_records:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+    if cache is not None:
+        cache.save()
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or extend object_embedding_index.jsonl from label records.")
+    parser.add_argument("labels", nargs="?", default=LABELS_FILE)
+    parser.add_argument("--output", default=OUTPUT_INDEX)
+    parser.add_argument("--batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--chunk", type=int, default=CHUNK_RECORDS)
+    parser.add_argument("--no-cache", action="store_true", help=f"do not use the embedding cache in {EMBED_CACHE_DIR}")
+    args = parser.parse_args()
+
+    stats = build_index(args.labels, args.output, args.batch_size, args.chunk,
+                        None if args.no_cache else EMBED_CACHE_DIR)
+    print(f"[info] {stats['texts']} label texts, {stats['unique_texts']} encoded after de-duplication; "
+          f"skipped {stats['skipped_existing']} existing / {stats['skipped_invalid']} without image_path")
+    print(f"[✓] Added {stats['added']} tiles to {args.output} in {stats['seconds']:.1f}s")
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Set NARRATIVE_NO_PLOT=1 (or pass --no-plot) to run the pipeline headless.
+NO_PLOT_ENV = "NARRATIVE_NO_PLOT"
+
+
+def no_plot_requested():
+    """True when the script was started with --no-plot or NARRATIVE_NO_PLOT=1."""
+    return "--no-plot" in sys.argv[1:] or os.environ.get(NO_PLOT_ENV, "") not in ("", "0")
+
+
+def get_pyplot(headless=False):
+    """Import matplotlib.pyplot on first use.
+
+    headless=True selects the Agg backend, for scripts that only savefig()
+    and never open a window.
+    """
+    import matplotlib
+    if headless:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+CACHE_DIR = "Data/embedding_cache"
+MAX_ENTRIES = 200000
+INITIAL_CAPACITY = 1024
+
+
+_models = {}
+
+
+def get_sentence_model(model_name):
+    """SentenceTransformer shared by every script run in this process."""
+    if model_name not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[model_name] = SentenceTransformer(model_name)
+    return _models[model_name]
+
+
+def model_dir_name(model_name):
+    """Readable, collision-free directory name for a model's vectors."""
+    safe = re.sub(r"[^\w.-]+", "_", model_name).strip("_") or "model"
+    return f"{safe}-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:8]}"
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """Content-addressed cache of query-text embeddings.
+
+    Keys are sha1(model name, normalized text). Each model gets its own
+    subdirectory of cache_dir (its vectors have their own dimension), so
+    several models can share one cache_dir. Vectors live in a float32
+    .npy file opened with mmap; a JSON key index maps each key to its slot and
+    a last-used tick for LRU eviction once MAX_ENTRIES is reached. Index
+    writes go through a temp file + os.replace so a crash never leaves a key
+    pointing at a half-written vector.
+    """
+
+    def __init__(self, model_name, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, model_dir_name(model_name))
+        self.max_entries = max_entries
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.npy")
+        self.index_path = os.path.join(self.cache_dir, "keys.json")
+        self.lock_path = os.path.join(self.cache_dir, ".lock")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index_mtime = None
+        self._vectors = None
+        self._dirty = False
+        self._load_index()
+
+    # === Persistence helpers ===
+    def _lock(self):
+        fh = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        return fh
+
+    def _unlock(self, fh):
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+        fh.close()
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        else:
+            data = {}
+        self.dim = data.get("dim")
+        self.tick = data.get("tick", 0)
+        self.entries = data.get("entries", {})  # key -> [slot, last_used_tick]
+        self._vectors = None
+
+    def _reload_if_changed(self):
+        if not os.path.exists(self.index_path):
+            return
+        if os.stat(self.index_path).st_mtime_ns != self._index_mtime:
+            # another writer updated the cache; keep our newer LRU ticks
+            ours = {k: v[1] for k, v in self.entries.items()}
+            our_tick = self.tick
+            self._load_index()
+            self.tick = max(self.tick, our_tick)
+            for k, t in ours.items():
+                if k in self.entries and t > self.entries[k][1]:
+                    self.entries[k][1] = t
+
+    def _write_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "tick": self.tick, "entries": self.entries}, f)
+        os.replace(tmp, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        self._dirty = False
+
+    def _open_vectors(self):
+        if self._vectors is None and os.path.exists(self.vectors_path):
+            self._vectors = np.load(self.vectors_path, mmap_mode="r+")
+        return self._vectors
+
+    def _ensure_capacity(self, n_slots):
+        vecs = self._open_vectors()
+        cap = 0 if vecs is None else vecs.shape[0]
+        if cap >= n_slots:
+            return
+        new_cap = max(INITIAL_CAPACITY, cap)
+        while new_cap < n_slots:
+            new_cap *= 2
+        new_cap = min(new_cap, self.max_entries)
+        tmp = self.vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(new_cap, self.dim))
+        if cap:
+            grown[:cap] = vecs
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(tmp, self.vectors_path)
+
+    # === Public API ===
+    def key(self, text):
+        raw = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def get_many(self, texts):
+        """Return a list of vectors (or None for misses), updating LRU ticks."""
+        fh = self._lock()
+        try:
+            self._reload_if_changed()
+            vecs = self._open_vectors()
+            out = []
+            for text in texts:
+                entry = self.entries.get(self.key(text))
+                if entry is None or vecs is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.hits += 1
+                self.tick += 1
+                entry[1] = self.tick
+                self._dirty = True
+                out.append(np.array(vecs[entry[0]], dtype=np.float32))
+            return out
+        finally:
+            self._unlock(fh)
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        fh = self._lock()
+        try:
+            self._reload_if_changed()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.ndim != 2 or vectors.shape[1] != self.dim:
+                raise ValueError(f"{self.model_name} cache in {self.cache_dir} holds {self.dim}-d vectors, "
+                                 f"got shape {vectors.shape}")
+
+            new = {}
+            for text, vec in zip(texts, vectors):
+                k = self.key(text)
+                if k not in self.entries:
+                    new[k] = vec
+            if not new:
+                return
+            if len(new) > self.max_entries:
+                new = dict(list(new.items())[-self.max_entries:])
+
+            # free slots: evict least-recently-used keys, and drop them from the
+            # on-disk index before their slots are overwritten
+            used = {slot for slot, _ in self.entries.values()}
+            free = [s for s in range(len(self.entries) + len(new)) if s not in used and s < self.max_entries]
+            n_evict = len(new) - len(free)
+            if n_evict > 0:
+                lru = sorted(self.entries.items(), key=lambda kv: kv[1][1])[:n_evict]
+                for k, (slot, _) in lru:
+                    del self.entries[k]
+                    free.append(slot)
+                self.evictions += n_evict
+                self._write_index()
+
+            slots = free[:len(new)]
+            self._ensure_capacity(max(slots) + 1)
+            vecs = self._open_vectors()
+            for slot, vec in zip(slots, new.values()):
+                vecs[slot] = vec
+            vecs.flush()
+
+            for slot, k in zip(slots, new.keys()):
+                self.tick += 1
+                self.entries[k] = [slot, self.tick]
+            self._write_index()
+        finally:
+            self._unlock(fh)
+
+    def save(self):
+        """Persist LRU ticks touched by hits since the last write."""
+        if not self._dirty:
+            return
+        fh = self._lock()
+        try:
+            self._reload_if_changed()
+            self._write_index()
+        finally:
+            self._unlock(fh)
+
+    def encode(self, model, texts, batch_size=32):
+        """Return an (N, D) array for texts, calling model.encode only on misses.
+
+        model may also be a zero-argument function returning the model; it is
+        only called when there is at least one miss.
+        """
+        texts = list(texts)
+        cached = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            if not hasattr(model, "encode"):
+                model = model()
+            fresh = model.encode(missing, batch_size=batch_size, show_progress_bar=False)
+            self.put_many(missing, fresh)
+            fresh_by_text = dict(zip(missing, fresh))
+            cached = [v if v is not None else fresh_by_text[t] for t, v in zip(texts, cached)]
+        return np.asarray(cached, dtype=np.float32)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else None,
+        }
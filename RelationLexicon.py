@@ -0,0 +1,249 @@
+import json
+import os
+import re
+
+# Persistent relation phrase -> spatial category lexicon for Story_1 v4.
+# Every mapping a story's LLM output contains is merged in as a vote, so the
+# lexicon grows with each story; relations the story left unmapped are filled
+# from it before any follow-up LLM call is made. Lookup order:
+#
+#   exact       canonical phrase (lowercase, quotes/punctuation stripped)
+#   category    phrase naming a category ("to the left of", "sits on top of")
+#   lemma       crude stem key: plural/-ing/-ed/final e stripped, articles, "is" and -ly adverbs dropped
+#   fuzzy       closest lemma key with ratio >= FUZZY_THRESHOLD
+#   preposition trailing spatial preposition ("hovers over" -> above)
+#
+# Negated phrases ("is not on", "isn't above") are only answered by an exact
+# entry; otherwise they go to the follow-up call rather than being mapped to
+# the relation they negate.
+#
+#   python RelationLexicon.py --bootstrap StoryFiles/*_adventure_scene_output_FIXED.json
+#   python RelationLexicon.py "hides underneath" "towers over"
+
+# === CONFIGURABLE ===
+RELATION_LEXICON = "Data/relation_lexicon.json"
+FUZZY_THRESHOLD = 88.0         # 0..100
+MAX_PHRASE_WORDS = 4           # longer "relations" are sentences the parser picked up, not phrases
+
+LEXICON_VERSION = 1
+SPATIAL_CATEGORIES = ("above", "below", "at the right of", "at the left of", "on top of")
+
+PREPOSITION_CATEGORIES = {
+    "above": "above", "over": "above", "overhead": "above",
+    "below": "below", "under": "below", "beneath": "below", "underneath": "below", "underground": "below",
+    "on": "on top of", "onto": "on top of", "upon": "on top of", "atop": "on top of",
+}
+# checked in this order, so "on top of" wins over a bare "above"/"below" elsewhere in the phrase
+CATEGORY_PATTERNS = (
+    ("on top of", re.compile(r"\bon top of\b")),
+    ("at the right of", re.compile(r"\b(?:the )?right of\b")),
+    ("at the left of", re.compile(r"\b(?:the )?left of\b")),
+    ("above", re.compile(r"\babove\b")),
+    ("below", re.compile(r"\bbelow\b")),
+)
+NEGATION_WORDS = {"not", "no", "never", "nowhere", "nor"}
+_DROP_WORDS = {"a", "an", "the", "is", "are", "was", "were", "be"}
+_IRREGULAR = {"stood": "stand", "lay": "lie", "lies": "lie", "hid": "hide", "held": "hold", "sat": "sit",
+              "led": "lead", "flew": "fly", "hung": "hang", "rose": "rise"}
+
+try:
+    from rapidfuzz import fuzz
+    _USE_RAPIDFUZZ = True
+except Exception:
+    from difflib import SequenceMatcher
+    _USE_RAPIDFUZZ = False
+
+
+def _ratio(a, b):
+    if _USE_RAPIDFUZZ:
+        return float(fuzz.ratio(a, b))
+    return 100.0 * SequenceMatcher(None, a, b).ratio()
+
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+
+
+def canonical(phrase):
+    s = _PUNCT_RE.sub(" ", (phrase or "").lower().replace("_", " "))
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def _undouble(base):
+    # running -> runn -> run, stopped -> stopp -> stop
+    if len(base) > 3 and base[-1] == base[-2] and base[-1] not in "aeiouls":
+        return base[:-1]
+    return base
+
+
+def _lemma(tok):
+    # crude stem rather than a dictionary lemma: hides / hiding / hide -> hid
+    tok = _strip_suffix(tok)
+    if len(tok) > 3 and tok.endswith("e") and not tok.endswith("ee"):
+        return tok[:-1]
+    return tok
+
+
+def _strip_suffix(tok):
+    if tok in _IRREGULAR:
+        return _IRREGULAR[tok]
+    if len(tok) > 4 and tok.endswith("ies"):
+        return tok[:-3] + "y"
+    if len(tok) > 5 and tok.endswith("ing"):
+        return _undouble(tok[:-3])
+    if len(tok) > 4 and tok.endswith("ed"):
+        return _undouble(tok[:-2])
+    if tok.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return tok[:-2]
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith(("ss", "us")):
+        return tok[:-1]
+    return tok
+
+
+def lemma_key(phrase):
+    tokens = [t for t in canonical(phrase).split()
+              if t not in _DROP_WORDS and not (len(t) > 4 and t.endswith("ly"))]
+    return " ".join(_lemma(t) for t in tokens)
+
+
+def is_negated(phrase):
+    """True for "is not on", "no longer above", "isn't under" and the like."""
+    if re.search(r"n[’']t\b", (phrase or "").lower()):
+        return True
+    return any(tok in NEGATION_WORDS for tok in canonical(phrase).split())
+
+
+def named_category(phrase):
+    """The category a phrase spells out ("to the left of" -> "at the left of"), or None."""
+    key = canonical(phrase)
+    for category, pattern in CATEGORY_PATTERNS:
+        if pattern.search(key):
+            return category
+    return None
+
+
+def spatial_category(value):
+    """The allowed category named by an LLM answer, or None ("above, below" and the like are rejected)."""
+    value = canonical(value)
+    return value if value in SPATIAL_CATEGORIES else None
+
+
+class RelationLexicon:
+    """canonical phrase -> {"category", "votes", "sources"}, persisted as one JSON file."""
+
+    def __init__(self, path=RELATION_LEXICON):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == LEXICON_VERSION:
+                self.entries = data.get("relations", {})
+        self._by_lemma = {}
+        for key in self.entries:
+            self._index(key)
+        self.stats = {"exact": 0, "category": 0, "lemma": 0, "fuzzy": 0, "preposition": 0, "unknown": 0,
+                      "learned": 0}
+
+    def _index(self, key):
+        lemma = lemma_key(key)
+        other = self._by_lemma.get(lemma)
+        if other is None or self._weight(key) > self._weight(other):
+            self._by_lemma[lemma] = key
+
+    def _weight(self, key):
+        return sum(self.entries[key]["votes"].values())
+
+    def add(self, phrase, category, source=None):
+        """Record one vote phrase -> category; returns False if either is unusable."""
+        key, category = canonical(phrase), spatial_category(category)
+        if not key or category is None or len(key.split()) > MAX_PHRASE_WORDS:
+            return False
+        entry = self.entries.setdefault(key, {"category": category, "votes": {}, "sources": []})
+        entry["votes"][category] = entry["votes"].get(category, 0) + 1
+        entry["category"] = max(entry["votes"], key=lambda c: (entry["votes"][c], c == entry["category"]))
+        if source is not None and source not in entry["sources"]:
+            entry["sources"].append(source)
+        self._index(key)
+        self.stats["learned"] += 1
+        return True
+
+    def merge(self, mapping, source=None):
+        return sum(self.add(phrase, category, source) for phrase, category in mapping.items())
+
+    def lookup(self, phrase):
+        """(category, method) or (None, None)."""
+        key = canonical(phrase)
+        if key in self.entries:
+            return self.entries[key]["category"], "exact"
+        if is_negated(phrase):
+            return None, None
+        category = named_category(key)
+        if category is not None:
+            return category, "category"
+        lemma = lemma_key(phrase)
+        if lemma in self._by_lemma:
+            return self.entries[self._by_lemma[lemma]]["category"], "lemma"
+        if lemma:
+            best, best_score = None, FUZZY_THRESHOLD
+            for other in self._by_lemma:
+                score = _ratio(lemma, other)
+                if score >= best_score:
+                    best, best_score = other, score
+            if best is not None:
+                return self.entries[self._by_lemma[best]]["category"], "fuzzy"
+            tail = key.split()[-1]
+            if tail in PREPOSITION_CATEGORIES:
+                return PREPOSITION_CATEGORIES[tail], "preposition"
+        return None, None
+
+    def fill(self, relations, mapping):
+        """Add lexicon categories for relations missing from mapping; returns the ones still unknown."""
+        missing = []
+        for rel in sorted(relations):
+            if rel in mapping:
+                continue
+            category, method = self.lookup(rel)
+            if category is None:
+                self.stats["unknown"] += 1
+                missing.append(rel)
+            else:
+                self.stats[method] += 1
+                mapping[rel] = category
+        return missing
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": LEXICON_VERSION, "relations": self.entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def summary(self):
+        return {**self.stats, "entries": len(self.entries)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or bootstrap the relation -> spatial category lexicon.")
+    parser.add_argument("relations", nargs="*")
+    parser.add_argument("--lexicon", default=RELATION_LEXICON)
+    parser.add_argument("--bootstrap", nargs="+", metavar="STORY_JSON",
+                        help="merge the relation_mapping of existing *_adventure_scene_output_FIXED.json files")
+    args = parser.parse_args()
+
+    lexicon = RelationLexicon(args.lexicon)
+    if args.bootstrap:
+        for path in args.bootstrap:
+            with open(path, "r", encoding="utf-8") as f:
+                mapping = json.load(f).get("relation_mapping", {})
+            added = lexicon.merge(mapping, source=os.path.basename(path))
+            print(f"[info] {path}: {added}/{len(mapping)} mappings merged")
+        lexicon.save()
+        print(f"[✓] {len(lexicon.entries)} relations in {args.lexicon}")
+    for rel in args.relations:
+        category, method = lexicon.lookup(rel)
+        print(f"{rel!r} -> {category} ({method})")
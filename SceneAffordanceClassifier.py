@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+from LLMConcurrency import TokenBucket, gather_bounded
+from LLMResponseCache import LLMCacheMiss
+
+# Per-scene affordance classification for Story_2_TerrianAnalysis.py. All
+# requests are issued concurrently (chain.arun), bounded by a semaphore and a
+# token-bucket rate limit, retried with backoff, and returned in the original
+# scene order.
+#
+# classify_scenes sends one prompt per scene. classify_scenes_dedup instead
+# classifies every distinct object of the story once, in batches of at most
+# MAX_OBJECTS_PER_PROMPT, and fans the answers back out to the scenes.
+#
+# Both accept kb=AffordanceKnowledgeBase(...): objects already in the store
+# with enough confidence are answered from it, only the rest are sent to the
+# LLM, and the new answers are added to the store with `provenance`.
+
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 120
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+MAX_OBJECTS_PER_PROMPT = 40
+MAX_PROMPT_CHARS = 2000        # object_list characters per batch prompt
+
+
+def scene_objects(tf):
+    """Sorted object names from a time frame's "A [relation] B" scene relations."""
+    objects = set()
+    for rel in tf["scene_relations"]:
+        if "[" in rel and "]" in rel:
+            pre, post = rel.split("[", 1)
+            o1 = pre.strip()
+            o2 = post.split("]", 1)[-1].strip()
+            objects.update([o1, o2])
+    return sorted(objects)
+
+
+def scene_variables(title, objects):
+    return {"scene_title": title, "object_list": "\n".join(objects)}
+
+
+def normalize_object(name):
+    return " ".join(name.split()).casefold()
+
+
+def object_batches(objects, max_objects=MAX_OBJECTS_PER_PROMPT, max_chars=MAX_PROMPT_CHARS):
+    batch, chars = [], 0
+    for obj in objects:
+        if batch and (len(batch) >= max_objects or chars + len(obj) + 1 > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(obj)
+        chars += len(obj) + 1
+    if batch:
+        yield batch
+
+
+async def _run_jobs(jobs, max_concurrent, requests_per_minute, retries, base_delay, stats):
+    limiter = TokenBucket.per_minute(requests_per_minute, burst=max_concurrent) if requests_per_minute else None
+    t0 = time.perf_counter()
+    responses = await gather_bounded(jobs, max_concurrent, limiter, retries, base_delay,
+                                     no_retry=(LLMCacheMiss,), stats=stats)
+    stats["seconds"] = time.perf_counter() - t0
+    stats["requests"] = len(jobs)
+    stats["rate_limit_wait_s"] = limiter.waited_s if limiter is not None else 0.0
+    return responses
+
+
+def _parse(response, label):
+    if isinstance(response, LLMCacheMiss):
+        raise response
+    try:
+        if isinstance(response, BaseException):
+            raise response
+        return json.loads(response)
+    except Exception as e:
+        print(f"⚠️ Error parsing {label}:", e)
+        return []
+
+
+async def classify_scenes_async(chain, frames, max_concurrent=MAX_CONCURRENT_REQUESTS,
+                                requests_per_minute=REQUESTS_PER_MINUTE, retries=MAX_RETRIES,
+                                base_delay=RETRY_BASE_DELAY, stats=None, kb=None, provenance=None):
+    stats = stats if stats is not None else {}
+    scenes = [(tf["title"], scene_objects(tf)) for tf in frames]
+    known = [kb.lookup(objs) if kb is not None else ({}, objs) for _, objs in scenes]
+    asked = [i for i, (_, unknown) in enumerate(known) if unknown or kb is None]
+    for (title, objs), (from_kb, _) in zip(scenes, known):
+        print(f"🔍 Processing: {title} ({len(objs)} objects" + (f", {len(from_kb)} from KB)" if kb else ")"))
+
+    jobs = [lambda v=scene_variables(scenes[i][0], known[i][1]): chain.arun(v) for i in asked]
+    responses = await _run_jobs(jobs, max_concurrent, requests_per_minute, retries, base_delay, stats)
+    answers = {i: _parse(response, f"scene '{scenes[i][0]}'") for i, response in zip(asked, responses)}
+    if kb is not None:
+        kb.add([rec for parsed in answers.values() for rec in parsed], provenance)
+
+    results = []
+    for i, (title, objs) in enumerate(scenes):
+        parsed = answers.get(i, [])
+        if kb is not None:
+            parsed = parsed + [known[i][0][o] for o in objs if o in known[i][0]]
+        results.append((title, parsed))
+    return results
+
+
+async def classify_scenes_dedup_async(chain, frames, max_objects=MAX_OBJECTS_PER_PROMPT,
+                                      max_concurrent=MAX_CONCURRENT_REQUESTS,
+                                      requests_per_minute=REQUESTS_PER_MINUTE, retries=MAX_RETRIES,
+                                      base_delay=RETRY_BASE_DELAY, stats=None, kb=None, provenance=None):
+    stats = stats if stats is not None else {}
+    scenes = [(tf["title"], scene_objects(tf)) for tf in frames]
+
+    # distinct objects across the story, first spelling wins
+    unique = {}
+    for _, objs in scenes:
+        for obj in objs:
+            unique.setdefault(normalize_object(obj), obj)
+    from_kb, to_ask = kb.lookup(list(unique.values())) if kb is not None else ({}, list(unique.values()))
+    batches = list(object_batches(to_ask, max_objects))
+    mentions = sum(len(objs) for _, objs in scenes)
+    print(f"🔍 Classifying {len(to_ask)} of {len(unique)} distinct objects ({mentions} scene mentions, "
+          f"{len(from_kb)} from KB) in {len(batches)} prompts")
+
+    jobs = [
+        lambda v=scene_variables(f"All scenes of the story (batch {i + 1}/{len(batches)})", batch): chain.arun(v)
+        for i, batch in enumerate(batches)
+    ]
+    responses = await _run_jobs(jobs, max_concurrent, requests_per_minute, retries, base_delay, stats)
+
+    by_object = {normalize_object(name): rec for name, rec in from_kb.items()}
+    answered = []
+    for i, response in enumerate(responses):
+        for rec in _parse(response, f"object batch {i + 1}"):
+            if isinstance(rec, dict) and rec.get("object"):
+                by_object.setdefault(normalize_object(rec["object"]), rec)
+                answered.append(rec)
+    if kb is not None:
+        kb.add(answered, provenance)
+    missing = [name for key, name in unique.items() if key not in by_object]
+    if missing:
+        print(f"⚠️ No classification returned for {len(missing)} objects: {missing[:10]}")
+
+    stats.update({"unique_objects": len(unique), "scene_mentions": mentions,
+                  "reuse_factor": (mentions / len(unique)) if unique else 0.0})
+    results = []
+    for title, objs in scenes:
+        parsed = [dict(by_object[normalize_object(o)], object=o) for o in objs if normalize_object(o) in by_object]
+        results.append((title, parsed))
+    return results
+
+
+def classify_scenes(chain, frames, **kwargs):
+    """Blocking wrapper: [(scene_title, parsed objects), ...] in frame order."""
+    return asyncio.run(classify_scenes_async(chain, frames, **kwargs))
+
+
+def classify_scenes_dedup(chain, frames, **kwargs):
+    """Like classify_scenes, but each distinct object is sent to the LLM once."""
+    return asyncio.run(classify_scenes_dedup_async(chain, frames, **kwargs))
@@ -1,12 +1,14 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.ndimage import label
 from collections import defaultdict
 import json
 from pathlib import Path
 import random
+from PipelineRuntime import no_plot_requested, get_pyplot
+import TerrainCA
+from TerrainBatch import story_map_specs, generate_maps
 
 SAVE_OUT_FOLDER = "StoryFiles/"
+NO_PLOT = no_plot_requested()  # --no-plot: skip matplotlib entirely, only write the JSON logs
 FILE_NUMBER = 0 #"StoryFiles/"+FILE_NUMBER+"
 
 # ---------------- Config ----------------
@@ -14,9 +16,11 @@ MAP_WIDTH, MAP_HEIGHT = 30, 20
 TILE_EMPTY, TILE_BASE, TILE_PATCH, TILE_OBJECT = 0, 1, 2, 3
 BASE_PROB, PATCH_PROB = 0.65, 0.5
 BASE_ITER, PATCH_ITER = 4, 3
+CA_RULE = TerrainCA.SCENE1_RULE  # "B5678/S45678": 3x3 count including the cell >= 5 (see TerrainCA.py)
 PATCH_MIN_SIZE = 20
 USE_FIXED_SEED = True
 BASE_SEED, PATCH_SEED = 42, 1234
+RNG_MODE = "generator"         # one np.random.Generator per map; "legacy" reproduces maps made with np.random.seed
 
 # ---------------- Toggle for Story ----------------
 AFFORDANCE_PATH = SAVE_OUT_FOLDER + str(FILE_NUMBER)+"_object_affordance_langchain.json"
@@ -27,27 +31,6 @@ MATRIX_LOG_PATH = SAVE_OUT_FOLDER + str(FILE_NUMBER)+"_tile_matrix_with_objects.
 PLACEMENT_JSON_PATH = SAVE_OUT_FOLDER + str(FILE_NUMBER)+"_object_placement_log.json"
 
 # ---------------- Utility Functions ----------------
-def initialize_map(prob, tile_val, seed):
-    np.random.seed(seed)
-    return np.where(np.random.rand(MAP_HEIGHT, MAP_WIDTH) < prob, tile_val, TILE_EMPTY)
-
-def smooth_map(grid, tile_val, iterations):
-    for _ in range(iterations):
-        new = grid.copy()
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                neighbors = grid[max(0,y-1):min(MAP_HEIGHT,y+2), max(0,x-1):min(MAP_WIDTH,x+2)]
-                count = np.count_nonzero(neighbors == tile_val)
-                new[y,x] = tile_val if count >= 5 else TILE_EMPTY
-        grid = new
-    return grid
-
-def connect_largest_region(grid, tile_val):
-    labeled, num = label(grid == tile_val)
-    if num == 0: return np.zeros_like(grid)
-    largest = np.argmax(np.bincount(labeled.flat)[1:]) + 1
-    return (labeled == largest).astype(int) * tile_val
-
 def to_matrix_list(grid):
     return [[int(cell) for cell in row] for row in grid]
 
@@ -71,28 +54,27 @@ for scene in affordance_data["per_scene_affordances"]:
             name = obj["object"].lower().replace(" ", "_")
             base_to_env_objs[base].add(name)
 
-# ---------------- Generate Base Maps ----------------
+# ---------------- Generate Base and Patch Maps (one stacked CA + labeling pass) ----------------
+map_specs = story_map_specs(decision_data, use_fixed_seed=USE_FIXED_SEED, base_prob=BASE_PROB,
+                            patch_prob=PATCH_PROB, base_iter=BASE_ITER, patch_iter=PATCH_ITER,
+                            base_seed=BASE_SEED, patch_seed=PATCH_SEED)
+generated = generate_maps(map_specs, MAP_HEIGHT, MAP_WIDTH, rule=CA_RULE, rng_mode=RNG_MODE)
+
 base_maps = {}
 matrix_log = {"base_maps": {}, "patch_maps": {}, "scene_maps": {}}
 
-for i, base in enumerate(sorted({s["chosen_base"] for s in decision_data})):
-    seed = BASE_SEED + i if USE_FIXED_SEED else np.random.randint(0, 9999)
-    mat = initialize_map(BASE_PROB, TILE_BASE, seed)
-    mat = smooth_map(mat, TILE_BASE, BASE_ITER)
-    mat = connect_largest_region(mat, TILE_BASE)
+for base in sorted({s["chosen_base"] for s in decision_data}):
+    mat = generated[("base", base)]
     base_maps[base] = mat
     matrix_log["base_maps"][base] = to_matrix_list(mat)
 
-# ---------------- Generate Patch Maps ----------------
+# ---------------- Assign Patch Maps (earlier patches keep overlapping cells) ----------------
 patch_names = sorted({p for s in decision_data for p in s["final_patch_for_base"] if p != "<no patch>"})
 patch_maps = {}
 used_mask = np.zeros((MAP_HEIGHT, MAP_WIDTH), dtype=bool)
 
-for i, patch in enumerate(patch_names):
-    seed = PATCH_SEED + i if USE_FIXED_SEED else np.random.randint(0, 9999)
-    raw = initialize_map(PATCH_PROB, TILE_PATCH, seed)
-    raw = smooth_map(raw, TILE_PATCH, PATCH_ITER)
-    patch_mat = connect_largest_region(raw, TILE_PATCH)
+for patch in patch_names:
+    patch_mat = generated[("patch", patch)]
     patch_mat = np.where(used_mask | (patch_mat == 0), TILE_EMPTY, patch_mat)
     if np.sum(patch_mat > 0) >= PATCH_MIN_SIZE:
         patch_maps[patch] = patch_mat
@@ -121,7 +103,9 @@ for base, obj_names in base_to_env_objs.items():
             print(f"⚠️ Failed to place object '{obj}' in base '{base}'.")
 
 # ---------------- Visualize and Record ----------------
-fig, axs = plt.subplots(len(decision_data), 2, figsize=(12, 4 * len(decision_data)))
+if not NO_PLOT:
+    plt = get_pyplot()
+    fig, axs = plt.subplots(len(decision_data), 2, figsize=(12, 4 * len(decision_data)))
 
 for idx, scene in enumerate(decision_data):
     title = scene["scene_title"]
@@ -153,6 +137,9 @@ for idx, scene in enumerate(decision_data):
         "combined": to_matrix_list(combined)
     }
 
+    if NO_PLOT:
+        continue
+
     # Visualization (Scene Summary + Combined Map with Object Labels)
     desc = f"Scene: {title}\nBase: {base_name}\nObjects:\n" + "\n".join(
         f"• {obj} @ {coord}" for obj, coord in object_placements[base_name].items()
@@ -173,8 +160,9 @@ for idx, scene in enumerate(decision_data):
         axs[idx, 1].text(x + 0.5, y, obj.replace("_", " "), fontsize=7, color='black', backgroundcolor='white')
 
 
-plt.tight_layout()
-plt.show()
+if not NO_PLOT:
+    plt.tight_layout()
+    plt.show()
 
 # ---------------- Save Outputs ----------------
 with open(MATRIX_LOG_PATH, "w", encoding="utf-8") as f:
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import re
+from RelationLexicon import SPATIAL_CATEGORIES, spatial_category
+
+# Story_1 v4 prompt and response handling, shared by
+# Story_1_NarrativePrompt_langchain_v4.py (one story) and
+# Story_1_generate_batch.py (many stories concurrently): parse the LLM text
+# into {"original_story", "time_frames", "relation_mapping"}, fill unmapped
+# relations from the RelationLexicon and, if needed, build / parse the
+# follow-up mapping prompt. stream_story() parses the completion while it is
+# still being generated and hands out each finished time frame right away.
+
+STORY_PROMPT = """
+You are a storyteller who creates thrilling adventure stories.
+
+Your task is to:
+1. Write an engaging adventure story in under 100 words.
+2. Extract three key time frames from the story.
+3. For each time frame, list 3 scene descriptions in the format: [Object] [Relation] [Object]
+4. Map each relation (e.g., 'contains', 'hovers above') to one of these spatial categories:
+   "above", "below", "at the right of", "at the left of", "on top of"
+
+Wrap the story between <STORY> and </STORY>.
+
+### Example:
+<STORY>
+In the heart of the Enchanted Forest, young Elara discovered an ancient map hidden within a hollow oak. It led her to the legendary Crystal Cavern, rumored to grant the finder a single wish. Braving treacherous paths and wild creatures, Elara reached the cavern's shimmering entrance. Inside, she faced the Guardian, a majestic dragon. With courage and wit, she solved the Guardian’s riddle, earning her the wish. Elara wished for peace in her war-torn village. As she exited the cavern, the skies cleared, and harmony was restored, proving that bravery and hope could transform the world.
+</STORY>
+
+Time Frame: Elara discovers the ancient map  
+Hollow oak [contains] ancient map  
+Elara [stands near] hollow oak  
+Sunlight [filters through] forest canopy  
+
+Time Frame: Elara faces the treacherous paths  
+Elara [crosses] rickety bridge  
+Beasts [hide beneath] twisted trees  
+Wind [howls through] mountain pass  
+
+Time Frame: Elara solves the Guardian’s riddle  
+Elara [faces] Guardian  
+Guardian [guards] glowing cavern  
+Elara [holds] ancient map  
+
+Relation Mapping:  
+contains - on top of  
+stands near - at the left of  
+filters through - above  
+crosses - on top of  
+hide beneath - below  
+howls through - above  
+faces - at the right of  
+guards - on top of  
+holds - at the right of
+"""
+
+FOLLOWUP_TEMPLATE = "{input}"
+
+
+def story_output_path(story_id, out_dir="StoryFiles"):
+    return os.path.join(out_dir, f"{story_id}_adventure_scene_output_FIXED.json")
+
+
+class StoryStreamParser:
+    """Incremental parser for the story response: feed() text chunks as they arrive.
+
+    feed() and close() return events as soon as they are known:
+      {"type": "story", "text": ...}                              the <STORY> block is complete
+      {"type": "time_frame", "index": i, "frame": {...}}          a time frame and all its relations
+      {"type": "relation_mapping", "relation": ..., "category": ...}
+      {"type": "done", "output": output_data}                     from close()
+    A frame is complete when the next "Time Frame:" or the mapping header
+    starts, so frame 1 is usable while frames 2-3 are still being generated.
+    """
+
+    def __init__(self):
+        self.output_data = {
+            "original_story": "",
+            "time_frames": [],
+            "relation_mapping": {}
+        }
+        self._text = []
+        self._tail = ""  # last characters seen, so a "</STORY>" split across chunks is still noticed
+        self._story_found = False
+        self._pending = ""
+        self.current_frame = None
+        self.current_relations = []
+
+    def feed(self, chunk):
+        events = []
+        self._text.append(chunk)
+        tail, self._tail = self._tail + chunk, (self._tail + chunk)[-7:]
+        if not self._story_found and "</STORY>" in tail:
+            # story_match = re.search(r'^(.*?)Time Frame:', response, re.DOTALL)
+            story_match = re.search(r'<STORY>(.*?)</STORY>', "".join(self._text), re.DOTALL)
+            if story_match:
+                self._story_found = True
+                self.output_data["original_story"] = story_match.group(1).strip()
+                events.append({"type": "story", "text": self.output_data["original_story"]})
+
+        lines = (self._pending + chunk).splitlines(keepends=True)
+        self._pending = ""
+        if lines and lines[-1].splitlines()[0] == lines[-1]:
+            self._pending = lines.pop()  # no line break yet
+        for line in lines:
+            events += self._line(line)
+        return events
+
+    def close(self):
+        events = self._line(self._pending) if self._pending else []
+        self._pending = ""
+        # Append any remaining frame
+        if self.current_frame and self.current_relations:
+            events += self._end_frame()
+        events.append({"type": "done", "output": self.output_data})
+        return events
+
+    def _end_frame(self):
+        frame = {
+            "title": self.current_frame,
+            "scene_relations": self.current_relations
+        }
+        self.output_data["time_frames"].append(frame)
+        self.current_frame = None
+        self.current_relations = []
+        return [{"type": "time_frame", "index": len(self.output_data["time_frames"]) - 1, "frame": frame}]
+
+    def _line(self, line):
+        line = line.strip()
+
+        if line.startswith("Time Frame:"):
+            events = self._end_frame() if self.current_frame else []
+            self.current_frame = line.replace("Time Frame:", "").strip()
+            return events
+        elif "Mapping" in line and "-" not in line:
+            if self.current_frame:
+                return self._end_frame()
+        elif self.current_frame and line and "-" not in line:
+            self.current_relations.append(line)
+        elif "-" in line:
+            # Only keep lines that look like: relation - spatial_category
+            parts = line.split("-", 1)
+            if len(parts) == 2:
+                key = parts[0].strip()
+                value = parts[1].strip().lower()
+                # Keep only allowed spatial relations
+                if value in SPATIAL_CATEGORIES and len(key.split()) <= 3:  # Avoid full sentence as key
+                    self.output_data["relation_mapping"][key] = value
+                    return [{"type": "relation_mapping", "relation": key, "category": value}]
+        return []
+
+
+def parse_story_response(response):
+    """LLM story text -> {"original_story", "time_frames", "relation_mapping"}."""
+    parser = StoryStreamParser()
+    parser.feed(response)
+    parser.close()
+    return parser.output_data
+
+
+async def stream_story(chain, variables, on_event=None):
+    """Stream the story completion through StoryStreamParser; returns (response text, output_data).
+
+    on_event(event) is called for every parser event as soon as it is
+    emitted; it may be a coroutine function (awaited in stream order).
+    """
+    parser = StoryStreamParser()
+    chunks = []
+
+    async def emit(events):
+        for event in events:
+            if on_event is not None:
+                result = on_event(event)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    async for chunk in chain.astream(variables):
+        chunks.append(chunk)
+        await emit(parser.feed(chunk))
+    await emit(parser.close())
+    return "".join(chunks), parser.output_data
+
+
+def used_relations(output_data):
+    relations = set()
+    for frame in output_data["time_frames"]:
+        for pred in frame["scene_relations"]:
+            match = re.search(r'\[(.*?)\]', pred)
+            if match:
+                relations.add(match.group(1).strip())
+    return relations
+
+
+def fill_relations(output_data, lexicon, story_id):
+    """Learn the story's own mappings, then fill the gaps from the lexicon; returns relations still unmapped."""
+    lexicon.merge(output_data["relation_mapping"], source=f"story_{story_id}")
+    return lexicon.fill(used_relations(output_data), output_data["relation_mapping"])
+
+
+def followup_prompt_text(missing_relations):
+    return f"""
+    Map the following relations to one of the spatial categories:
+    "above", "below", "on top of", "at the left of", "at the right of"
+
+    Only include valid mappings in the format:
+    relation - category
+
+    Relations:
+    {chr(10).join(sorted(missing_relations))}
+    """
+
+
+def apply_followup(output_data, lexicon, followup_response, missing_relations, story_id):
+    """Merge the follow-up answers into the lexicon and the story; returns relations still unmapped."""
+    followup_mapping = {}
+    for line in followup_response.splitlines():
+        parts = line.strip().split("-", 1)
+        if len(parts) == 2 and spatial_category(parts[1]):
+            key = parts[0].strip().lstrip("0123456789.)*• ").strip()
+            followup_mapping[key] = spatial_category(parts[1])
+    output_data["relation_mapping"].update(followup_mapping)
+    lexicon.merge(followup_mapping, source=f"story_{story_id}_followup")
+    return lexicon.fill(missing_relations, output_data["relation_mapping"])
+
+
+def write_story_output(path, output_data):
+    """Atomic write: a crash never leaves a half-written story file behind."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(output_data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
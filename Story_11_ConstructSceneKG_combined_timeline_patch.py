@@ -1,9 +1,9 @@
 import json
 import os
 import networkx as nx
-import matplotlib.pyplot as plt
 from collections import defaultdict
 from difflib import SequenceMatcher
+from PipelineRuntime import no_plot_requested, get_pyplot
 
 # === Configuration ===
 STORY_ID = "0"  # Change this to your story ID
@@ -13,6 +13,8 @@ RELATIONS_FILE = f"{BASE_FOLDER}{STORY_ID}_scene_from_relations.json"
 TIMELINE_FILE = f"{BASE_FOLDER}{STORY_ID}_adventure_scene_output_FIXED.json"
 OUTPUT_DIR = f"{BASE_FOLDER}output_KG_story_{STORY_ID}_test"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+NO_PLOT = no_plot_requested()  # --no-plot: write _kg_data.json without drawing the KG images
+plt = None if NO_PLOT else get_pyplot(headless=True)
 
 # === Helpers ===
 def normalize(name):
@@ -82,14 +84,15 @@ for obj_scene, rel_scene in zip(object_data, relation_data):
     }
 
     # Draw and save
-    plt.figure(figsize=(10, 6))
-    pos = nx.shell_layout(G)
-    nx.draw(G, pos, with_labels=True, node_color="skyblue", node_size=1500, font_size=15)
-    nx.draw_networkx_edge_labels(G, pos, edge_labels={(u, v): d['label'] for u, v, d in G.edges(data=True)}, font_color="red", font_size=15)
-    plt.title(f"Scene KG: {title}")
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, f"{normalize(title)}_kg.png"))
-    plt.close()
+    if not NO_PLOT:
+        plt.figure(figsize=(10, 6))
+        pos = nx.shell_layout(G)
+        nx.draw(G, pos, with_labels=True, node_color="skyblue", node_size=1500, font_size=15)
+        nx.draw_networkx_edge_labels(G, pos, edge_labels={(u, v): d['label'] for u, v, d in G.edges(data=True)}, font_color="red", font_size=15)
+        plt.title(f"Scene KG: {title}")
+        plt.tight_layout()
+        plt.savefig(os.path.join(OUTPUT_DIR, f"{normalize(title)}_kg.png"))
+        plt.close()
 
     global_nodes.update(nodes)
     merged_graph.add_nodes_from(nodes)
@@ -105,14 +108,15 @@ for node in merged_graph.nodes():
     merged_graph.nodes[node]["subset"] = 0 if node in scene_order else 1
 
 # === Draw and Save Merged Graph ===
-plt.figure(figsize=(12, 8))
-pos = nx.multipartite_layout(merged_graph, subset_key="subset")
-nx.draw(merged_graph, pos, with_labels=True, node_color="lightgreen", node_size=1800, font_size=15)
-nx.draw_networkx_edge_labels(merged_graph, pos, edge_labels={(u, v): d['label'] for u, v, d in merged_graph.edges(data=True)}, font_color="brown")
-plt.title("Merged Story-Level KG")
-plt.tight_layout()
-plt.savefig(os.path.join(OUTPUT_DIR, f"{STORY_ID}_merged_kg.png"))
-plt.close()
+if not NO_PLOT:
+    plt.figure(figsize=(12, 8))
+    pos = nx.multipartite_layout(merged_graph, subset_key="subset")
+    nx.draw(merged_graph, pos, with_labels=True, node_color="lightgreen", node_size=1800, font_size=15)
+    nx.draw_networkx_edge_labels(merged_graph, pos, edge_labels={(u, v): d['label'] for u, v, d in merged_graph.edges(data=True)}, font_color="brown")
+    plt.title("Merged Story-Level KG")
+    plt.tight_layout()
+    plt.savefig(os.path.join(OUTPUT_DIR, f"{STORY_ID}_merged_kg.png"))
+    plt.close()
 
 # === Save Structured KG Data ===
 scene_kg_output = {
@@ -8,6 +8,7 @@ from langchain_openai import ChatOpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from sk import my_sk  # your OpenAI API key
+from LLMResponseCache import CachedChain  # LLM_CACHE_MODE=replay for offline re-runs
 
 STORY_ID = 10
 
@@ -39,10 +40,11 @@ Show the mapping in the form: relation - mapped result
 """
 
 prompt = PromptTemplate(template=prompt_template_text)
-chain = LLMChain(llm=llm, prompt=prompt)
+chain = CachedChain(LLMChain(llm=llm, prompt=prompt))
 
 # --- Run LLM Chain ---
-response = chain.run({})
+# story_id only keys the response cache (the template has no variables), so each story gets its own entry
+response = chain.run({"story_id": STORY_ID})
 
 # --- Extract story and lines ---
 story_match = re.search(r'^(.*?)Time Frame:', response, re.DOTALL)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import os
+import time
+from LLMConcurrency import TokenBucket, call_with_retry
+from LLMResponseCache import CachedChain, LLMCacheMiss
+from RelationLexicon import RelationLexicon
+from StoryGeneration import (STORY_PROMPT, FOLLOWUP_TEMPLATE, parse_story_response, stream_story, fill_relations,
+                             followup_prompt_text, apply_followup, story_output_path, write_story_output)
+
+# Generates stories N..M with the Story_1 v4 prompt concurrently, instead of
+# editing STORY_ID and re-running the script once per story. All requests
+# (story + optional relation follow-up) share one requests-per-minute and one
+# tokens-per-minute budget; each <id>_adventure_scene_output_FIXED.json is
+# written atomically as soon as its story is done, and stories whose file
+# already exists are skipped, so an interrupted batch is simply re-run.
+#
+#   python Story_1_generate_batch.py 13 40 --rpm 60 --tpm 40000
+#   python Story_1_generate_batch.py 100 139 --stub       # against FakeChatEndpoint.py, no API key needed
+#   python Story_1_generate_batch.py 100 139 --stub --stream   # report time to first time frame
+
+# === CONFIGURABLE ===
+OUT_DIR = "StoryFiles"
+RELATION_LEXICON = "Data/relation_lexicon.json"
+MODEL_NAME = "gpt-4"
+TEMPERATURE = 0.7
+MAX_CONCURRENT_STORIES = 4
+REQUESTS_PER_MINUTE = 60
+TOKENS_PER_MINUTE = 40000
+EST_COMPLETION_TOKENS = 500    # charged per request up front, corrected once the response is in
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL")  # any OpenAI-compatible endpoint
+
+
+class StreamInterrupted(RuntimeError):
+    """A streamed completion failed after events were handed out; not retried (they would repeat)."""
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text
+    return max(1, len(text) // 4)
+
+
+class BudgetedLLM:
+    """Runs chain.arun() under shared request and token buckets, retrying with backoff."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrent, retries, base_delay):
+        self.requests = (TokenBucket.per_minute(requests_per_minute, burst=max_concurrent)
+                         if requests_per_minute else None)
+        # the whole per-minute token allowance may be spent at once, as with the OpenAI limits
+        self.tokens = TokenBucket.per_minute(tokens_per_minute, burst=tokens_per_minute) if tokens_per_minute else None
+        self.retries = retries
+        self.base_delay = base_delay
+        self.stats = {"requests": 0, "retries": 0, "tokens": 0}
+
+    async def run(self, chain, variables, prompt_text):
+        budget = estimate_tokens(prompt_text) + EST_COMPLETION_TOKENS
+
+        async def attempt():
+            if self.requests is not None:
+                await self.requests.acquire()
+            if self.tokens is not None:
+                await self.tokens.acquire(budget)
+            self.stats["requests"] += 1
+            return await chain.arun(variables)
+
+        response = await call_with_retry(attempt, self.retries, self.base_delay, no_retry=(LLMCacheMiss,),
+                                         stats=self.stats)
+        used = estimate_tokens(prompt_text) + estimate_tokens(response)
+        self.stats["tokens"] += used
+        if self.tokens is not None:
+            self.tokens.adjust(budget - used)
+        return response
+
+    async def stream(self, chain, variables, prompt_text, on_event=None):
+        """stream_story() under the same budgets; returns (response, output_data)."""
+        budget = estimate_tokens(prompt_text) + EST_COMPLETION_TOKENS
+        started = False
+
+        def forward(event):
+            nonlocal started
+            started = True
+            return on_event(event) if on_event is not None else None
+
+        async def attempt():
+            if self.requests is not None:
+                await self.requests.acquire()
+            if self.tokens is not None:
+                await self.tokens.acquire(budget)
+            self.stats["requests"] += 1
+            try:
+                return await stream_story(chain, variables, forward)
+            except Exception as e:
+                if started:
+                    raise StreamInterrupted(f"stream failed after the first events: {e!r}") from e
+                raise
+
+        response, output_data = await call_with_retry(attempt, self.retries, self.base_delay,
+                                                      no_retry=(LLMCacheMiss, StreamInterrupted), stats=self.stats)
+        used = estimate_tokens(prompt_text) + estimate_tokens(response)
+        self.stats["tokens"] += used
+        if self.tokens is not None:
+            self.tokens.adjust(budget - used)
+        return response, output_data
+
+    def waited_s(self):
+        return sum(b.waited_s for b in (self.requests, self.tokens) if b is not None)
+
+
+def build_chains(base_url=None, stub=False):
+    """(story chain, follow-up chain); stub=True talks to FakeChatEndpoint without LangChain or the cache."""
+    if stub:
+        from FakeChatEndpoint import EndpointChain
+        return (EndpointChain(base_url, STORY_PROMPT, MODEL_NAME, TEMPERATURE),
+                EndpointChain(base_url, FOLLOWUP_TEMPLATE, MODEL_NAME, TEMPERATURE))
+
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+    from sk import my_sk  # your OpenAI API key
+
+    llm_kwargs = {"openai_api_base": base_url} if base_url else {}
+    llm = ChatOpenAI(model_name=MODEL_NAME, openai_api_key=my_sk, temperature=TEMPERATURE, **llm_kwargs)
+    story_chain = LLMChain(llm=llm, prompt=PromptTemplate(template=STORY_PROMPT, input_variables=[]))
+    followup_chain = LLMChain(llm=llm, prompt=PromptTemplate(input_variables=["input"], template=FOLLOWUP_TEMPLATE))
+    return CachedChain(story_chain), CachedChain(followup_chain)
+
+
+async def generate_story(story_id, story_chain, followup_chain, llm, lexicon, out_dir, stream=False):
+    """One story end to end; returns the number of relations the follow-up call had to map."""
+    # story_id only keys the response cache (the template has no variables)
+    if stream:
+        t0 = time.perf_counter()
+
+        def on_event(event):
+            # downstream work on a finished frame could start here, while later frames are generated
+            if event["type"] == "time_frame" and event["index"] == 0:
+                llm.stats.setdefault("first_frame_s", []).append(time.perf_counter() - t0)
+            elif event["type"] == "done":
+                llm.stats.setdefault("completion_s", []).append(time.perf_counter() - t0)
+
+        _, output_data = await llm.stream(story_chain, {"story_id": story_id}, STORY_PROMPT, on_event)
+    else:
+        response = await llm.run(story_chain, {"story_id": story_id}, STORY_PROMPT)
+        output_data = parse_story_response(response)
+    if not output_data["time_frames"]:
+        raise ValueError(f"no time frames in the response for story {story_id}")
+
+    missing_relations = fill_relations(output_data, lexicon, story_id)
+    if missing_relations:
+        text = followup_prompt_text(missing_relations)
+        followup_response = await llm.run(followup_chain, {"input": text}, text)
+        still_missing = apply_followup(output_data, lexicon, followup_response, missing_relations, story_id)
+        if still_missing:
+            print(f"⚠️ Story {story_id}: still unmapped after follow-up: {set(still_missing)}")
+
+    write_story_output(story_output_path(story_id, out_dir), output_data)
+    lexicon.save()
+    return len(missing_relations)
+
+
+async def generate_batch(story_ids, story_chain, followup_chain, llm, lexicon, out_dir, max_concurrent,
+                         stream=False):
+    sem = asyncio.Semaphore(max_concurrent)
+    done, failed, followups = [], [], 0
+
+    async def one(story_id):
+        nonlocal followups
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                n_missing = await generate_story(story_id, story_chain, followup_chain, llm, lexicon, out_dir,
+                                                 stream)
+            except Exception as e:
+                failed.append(story_id)
+                print(f"⚠️ Story {story_id} failed: {e!r}")
+                return
+            done.append(story_id)
+            followups += bool(n_missing)
+            print(f"[✓] Story {story_id} saved in {time.perf_counter() - t0:.1f}s"
+                  + (f" ({n_missing} relations via follow-up)" if n_missing else ""))
+
+    await asyncio.gather(*(one(sid) for sid in story_ids))
+    return done, failed, followups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Story_1 stories N..M concurrently.")
+    parser.add_argument("first", type=int)
+    parser.add_argument("last", type=int)
+    parser.add_argument("--out-dir", default=OUT_DIR)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_STORIES)
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE, help="requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE, help="tokens per minute (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--force", action="store_true", help="regenerate stories whose output already exists")
+    parser.add_argument("--base-url", default=LLM_BASE_URL)
+    parser.add_argument("--stub", action="store_true", help="start FakeChatEndpoint.py in-process and use it")
+    parser.add_argument("--stub-latency", type=float, default=1.0)
+    parser.add_argument("--lexicon", default=RELATION_LEXICON)
+    parser.add_argument("--stream", action="store_true", help="stream and parse the story completion incrementally")
+    args = parser.parse_args()
+
+    story_ids = list(range(args.first, args.last + 1))
+    todo = [sid for sid in story_ids if args.force or not os.path.exists(story_output_path(sid, args.out_dir))]
+    if len(todo) < len(story_ids):
+        print(f"[info] Skipping {len(story_ids) - len(todo)} stories that already exist (--force to regenerate)")
+    if not todo:
+        raise SystemExit(0)
+
+    server = None
+    base_url = args.base_url
+    if args.stub:
+        from FakeChatEndpoint import start_server
+        server = start_server(port=0, latency_s=args.stub_latency)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        print(f"[info] Stub endpoint on {base_url}")
+
+    story_chain, followup_chain = build_chains(base_url, stub=args.stub)
+    llm = BudgetedLLM(args.rpm, args.tpm, args.concurrency, args.retries, RETRY_BASE_DELAY)
+    lexicon = RelationLexicon(args.lexicon)
+    budget = ", ".join(f"≤{v:g} {unit}/min" for v, unit in ((args.rpm, "requests"), (args.tpm, "tokens")) if v)
+    print(f"[info] Generating {len(todo)} stories, {args.concurrency} at a time ({budget or 'no rate limit'})")
+
+    t0 = time.perf_counter()
+    done, failed, followups = asyncio.run(
+        generate_batch(todo, story_chain, followup_chain, llm, lexicon, args.out_dir, args.concurrency, args.stream))
+    secs = time.perf_counter() - t0
+
+    minutes = secs / 60.0
+    print(f"[info] {len(done)}/{len(todo)} stories in {secs:.1f}s ({len(done) / minutes:.1f} stories/min), "
+          f"{followups} needed a follow-up call")
+    print(f"[info] {llm.stats['requests']} requests ({llm.stats['requests'] / minutes:.1f}/min), "
+          f"~{llm.stats['tokens']} tokens ({llm.stats['tokens'] / minutes:.0f}/min), "
+          f"{llm.stats['retries']} retries, {llm.waited_s():.1f}s waiting on the rate limit")
+    if llm.stats.get("first_frame_s"):
+        first, full = llm.stats["first_frame_s"], llm.stats["completion_s"]
+        print(f"[info] Streaming: first time frame after {sum(first) / len(first):.2f}s on average, "
+              f"full completion after {sum(full) / len(full):.2f}s")
+    if server is not None:
+        print(f"[info] Stub endpoint saw: {server.stats()}")
+        server.shutdown()
+    if failed:
+        print(f"⚠️ Failed stories (re-run to retry): {sorted(failed)}")
@@ -1,8 +1,12 @@
 import json
+import os
 import time
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
+from LLMResponseCache import CachedChain  # LLM_CACHE_MODE=replay for offline re-runs
+from SceneAffordanceClassifier import classify_scenes, classify_scenes_dedup
+from AffordanceKnowledgeBase import AffordanceKnowledgeBase
 
 
 STORY_ID = 0
@@ -12,11 +16,24 @@ INPUT_FILE = "StoryFiles/"+str(STORY_ID)+"_adventure_scene_output_FIXED.json"
 OUTPUT_FILE = "StoryFiles/"+str(STORY_ID)+"_object_affordance_langchain.json"
 # OPENAI_API_KEY = "your_openai_api_key_here"  # Replace with your API key
 
+# concurrent scene requests (see SceneAffordanceClassifier.py)
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 120
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+DEDUP_OBJECTS = True           # classify each distinct object of the story once, in batch prompts
+MAX_OBJECTS_PER_PROMPT = 40
+USE_AFFORDANCE_KB = True       # answer known objects from the cross-story store (AffordanceKnowledgeBase.py)
+AFFORDANCE_KB_PATH = "Data/affordance_kb.sqlite"
+KB_MIN_CONFIDENCE = 0.7        # stored answers below this are sent to the LLM again
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL")  # e.g. http://127.0.0.1:8799/v1 for FakeChatEndpoint.py
+
 # llm = ChatOpenAI(model_name="gpt-4", openai_api_key=OPENAI_API_KEY, temperature=0.2)
 from sk import my_sk  # your OpenAI API key
 
 # --- LLM Setup ---
-llm = ChatOpenAI(model_name="gpt-4", openai_api_key=my_sk, temperature=0.2)
+llm_kwargs = {"openai_api_base": LLM_BASE_URL} if LLM_BASE_URL else {}
+llm = ChatOpenAI(model_name="gpt-4", openai_api_key=my_sk, temperature=0.2, **llm_kwargs)
 
 
 # --- Prompt Template ---
@@ -49,7 +66,7 @@ Objects:
 """
 
 prompt = PromptTemplate(input_variables=["scene_title", "object_list"], template=template)
-chain = LLMChain(llm=llm, prompt=prompt)
+chain = CachedChain(LLMChain(llm=llm, prompt=prompt))
 
 # --- Load input data ---
 with open(INPUT_FILE, "r", encoding="utf-8") as f:
@@ -59,31 +76,29 @@ with open(INPUT_FILE, "r", encoding="utf-8") as f:
 scene_affordances = []
 global_obj_map = {}
 
-for tf in data["time_frames"]:
-    title = tf["title"]
-    objects = set()
-
-    for rel in tf["scene_relations"]:
-        if "[" in rel and "]" in rel:
-            pre, post = rel.split("[", 1)
-            o1 = pre.strip()
-            o2 = post.split("]", 1)[-1].strip()
-            objects.update([o1, o2])
-
-    sorted_objs = sorted(objects)
-    print(f"🔍 Processing: {title} ({len(sorted_objs)} objects)")
-
-    # Run LangChain
-    try:
-        response = chain.run({
-            "scene_title": title,
-            "object_list": "\n".join(sorted_objs)
-        })
-        parsed = json.loads(response)
-    except Exception as e:
-        print(f"⚠️ Error parsing scene '{title}':", e)
-        parsed = []
-
+# Run LangChain concurrently; results come back in scene order
+llm_stats = {}
+kb = AffordanceKnowledgeBase(AFFORDANCE_KB_PATH, KB_MIN_CONFIDENCE) if USE_AFFORDANCE_KB else None
+run_kwargs = dict(max_concurrent=MAX_CONCURRENT_REQUESTS, requests_per_minute=REQUESTS_PER_MINUTE,
+                  retries=MAX_RETRIES, base_delay=RETRY_BASE_DELAY, stats=llm_stats, kb=kb,
+                  provenance={"story_id": STORY_ID, "model": llm.model_name, "input": INPUT_FILE,
+                              "time": time.strftime("%Y-%m-%d %H:%M:%S")})
+if DEDUP_OBJECTS:
+    scene_results = classify_scenes_dedup(chain, data["time_frames"], max_objects=MAX_OBJECTS_PER_PROMPT,
+                                          **run_kwargs)
+    print(f"[info] {llm_stats['unique_objects']} distinct objects for {llm_stats['scene_mentions']} "
+          f"scene mentions (reuse x{llm_stats['reuse_factor']:.2f})")
+else:
+    scene_results = classify_scenes(chain, data["time_frames"], **run_kwargs)
+print(f"[info] {llm_stats['requests']} LLM requests in {llm_stats['seconds']:.1f}s "
+      f"({llm_stats.get('retries', 0)} retries)")
+if kb is not None:
+    kb_stats = kb.summary()
+    print(f"[info] Affordance KB: {kb_stats['hits']}/{kb_stats['lookups']} objects known "
+          f"({kb_stats['low_confidence']} low-confidence re-asked), {kb_stats['written']} stored, "
+          f"{kb_stats['entries']} in store")
+
+for title, parsed in scene_results:
     # Save per-scene
     scene_affordances.append({
         "scene_title": title,
@@ -99,8 +114,13 @@ output_data = {
     "global_object_affordances": global_obj_map,
     "per_scene_affordances": scene_affordances
 }
+if kb is not None:
+    output_data["affordance_kb_stats"] = kb_stats
 
 with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
     json.dump(output_data, f, indent=2, ensure_ascii=False)
 
 print(f"✅ Saved affordance output to {OUTPUT_FILE}")
+if chain.cache is not None:
+    cs = chain.cache.stats()
+    print(f"[info] LLM cache: {cs['hits']} hits / {cs['misses']} misses, {cs['llm_calls']} LLM calls")
@@ -0,0 +1,157 @@
+import time
+import numpy as np
+from scipy.ndimage import label
+import TerrainCA
+
+# Batched terrain generation: all base and patch maps of one or many stories
+# are built as one (K, H, W) stack. Initialization draws each map from its own
+# np.random.Generator stream (seeded per map, so a map does not change when
+# other maps are added to or removed from the batch), the CA iterations run on
+# the whole stack at once (maps with fewer iterations are frozen once done),
+# and connected components are labeled in a single pass with a structure
+# that never links neighbouring maps of the stack. Large stacks are split into
+# blocks of about STACK_BLOCK_CELLS cells, which keeps the temporaries in
+# cache; many small maps still go through in one pass.
+#
+#   python TerrainBatch.py                      # every story with a *_scene_generation_decisions.json
+#   python TerrainBatch.py --stories 0 3 --size 512x512
+
+# === CONFIGURABLE ===
+# defaults mirror Scene_1_CA_Terrian_Visualizer_WEnv.py
+TILE_EMPTY, TILE_BASE, TILE_PATCH = 0, 1, 2
+BASE_PROB, PATCH_PROB = 0.65, 0.5
+BASE_ITER, PATCH_ITER = 4, 3
+BASE_SEED, PATCH_SEED = 42, 1234
+RNG_MODES = ("generator", "legacy")  # legacy = np.random.seed(seed) + rand, the maps Scene_1 produced before
+STACK_BLOCK_CELLS = 1 << 20    # maps are processed in sub-stacks of about this many cells to stay cache-resident
+
+# 4-connectivity inside each map, nothing along the stack axis
+STACK_STRUCTURE = np.zeros((3, 3, 3), dtype=bool)
+STACK_STRUCTURE[1] = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+
+def map_spec(key, tile_val, prob, iterations, seed):
+    return {"key": key, "tile_val": tile_val, "prob": prob, "iterations": iterations, "seed": seed}
+
+
+def story_map_specs(decision_data, story_key=None, use_fixed_seed=True, base_prob=BASE_PROB, patch_prob=PATCH_PROB,
+                    base_iter=BASE_ITER, patch_iter=PATCH_ITER, base_seed=BASE_SEED, patch_seed=PATCH_SEED):
+    """Specs for every base and patch map of one story, with the Scene_1 seeds (BASE_SEED + i / PATCH_SEED + i)."""
+    prefix = () if story_key is None else (story_key,)
+    specs = []
+    for i, base in enumerate(sorted({s["chosen_base"] for s in decision_data})):
+        seed = base_seed + i if use_fixed_seed else np.random.randint(0, 9999)
+        specs.append(map_spec(prefix + ("base", base), TILE_BASE, base_prob, base_iter, seed))
+    patch_names = sorted({p for s in decision_data for p in s["final_patch_for_base"] if p != "<no patch>"})
+    for i, patch in enumerate(patch_names):
+        seed = patch_seed + i if use_fixed_seed else np.random.randint(0, 9999)
+        specs.append(map_spec(prefix + ("patch", patch), TILE_PATCH, patch_prob, patch_iter, seed))
+    return specs
+
+
+def initialize_stack(specs, height, width, rng_mode="generator"):
+    """(K, H, W) bool stack, map k alive where its own stream draws < prob."""
+    if rng_mode not in RNG_MODES:
+        raise ValueError(f"Unknown rng_mode {rng_mode!r}; expected one of {RNG_MODES}")
+    alive = np.empty((len(specs), height, width), dtype=bool)
+    for k, spec in enumerate(specs):
+        if rng_mode == "legacy":
+            draws = np.random.RandomState(spec["seed"]).random_sample((height, width))
+        else:
+            draws = np.random.default_rng(spec["seed"]).random((height, width))
+        np.less(draws, spec["prob"], out=alive[k])
+    return alive
+
+
+def smooth_stack(alive, iterations, rule=TerrainCA.SCENE1_RULE):
+    """CA on the whole stack; iterations[k] generations for map k."""
+    rule = TerrainCA.CARule.parse(rule)
+    iterations = np.asarray(iterations)
+    for it in range(int(iterations.max(initial=0))):
+        active = iterations > it
+        if active.all():
+            alive = rule.step(alive)
+        else:
+            alive[active] = rule.step(alive[active])
+    return alive
+
+
+def largest_regions(alive):
+    """Keep only the largest 4-connected region of every map (ties: first in scan order, like np.argmax)."""
+    labeled, num = label(alive, structure=STACK_STRUCTURE)
+    if num == 0:
+        return np.zeros_like(alive)
+    sizes = np.bincount(labeled.ravel(), minlength=num + 1)
+    sizes[0] = 0
+    # labels are assigned in scan order, so each map owns a contiguous label range
+    last = np.maximum.accumulate(labeled.reshape(len(alive), -1).max(axis=1))
+    first = np.concatenate(([1], last[:-1] + 1))
+    keep = np.zeros(num + 1, dtype=bool)
+    for lo, hi in zip(first, last):
+        if hi >= lo:
+            keep[lo + np.argmax(sizes[lo:hi + 1])] = True
+    return keep[labeled]
+
+
+def generate_maps(specs, height, width, rule=TerrainCA.SCENE1_RULE, rng_mode="generator", connect=True):
+    """{spec key: (H, W) int map of tile_val / TILE_EMPTY}, generated as one stack."""
+    if not specs:
+        return {}
+    alive = initialize_stack(specs, height, width, rng_mode)
+    iterations = np.array([s["iterations"] for s in specs])
+    block = max(1, STACK_BLOCK_CELLS // (height * width))
+    for lo in range(0, len(specs), block):
+        part = smooth_stack(alive[lo:lo + block], iterations[lo:lo + block], rule)
+        alive[lo:lo + block] = largest_regions(part) if connect else part
+    tile_vals = np.array([s["tile_val"] for s in specs])[:, None, None]
+    maps = np.where(alive, tile_vals, TILE_EMPTY)
+    return {spec["key"]: maps[k] for k, spec in enumerate(specs)}
+
+
+def generate_maps_sequential(specs, height, width, rule=TerrainCA.SCENE1_RULE, rng_mode="generator"):
+    """One map at a time (initialize, smooth, keep largest region); reference for the batched path."""
+    out = {}
+    for spec in specs:
+        alive = initialize_stack([spec], height, width, rng_mode)[0]
+        alive = TerrainCA.smooth_mask(alive, spec["iterations"], rule)
+        labeled, num = label(alive)
+        if num == 0:
+            out[spec["key"]] = np.zeros((height, width), dtype=int)
+            continue
+        largest = np.argmax(np.bincount(labeled.flat)[1:]) + 1
+        out[spec["key"]] = (labeled == largest).astype(int) * spec["tile_val"]
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import json
+    import os
+    import re
+
+    parser = argparse.ArgumentParser(description="Generate the terrain maps of many stories as one stack.")
+    parser.add_argument("--stories", nargs="*", help="story ids (default: every *_scene_generation_decisions.json)")
+    parser.add_argument("--size", default="30x20", help="WIDTHxHEIGHT")
+    parser.add_argument("--rng", choices=RNG_MODES, default="generator")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.lower().split("x"))
+    paths = glob.glob("StoryFiles/*_scene_generation_decisions.json")
+    found = {re.match(r"(.+)_scene_generation_decisions\.json$", os.path.basename(p)).group(1): p for p in paths}
+    stories = args.stories or sorted(found)
+    specs = []
+    for sid in stories:
+        with open(found[sid], "r", encoding="utf-8") as f:
+            specs += story_map_specs(json.load(f), story_key=sid)
+    print(f"[info] {len(specs)} maps of {width}x{height} from {len(stories)} stories")
+
+    t0 = time.perf_counter()
+    batched = generate_maps(specs, height, width, rng_mode=args.rng)
+    batch_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    sequential = generate_maps_sequential(specs, height, width, rng_mode=args.rng)
+    seq_s = time.perf_counter() - t0
+
+    same = all(np.array_equal(batched[k], sequential[k]) for k in sequential)
+    print(f"[info] batched {batch_s:.3f}s, one map at a time {seq_s:.3f}s ({seq_s / batch_s:.1f}x), identical: {same}")
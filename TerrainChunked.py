@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import time
+import numpy as np
+from scipy.ndimage import label
+import TerrainCA
+from TerrainBatch import TILE_EMPTY, TILE_BASE, TILE_PATCH, BASE_PROB, PATCH_PROB, BASE_ITER, PATCH_ITER, \
+    BASE_SEED, PATCH_SEED, map_spec, story_map_specs
+
+# Chunked terrain generation for worlds too large to hold as one dense array
+# (10k x 10k and up). Every map lives in a uint8 .npy file on disk and is only
+# ever touched one band of chunks at a time through np.memmap, so RAM stays
+# bounded by the chunk size, not the map size.
+#
+#   init     rows are drawn in bands from the map's own PCG64 stream, advanced
+#            to the band's first cell, so the map is identical to the dense
+#            TerrainBatch "generator" map with the same seed
+#   smooth   each CHUNK x CHUNK tile is read with a halo of `iterations` cells
+#            (the CA's dependency cone), smoothed, and only its core written
+#            back, so results are seamless across chunk borders; windows are
+#            clipped at the map edge, which keeps outside cells empty
+#   connect  every chunk is labeled on its own, labels touching across chunk
+#            borders are merged with a union-find, and a second pass keeps
+#            the largest region (ties: first in scan order, as in TerrainBatch)
+#
+#   python TerrainChunked.py --size 10000x10000 --out Data/overworld_base.npy
+#   python TerrainChunked.py --size 2000x1500 --chunk 256 --verify    # compare with the dense pipeline
+#   python TerrainChunked.py --story 0 --size 10000x10000 --out-dir Data/terrain_0
+
+# === CONFIGURABLE ===
+CHUNK = 1024                   # core tile size of the smooth / label passes
+INIT_BAND_CELLS = 1 << 21      # random draws (float64) per initialization band
+
+
+def chunk_windows(height, width, chunk=CHUNK):
+    """(y0, y1, x0, x1) of every chunk, in row-major chunk order."""
+    for y0 in range(0, height, chunk):
+        for x0 in range(0, width, chunk):
+            yield y0, min(y0 + chunk, height), x0, min(x0 + chunk, width)
+
+
+def open_map(path, height, width):
+    """New (H, W) uint8 .npy on disk, opened as a writable memmap."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width))
+
+
+def initialize_chunked(path, height, width, prob, seed):
+    """Write the alive mask (draws < prob) of a TerrainBatch "generator" map to path, band by band."""
+    out = open_map(path, height, width)
+    del out
+    band = max(1, INIT_BAND_CELLS // width)
+    for y0 in range(0, height, band):
+        y1 = min(y0 + band, height)
+        bit_gen = np.random.PCG64(seed)
+        bit_gen.advance(y0 * width)    # one 64-bit draw per float64, so row y0 starts y0 * W draws in
+        draws = np.random.Generator(bit_gen).random((y1 - y0, width))
+        out = np.load(path, mmap_mode="r+")
+        np.less(draws, prob, out=out[y0:y1])
+        out.flush()
+        del out
+
+
+def smooth_chunked(src_path, dst_path, iterations, rule=TerrainCA.SCENE1_RULE, chunk=CHUNK):
+    """CA over a 0/1 .npy map into a new 0/1 .npy, one halo-padded chunk at a time."""
+    rule = TerrainCA.CARule.parse(rule)
+    src = np.load(src_path, mmap_mode="r")
+    height, width = src.shape
+    del src
+    dst = open_map(dst_path, height, width)
+    del dst
+    halo = iterations
+    for y0 in range(0, height, chunk):
+        y1 = min(y0 + chunk, height)
+        ya, yb = max(0, y0 - halo), min(height, y1 + halo)
+        # one band of chunks mapped at a time, so touched pages are released as we go
+        src = np.load(src_path, mmap_mode="r")
+        dst = np.load(dst_path, mmap_mode="r+")
+        for _, _, x0, x1 in chunk_windows(y1 - y0, width, chunk):
+            xa, xb = max(0, x0 - halo), min(width, x1 + halo)
+            alive = src[ya:yb, xa:xb].astype(bool)
+            for _ in range(iterations):
+                alive = rule.step(alive)
+            dst[y0:y1, x0:x1] = alive[y0 - ya:y1 - ya, x0 - xa:x1 - xa]
+        dst.flush()
+        del src, dst
+
+
+class UnionFind:
+    """Disjoint sets over integer ids; only ids that were ever merged are stored."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, a):
+        parent = self.parent
+        root = a
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while a != root:
+            parent[a], a = root, parent[a]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # keep the smaller id as root, so roots stay stable across runs
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+            self.parent.setdefault(ra, ra)
+
+
+def _first_cells(labeled):
+    """Flat index of the first cell of labels 1..n (labels are assigned in scan order)."""
+    flat = labeled.ravel()
+    nz = np.flatnonzero(flat)
+    vals = flat[nz]
+    seen = np.maximum.accumulate(np.concatenate(([0], vals[:-1])))
+    return nz[vals > seen]
+
+
+def _global(edge, offset):
+    """Chunk-local labels of one edge row/column as global ids (0 stays background)."""
+    return np.where(edge > 0, edge.astype(np.int64) + offset, 0)
+
+
+def _border_pairs(a, b):
+    """Unique (a, b) global label pairs of touching border cells, both alive."""
+    both = (a > 0) & (b > 0)
+    if not both.any():
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.stack([a[both], b[both]], axis=1), axis=0)
+
+
+def _label_chunk(band, x0, x1):
+    return label(band[:, x0:x1].astype(bool), output=np.int32)
+
+
+def largest_region_chunked(path, tile_val, chunk=CHUNK, connect=True):
+    """Turn a 0/1 .npy map into tile_val / TILE_EMPTY in place, keeping only the largest 4-connected region."""
+    mm = np.load(path, mmap_mode="r")
+    height, width = mm.shape
+    del mm
+    stats = {"regions": 0, "largest": 0}
+    if not connect:
+        for y0 in range(0, height, chunk):
+            mm = np.load(path, mmap_mode="r+")
+            band = mm[y0:y0 + chunk]
+            band *= np.uint8(tile_val)
+            mm.flush()
+            del mm, band
+        return stats
+
+    # pass 1: label chunks, collect sizes, first cells and cross-border label pairs
+    offsets, sizes, firsts = [], [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+    uf = UnionFind()
+    total = 0
+    bottom = np.zeros(width, dtype=np.int64)          # global labels of the previous band's last row
+    for y0 in range(0, height, chunk):
+        y1 = min(y0 + chunk, height)
+        mm = np.load(path, mmap_mode="r")
+        band = mm[y0:y1]
+        top = np.zeros(width, dtype=np.int64)
+        new_bottom = np.zeros(width, dtype=np.int64)
+        right = None
+        for _, _, x0, x1 in chunk_windows(y1 - y0, width, chunk):
+            labeled, num = _label_chunk(band, x0, x1)
+            offsets.append(total)
+            sizes.append(np.bincount(labeled.ravel(), minlength=num + 1)[1:])
+            r, c = np.divmod(_first_cells(labeled), x1 - x0)
+            firsts.append((y0 + r) * width + x0 + c)
+            if right is not None:
+                for a, b in _border_pairs(right, _global(labeled[:, 0], total)):
+                    uf.union(int(a), int(b))
+            right = _global(labeled[:, -1], total)
+            top[x0:x1], new_bottom[x0:x1] = _global(labeled[0], total), _global(labeled[-1], total)
+            total += num
+        for a, b in _border_pairs(bottom, top):
+            uf.union(int(a), int(b))
+        bottom = new_bottom
+        del mm, band
+
+    stats["regions_in_chunks"] = total
+    if total == 0:
+        largest_region_chunked(path, TILE_EMPTY, chunk, connect=False)
+        return stats
+
+    sizes, firsts = np.concatenate(sizes), np.concatenate(firsts)
+    roots = np.arange(total + 1)
+    for a in uf.parent:
+        roots[a] = uf.find(a)
+    region_size = np.bincount(roots, weights=sizes, minlength=total + 1).astype(np.int64)
+    region_first = np.full(total + 1, np.iinfo(np.int64).max)
+    np.minimum.at(region_first, roots[1:], firsts[1:])
+    candidates = np.flatnonzero(region_size == region_size.max())
+    best = candidates[np.argmin(region_first[candidates])]
+    keep = roots == best
+    keep[0] = False
+    stats["regions"] = int(np.count_nonzero(roots[1:] == np.arange(1, total + 1)))
+    stats["largest"] = int(region_size[best])
+
+    # pass 2: relabel every chunk (same labels as pass 1) and keep the winning region
+    value = np.uint8(tile_val)
+    chunk_index = 0
+    for y0 in range(0, height, chunk):
+        y1 = min(y0 + chunk, height)
+        mm = np.load(path, mmap_mode="r+")
+        band = mm[y0:y1]
+        for _, _, x0, x1 in chunk_windows(y1 - y0, width, chunk):
+            labeled, num = _label_chunk(band, x0, x1)
+            off = offsets[chunk_index]
+            keep_local = np.concatenate(([False], keep[off + 1:off + num + 1]))
+            band[:, x0:x1] = np.where(keep_local[labeled], value, np.uint8(TILE_EMPTY))
+            chunk_index += 1
+        mm.flush()
+        del mm, band
+    return stats
+
+
+def generate_chunked(spec, height, width, path, rule=TerrainCA.SCENE1_RULE, chunk=CHUNK, connect=True):
+    """One map spec (see TerrainBatch.map_spec) as an (H, W) uint8 .npy at path; returns timing and region stats."""
+    if chunk <= 0:
+        raise ValueError(f"chunk must be positive, got {chunk}")
+    init_path = path[:-4] + ".init.npy" if path.endswith(".npy") else path + ".init.npy"
+    stats = {"height": height, "width": width, "chunk": chunk}
+    t0 = time.perf_counter()
+    initialize_chunked(init_path, height, width, spec["prob"], spec["seed"])
+    stats["init_s"] = time.perf_counter() - t0
+    try:
+        t0 = time.perf_counter()
+        smooth_chunked(init_path, path, spec["iterations"], rule, chunk)
+        stats["smooth_s"] = time.perf_counter() - t0
+    finally:
+        os.remove(init_path)
+    t0 = time.perf_counter()
+    stats.update(largest_region_chunked(path, spec["tile_val"], chunk, connect))
+    stats["connect_s"] = time.perf_counter() - t0
+    return stats
+
+
+def write_meta(path, spec, rule, stats):
+    """Sidecar <map>.json next to the .npy: the spec it was generated from and the run stats."""
+    meta_path = (path[:-4] if path.endswith(".npy") else path) + ".json"
+    meta = {"spec": {k: (list(v) if isinstance(v, tuple) else v) for k, v in spec.items()},
+            "rule": str(rule), "stats": stats}
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, meta_path)
+
+
+def _peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # KB on Linux
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate very large terrain maps chunk by chunk into .npy files.")
+    parser.add_argument("--size", default="10000x10000", help="WIDTHxHEIGHT")
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    parser.add_argument("--rule", default=TerrainCA.SCENE1_RULE)
+    parser.add_argument("--out", default="Data/overworld_base.npy", help="output .npy (single map)")
+    parser.add_argument("--tile", choices=("base", "patch"), default="base")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--story", help="generate every base/patch map of this story into --out-dir")
+    parser.add_argument("--out-dir", help="output directory for --story (default Data/terrain_<story>)")
+    parser.add_argument("--no-connect", action="store_true", help="skip the largest-region pass")
+    parser.add_argument("--verify", action="store_true", help="compare with TerrainBatch.generate_maps (needs RAM)")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.lower().split("x"))
+    if args.story is not None:
+        with open(f"StoryFiles/{args.story}_scene_generation_decisions.json", "r", encoding="utf-8") as f:
+            specs = story_map_specs(json.load(f))
+        out_dir = args.out_dir or f"Data/terrain_{args.story}"
+        jobs = [(s, os.path.join(out_dir, re.sub(r"[^\w-]+", "_", f"{s['key'][0]}_{s['key'][1]}") + ".npy"))
+                for s in specs]
+    elif args.tile == "base":
+        jobs = [(map_spec(("base", "overworld"), TILE_BASE, BASE_PROB, BASE_ITER,
+                          BASE_SEED if args.seed is None else args.seed), args.out)]
+    else:
+        jobs = [(map_spec(("patch", "overworld"), TILE_PATCH, PATCH_PROB, PATCH_ITER,
+                          PATCH_SEED if args.seed is None else args.seed), args.out)]
+
+    print(f"[info] {len(jobs)} map(s) of {width}x{height} in {args.chunk}x{args.chunk} chunks")
+    for spec, path in jobs:
+        t0 = time.perf_counter()
+        stats = generate_chunked(spec, height, width, path, args.rule, args.chunk, not args.no_connect)
+        stats["total_s"] = time.perf_counter() - t0
+        stats["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+        write_meta(path, spec, args.rule, stats)
+        regions = ("" if args.no_connect else
+                   f", largest region {stats['largest']} cells of {stats['regions']} regions")
+        print(f"[✓] {path}: {stats['total_s']:.1f}s (init {stats['init_s']:.1f}s, smooth {stats['smooth_s']:.1f}s, "
+              f"connect {stats['connect_s']:.1f}s){regions}, peak RSS {stats['peak_rss_mb']:.0f} MB")
+
+        if args.verify:
+            from TerrainBatch import generate_maps
+            dense = generate_maps([spec], height, width, rule=args.rule, connect=not args.no_connect)[spec["key"]]
+            same = np.array_equal(np.load(path, mmap_mode="r"), dense)
+            print(f"[info] identical to the dense TerrainBatch map: {same}")
+            if not same:
+                print("⚠️ chunked and dense maps differ")